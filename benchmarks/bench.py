@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+# _*_ coding:UTF-8 _*_
+"""
+__author__ = 'shede333'
+
+基于本地模拟App Store Connect服务器（fake_asc.py）的延迟、吞吐基准测试，不需要真实的key，也不访问网络：
+    python benchmarks/bench.py
+    python benchmarks/bench.py --latency 0.02 --repeat 20 --output result.json
+    python benchmarks/bench.py --baseline benchmarks/results/bench-xxx.json --threshold 0.2
+结果保存为json，传入--baseline时与之前的结果比较中位数，超过阈值的场景视为性能回退，退出码为1
+"""
+
+import argparse
+import json
+import logging
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List
+
+ROOT_PATH = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_PATH))
+
+from cryptography.hazmat.primitives import serialization  # noqa: E402
+from cryptography.hazmat.primitives.asymmetric import ec  # noqa: E402
+
+from fake_asc import FakeASCData, FakeASCServer  # noqa: E402
+from okappleapi.apple_api_agent import APIAgent, RateLimiter, TokenManager  # noqa: E402
+from okappleapi.crawler import AppCrawler  # noqa: E402
+from okappleapi.metrics import MetricsCollector  # noqa: E402
+from okappleapi.models import *  # noqa: E402
+from okappleapi.ok_agent import OKProfileManager  # noqa: E402
+from okappleapi.transport import MemoryTransport, RequestsTransport  # noqa: E402
+
+RESULT_DIR = ROOT_PATH.joinpath('benchmarks', 'results')
+
+
+def _new_token_manager() -> TokenManager:
+    """使用临时生成的ES256 key，与真实的.p8文件格式相同"""
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    key_text = private_key.private_bytes(serialization.Encoding.PEM,
+                                         serialization.PrivateFormat.PKCS8,
+                                         serialization.NoEncryption()).decode()
+    return TokenManager('fake-issuer-id', 'FAKEKEY123', key_text)
+
+
+def _percentile(value_list: List[float], percent: float) -> float:
+    sorted_list = sorted(value_list)
+    index = min(len(sorted_list) - 1, int(round(percent / 100 * (len(sorted_list) - 1))))
+    return sorted_list[index]
+
+
+class Benchmark:
+    """基准测试的场景集合"""
+
+    def __init__(self, server: FakeASCServer, repeat: int, upload_size: int):
+        self.server = server
+        self.repeat = repeat
+        self.upload_size = upload_size
+        self.token_manager = _new_token_manager()
+        # 本地服务器不限流，避免客户端的限流器影响结果
+        self.agent = APIAgent(self.token_manager, timeout=30, base_api=server.base_api,
+                              rate_limiter=RateLimiter(rate_per_hour=10 ** 9))
+        # 预先录制设备列表的各页，MemoryTransport不访问网络，用于单独评估库本身的开销
+        self.memory_agent = APIAgent(self.token_manager, base_api=server.base_api,
+                                     rate_limiter=RateLimiter(rate_per_hour=10 ** 9),
+                                     transport=MemoryTransport(self._record_pages('/v1/devices?limit=200')))
+        # 同样的请求，挂载MetricsCollector，与memory_agent比较，评估指标收集的开销
+        self.metrics_agent = APIAgent(self.token_manager, base_api=server.base_api,
+                                      rate_limiter=RateLimiter(rate_per_hour=10 ** 9),
+                                      transport=self.memory_agent.transport)
+        MetricsCollector().attach(self.metrics_agent)
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self.upload_path = Path(self._temp_dir.name).joinpath('screenshot.png')
+        self.upload_path.write_bytes(bytes(range(256)) * (upload_size // 256))
+
+    def close(self):
+        self.agent.close()
+        self._temp_dir.cleanup()
+
+    def _record_pages(self, path: str) -> List[Dict]:
+        fixture_list = []
+        url = f'{self.server.base_api}{path}'
+        with RequestsTransport() as transport:
+            while url:
+                response = transport.send('GET', url, headers={'Authorization': 'Bearer x'})
+                fixture_list.append({'method': 'GET', 'url': url, 'status': response.status_code,
+                                     'body': response.json()})
+                url = response.json().get('links', {}).get('next')
+        return fixture_list
+
+    def scenario_list(self) -> Dict[str, Callable[[], int]]:
+        """场景名 -> 执行一次的方法，返回值为本次处理的条目数"""
+        return {
+            'token_sign': self.token_sign,
+            'model_parse': self.model_parse,
+            'list_devices': lambda: len(self.agent.list_devices()),
+            'list_devices_memory': lambda: len(self.memory_agent.list_devices()),
+            'list_devices_memory_metrics': lambda: len(self.metrics_agent.list_devices()),
+            'list_profiles': lambda: len(self.agent.list_profiles()),
+            'list_certificates': lambda: len(self.agent.list_certificates()),
+            'list_bundle_id': lambda: len(self.agent.list_bundle_id()),
+            'list_devices_429': self.list_devices_429,
+            'concurrent_list': self.concurrent_list,
+            'crawl_apps': lambda: sum(1 for _ in AppCrawler(self.agent).iter_nodes()),
+            'update_profile': self.update_profile,
+            'screenshot_upload': self.screenshot_upload,
+        }
+
+    def token_sign(self) -> int:
+        num = 100
+        for _ in range(num):
+            self.token_manager.renew_token()
+        return num
+
+    def model_parse(self) -> int:
+        data = self.server.data
+        device_list = [Device(tmp_dict) for tmp_dict in data.devices]
+        profile_list = [Profile(tmp_dict) for tmp_dict in data.profiles]
+        cer_list = [Certificate(tmp_dict) for tmp_dict in data.certificates]
+        bundle_id_list = [BundleId(tmp_dict) for tmp_dict in data.bundle_ids]
+        return len(device_list) + len(profile_list) + len(cer_list) + len(bundle_id_list)
+
+    def list_devices_429(self) -> int:
+        # 每4个请求返回一次429，_api_call会等待1秒后重试
+        self.server.error_429_every = 4
+        try:
+            return len(self.agent.list_devices())
+        finally:
+            self.server.error_429_every = 0
+
+    def concurrent_list(self) -> int:
+        num = 32
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda _: self.agent.list_certificates(), range(num)))
+        return num
+
+    def update_profile(self) -> int:
+        manager = OKProfileManager(self.agent)
+        manager.update_profile('profile-1', bundle_id_str='com.example.app1')
+        return 1
+
+    def screenshot_upload(self) -> int:
+        screenshot = self.agent.create_app_screenshot('A0000-V0-L0-S0', str(self.upload_path))
+        checksum = self.agent.upload_app_screenshot(screenshot, str(self.upload_path))
+        self.agent.verify_app_screenshot(screenshot.id, checksum=checksum)
+        self.agent.delete_app_screenshot(screenshot.id)
+        return 1
+
+    def run(self, func: Callable[[], int]) -> Dict:
+        """执行一个场景repeat次，第一次作为预热不计入结果"""
+        func()
+        self.server.reset_counters()
+        second_list = []
+        item_num = 0
+        for _ in range(self.repeat):
+            flag_dot = time.perf_counter()
+            item_num += func()
+            second_list.append(time.perf_counter() - flag_dot)
+        total_second = sum(second_list)
+        result = {
+            'repeat': self.repeat,
+            'min_ms': min(second_list) * 1000,
+            'median_ms': statistics.median(second_list) * 1000,
+            'mean_ms': statistics.mean(second_list) * 1000,
+            'p95_ms': _percentile(second_list, 95) * 1000,
+            'max_ms': max(second_list) * 1000,
+            'items_per_second': item_num / total_second if total_second else 0,
+            'requests_per_run': self.server.request_count / self.repeat,
+            'error_429_per_run': self.server.error_429_count / self.repeat,
+        }
+        if self.server.upload_bytes:
+            result['upload_mb_per_second'] = self.server.upload_bytes / total_second / 1024 / 1024
+        return result
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_PATH,
+                              capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ''
+
+
+def compare_baseline(result_dict: Dict, baseline_path: Path, threshold: float) -> List[str]:
+    """
+    与之前的结果比较中位数
+    @param result_dict: 本次的结果
+    @param baseline_path: 之前的结果json文件
+    @param threshold: 允许变慢的比例，例如0.2代表允许变慢20%
+    @return: 性能回退的信息列表
+    """
+    baseline = json.loads(Path(baseline_path).read_text())['results']
+    regression_list = []
+    for name, tmp_result in result_dict.items():
+        old_result = baseline.get(name)
+        if not old_result or not old_result['median_ms']:
+            continue
+        ratio = tmp_result['median_ms'] / old_result['median_ms']
+        if ratio > 1 + threshold:
+            regression_list.append(f'{name}: median {old_result["median_ms"]:.2f}ms -> '
+                                   f'{tmp_result["median_ms"]:.2f}ms ({ratio:.2f}x)')
+    return regression_list
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='OKAppleAPI benchmarks against a local fake '
+                                                 'App Store Connect server')
+    parser.add_argument('--latency', type=float, default=0.005, help='api请求的延迟，单位：秒')
+    parser.add_argument('--upload-latency', type=float, default=0.005, help='上传分片的延迟，单位：秒')
+    parser.add_argument('--repeat', type=int, default=10, help='每个场景的执行次数')
+    parser.add_argument('--upload-size', type=int, default=3 * 1024 * 1024, help='上传文件的大小，单位：字节')
+    parser.add_argument('--devices', type=int, default=500, help='模拟的设备数量')
+    parser.add_argument('--scenario', action='append', help='只执行指定的场景，可多次传入')
+    parser.add_argument('--output', type=Path, help='结果json文件路径，默认benchmarks/results/下')
+    parser.add_argument('--baseline', type=Path, help='用于比较的、之前的结果json文件')
+    parser.add_argument('--threshold', type=float, default=0.2, help='允许变慢的比例，默认0.2')
+    parser.add_argument('--log-level', default='ERROR', help='okappleapi的日志级别，默认ERROR，即不输出重试等信息')
+    args = parser.parse_args(argv)
+    logging.basicConfig()
+    logging.getLogger('okappleapi').setLevel(args.log_level.upper())
+
+    data = FakeASCData(device_num=args.devices)
+    with FakeASCServer(data, latency=args.latency, upload_latency=args.upload_latency) as server:
+        bench = Benchmark(server, repeat=args.repeat, upload_size=args.upload_size)
+        try:
+            result_dict = {}
+            for name, func in bench.scenario_list().items():
+                if args.scenario and name not in args.scenario:
+                    continue
+                result_dict[name] = bench.run(func)
+                tmp_result = result_dict[name]
+                print(f'{name:<28} median {tmp_result["median_ms"]:9.2f}ms  '
+                      f'p95 {tmp_result["p95_ms"]:9.2f}ms  '
+                      f'{tmp_result["items_per_second"]:10.1f} items/s  '
+                      f'{tmp_result["requests_per_run"]:6.1f} req/run')
+        finally:
+            bench.close()
+
+    output_info = {
+        'meta': {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'git_revision': _git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'config': {tmp_key: (str(tmp_value) if isinstance(tmp_value, Path) else tmp_value)
+                       for tmp_key, tmp_value in vars(args).items()},
+        },
+        'results': result_dict
+    }
+    output_path = args.output
+    if not output_path:
+        output_path = RESULT_DIR.joinpath(f'bench-{datetime.now().strftime("%Y%m%d-%H%M%S")}.json')
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_text(json.dumps(output_info, indent=2))
+    print(f'result: {output_path}')
+
+    if args.baseline:
+        regression_list = compare_baseline(result_dict, args.baseline, args.threshold)
+        for tmp_info in regression_list:
+            print(f'REGRESSION {tmp_info}')
+        if regression_list:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
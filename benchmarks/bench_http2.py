@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# _*_ coding:UTF-8 _*_
+"""
+__author__ = 'shede333'
+
+HTTP/2多路复用（HTTP2Transport）与HTTP/1.1连接池（RequestsTransport）的对比基准测试，
+分别在1、8、64个并发请求下，请求本地的模拟服务器（fake_asc.py、fake_h2.py），需要安装：pip install OKAppleAPI[http2]
+    python benchmarks/bench_http2.py
+    python benchmarks/bench_http2.py --latency 0.02 --concurrency 1 --concurrency 128 --output result.json
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict
+
+from bench import RESULT_DIR, _git_revision, _new_token_manager, _percentile
+from fake_asc import FakeASCData, FakeASCServer
+from fake_h2 import FakeH2Server
+from okappleapi.apple_api_agent import APIAgent, RateLimiter
+from okappleapi.priority import PriorityDispatcher
+from okappleapi.transport import HTTP2Transport, RequestsTransport, Transport
+
+DEFAULT_CONCURRENCY = (1, 8, 64)
+
+
+def run_level(base_api: str, transport: Transport, concurrency: int, request_num: int,
+              path: str, connection_func: Callable[[], int]) -> Dict:
+    """
+    在指定的并发数下，发起request_num个请求
+    @param base_api: 服务器的根地址
+    @param transport: 传输层，每个并发级别使用新的传输层，分别统计建立的连接数
+    @param concurrency: 并发请求数
+    @param request_num: 请求总数
+    @param path: 请求的接口
+    @param connection_func: 返回服务器已接受的连接数
+    @return:
+    """
+    agent = APIAgent(_new_token_manager(), timeout=30, base_api=base_api,
+                     rate_limiter=RateLimiter(rate_per_hour=10 ** 9), transport=transport,
+                     dispatcher=PriorityDispatcher(max_concurrency=concurrency,
+                                                   reserved_concurrency=0))
+    url = f'{base_api}{path}'
+    second_list = []
+    lock = threading.Lock()
+
+    def _request(_):
+        flag_dot = time.perf_counter()
+        agent._api_call(url)
+        with lock:
+            second_list.append(time.perf_counter() - flag_dot)
+
+    try:
+        start_connection = connection_func()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(_request, range(concurrency)))  # 预热：建立连接、生成token
+            second_list.clear()
+            flag_dot = time.perf_counter()
+            list(executor.map(_request, range(request_num)))
+            total_second = time.perf_counter() - flag_dot
+            connection_num = connection_func() - start_connection
+    finally:
+        agent.close()
+    return {
+        'concurrency': concurrency,
+        'requests': request_num,
+        'total_ms': total_second * 1000,
+        'requests_per_second': request_num / total_second,
+        'median_ms': statistics.median(second_list) * 1000,
+        'p95_ms': _percentile(second_list, 95) * 1000,
+        'max_ms': max(second_list) * 1000,
+        'connections': connection_num,  # 包括预热时建立的连接
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='HTTP/2 vs HTTP/1.1 pooling benchmark against '
+                                                 'a local fake App Store Connect server')
+    parser.add_argument('--latency', type=float, default=0.005, help='api请求的延迟，单位：秒')
+    parser.add_argument('--concurrency', type=int, action='append',
+                        help='并发请求数，可多次传入，默认1、8、64')
+    parser.add_argument('--rounds', type=int, default=8, help='每个并发级别的请求总数为 并发数 * rounds')
+    parser.add_argument('--path', default='/v1/certificates?limit=200', help='请求的接口')
+    parser.add_argument('--output', type=Path, help='结果json文件路径，默认benchmarks/results/下')
+    args = parser.parse_args(argv)
+    concurrency_list = args.concurrency or DEFAULT_CONCURRENCY
+
+    result_dict = {'http1_pool': [], 'http2': []}
+    fake = FakeASCServer(FakeASCData(), latency=args.latency)
+    with fake, FakeH2Server(fake) as h2_server:
+        for concurrency in concurrency_list:
+            request_num = concurrency * args.rounds
+            for name, base_api, transport, connection_func in (
+                    ('http1_pool', fake.base_api, RequestsTransport(pool_size=concurrency),
+                     lambda: fake.connection_count),
+                    ('http2', h2_server.base_api, HTTP2Transport(is_prior_knowledge=True),
+                     lambda: h2_server.connection_count)):
+                tmp_result = run_level(base_api, transport, concurrency, request_num, args.path,
+                                       connection_func)
+                result_dict[name].append(tmp_result)
+                print(f'{name:<11} concurrency {concurrency:4d}  '
+                      f'median {tmp_result["median_ms"]:8.2f}ms  p95 {tmp_result["p95_ms"]:8.2f}ms  '
+                      f'{tmp_result["requests_per_second"]:9.1f} req/s  '
+                      f'{tmp_result["connections"]:3d} connections')
+
+    output_info = {
+        'meta': {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'git_revision': _git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'config': {tmp_key: (str(tmp_value) if isinstance(tmp_value, Path) else tmp_value)
+                       for tmp_key, tmp_value in vars(args).items()},
+        },
+        'results': result_dict
+    }
+    output_path = args.output
+    if not output_path:
+        output_path = RESULT_DIR.joinpath(f'bench-http2-{datetime.now().strftime("%Y%m%d-%H%M%S")}.json')
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_text(json.dumps(output_info, indent=2))
+    print(f'result: {output_path}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
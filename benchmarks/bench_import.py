@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# _*_ coding:UTF-8 _*_
+"""
+__author__ = 'shede333'
+
+import耗时的基准测试，基于python -X importtime，每次在新的子进程中导入，取中位数：
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --module okappleapi.crawler --budget-ms 50 --repeat 10
+超过--budget-ms，或导入了--forbid中的模块（jwt、requests等应在首次使用时才导入）时，退出码为1，可用于CI
+"""
+
+import argparse
+import json
+import re
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+ROOT_PATH = Path(__file__).resolve().parent.parent
+
+DEFAULT_MODULES = ('okappleapi.ok_agent',)
+DEFAULT_BUDGET_MS = 100
+# import时不应该加载的重量级模块，需要时由各方法内部导入
+DEFAULT_FORBID = ('jwt', 'cryptography', 'requests', 'urllib3', 'mobileprovision', 'httpx', 'asyncio')
+_LINE_PATTERN = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def parse_importtime(text: str, package: str) -> Tuple[float, List[Tuple[str, int, int]]]:
+    """
+    解析-X importtime的输出
+    @param text: stderr的内容
+    @param package: 只统计此包触发的导入，例如okappleapi
+    @return: (包的总耗时ms, [(模块名, 自身耗时us, 累计耗时us)])，只包含由此包触发导入的模块
+    """
+    total_us = 0
+    module_list = []
+    pending_list = []  # 子模块的输出在父模块之前，遇到顶层的行时再判断是否属于此包
+    for tmp_line in text.splitlines():
+        match = _LINE_PATTERN.match(tmp_line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = int(match[1]), int(match[2]), match[3], match[4]
+        pending_list.append((name, self_us, cumulative_us))
+        if len(indent) <= 1:  # 顶层的导入
+            if name == package or name.startswith(f'{package}.'):
+                total_us += cumulative_us
+                module_list.extend(pending_list)
+            pending_list = []
+    return total_us / 1000, module_list
+
+
+def new_modules(module: str) -> List[str]:
+    """在新的子进程中导入module，返回由此新加载的模块名"""
+    code = ('import json, sys; before = set(sys.modules); '
+            f'import {module}; print(json.dumps(sorted(set(sys.modules) - before)))')
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT_PATH, capture_output=True,
+                            text=True, check=True)
+    return json.loads(result.stdout)
+
+
+def measure(module: str, repeat: int) -> Dict:
+    """
+    多次在新的子进程中导入module
+    @param module: 模块名
+    @param repeat: 次数
+    @return:
+    """
+    package = module.split('.')[0]
+    total_list = []
+    module_list = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                                cwd=ROOT_PATH, capture_output=True, text=True, check=True)
+        total_ms, module_list = parse_importtime(result.stderr, package)
+        total_list.append(total_ms)
+    slowest_list = sorted(module_list, key=lambda x: x[1], reverse=True)[:10]
+    return {
+        'repeat': repeat,
+        'median_ms': statistics.median(total_list),
+        'min_ms': min(total_list),
+        'max_ms': max(total_list),
+        'slowest_self_us': {name: self_us for name, self_us, _ in slowest_list},
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='OKAppleAPI import time benchmark')
+    parser.add_argument('--module', action='append', help='需要测试的模块，可多次传入，默认okappleapi.ok_agent')
+    parser.add_argument('--repeat', type=int, default=5, help='每个模块的导入次数')
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS,
+                        help=f'导入耗时中位数的上限，单位：毫秒，默认{DEFAULT_BUDGET_MS}')
+    parser.add_argument('--forbid', action='append', help='导入时不应该加载的模块，可多次传入，'
+                                                          f'默认{",".join(DEFAULT_FORBID)}')
+    parser.add_argument('--output', type=Path, help='（可选）结果json文件路径')
+    args = parser.parse_args(argv)
+    forbid_list = args.forbid or DEFAULT_FORBID
+
+    error_list = []
+    result_dict = {}
+    for module in args.module or DEFAULT_MODULES:
+        tmp_result = measure(module, args.repeat)
+        loaded_list = sorted({tmp_name.split('.')[0] for tmp_name in new_modules(module)} &
+                             set(forbid_list))
+        tmp_result['forbidden_loaded'] = loaded_list
+        result_dict[module] = tmp_result
+        print(f'{module:<28} median {tmp_result["median_ms"]:8.2f}ms  '
+              f'min {tmp_result["min_ms"]:8.2f}ms  max {tmp_result["max_ms"]:8.2f}ms')
+        for tmp_name, self_us in tmp_result['slowest_self_us'].items():
+            print(f'    {tmp_name:<40} self {self_us / 1000:8.2f}ms')
+        if tmp_result['median_ms'] > args.budget_ms:
+            error_list.append(f'{module}: median {tmp_result["median_ms"]:.2f}ms > '
+                              f'budget {args.budget_ms:.2f}ms')
+        if loaded_list:
+            error_list.append(f'{module}: loaded {", ".join(loaded_list)} at import time')
+
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps({'budget_ms': args.budget_ms, 'results': result_dict},
+                                          indent=2))
+        print(f'result: {args.output}')
+    for tmp_info in error_list:
+        print(f'OVER BUDGET {tmp_info}')
+    return 1 if error_list else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
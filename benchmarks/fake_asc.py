@@ -0,0 +1,509 @@
+#!/usr/bin/env python
+# _*_ coding:UTF-8 _*_
+"""
+__author__ = 'shede333'
+
+进程内的模拟App Store Connect服务器，仅用于基准测试：
+支持分页（links.next）、include=appScreenshots、可配置的延迟、周期性的429限流错误、截图的分片上传
+"""
+
+import base64
+import hashlib
+import json
+import re
+import sys
+import threading
+import time
+import uuid as uuid_lib
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+DEFAULT_LIMIT = 50
+UPLOAD_PART_SIZE = 512 * 1024  # 每个上传分片的大小
+
+# 模拟的mobileprovision内容：CMS签名数据中间夹着plist，与真实文件的解析方式一致
+_MP_TEMPLATE = '''<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE plist PUBLIC "-//Apple//DTD PLIST 1.0//EN" "http://www.apple.com/DTDs/PropertyList-1.0.dtd">
+<plist version="1.0">
+<dict>
+    <key>AppIDName</key><string>{name}</string>
+    <key>Entitlements</key>
+    <dict><key>application-identifier</key><string>ABCDE12345.{identifier}</string></dict>
+    <key>Name</key><string>{name}</string>
+    <key>UUID</key><string>{uuid}</string>
+    <key>TeamIdentifier</key><array><string>ABCDE12345</string></array>
+</dict>
+</plist>'''
+
+
+def _iso(date: datetime) -> str:
+    return date.strftime('%Y-%m-%dT%H:%M:%S.000+00:00')
+
+
+class FakeASCData:
+    """模拟服务器的数据，根据数量参数确定性地生成"""
+
+    def __init__(self, device_num=500, certificate_num=6, bundle_id_num=50, profile_num=100,
+                 app_num=3, version_num=2, locale_num=4, screenshot_set_num=3, screenshot_num=5):
+        now = datetime(2026, 1, 1)
+        self.lock = threading.Lock()
+
+        self.devices = []
+        for index in range(device_num):
+            self.devices.append({
+                'type': 'devices',
+                'id': f'D{index:06d}',
+                'attributes': {
+                    'addedDate': _iso(now - timedelta(minutes=index)),
+                    'name': f'device-{index}',
+                    'deviceClass': 'IPHONE',
+                    'model': 'iPhone 15 Pro',
+                    'udid': hashlib.sha1(f'udid-{index}'.encode()).hexdigest(),
+                    'platform': 'IOS',
+                    'status': 'ENABLED' if index % 10 else 'DISABLED'
+                }
+            })
+
+        self.certificates = []
+        for index in range(certificate_num):
+            cer_type = 'IOS_DEVELOPMENT' if index % 2 == 0 else 'IOS_DISTRIBUTION'
+            self.certificates.append({
+                'type': 'certificates',
+                'id': f'C{index:06d}',
+                'attributes': {
+                    'name': f'iOS Certificate {index}',
+                    'displayName': f'Fake Team {index}',
+                    'platform': 'IOS',
+                    'certificateType': cer_type,
+                    'expirationDate': _iso(now + timedelta(days=365 - index)),
+                    'serialNumber': f'{index:032X}',
+                    'certificateContent': base64.b64encode(bytes(1400)).decode()
+                }
+            })
+
+        self.bundle_ids = []
+        for index in range(bundle_id_num):
+            self.bundle_ids.append({
+                'type': 'bundleIds',
+                'id': f'B{index:06d}',
+                'attributes': {
+                    'identifier': f'com.example.app{index}',
+                    'name': f'App {index}',
+                    'platform': 'IOS',
+                    'seedId': 'ABCDE12345'
+                }
+            })
+
+        self.profiles = [self.new_profile(f'profile-{index}', f'com.example.app{index % bundle_id_num}',
+                                          created_date=now - timedelta(days=index))
+                         for index in range(profile_num)]
+
+        self.apps = []
+        self.app_infos = {}  # app id -> [appInfo]
+        self.versions = {}  # app id -> [appStoreVersion]
+        self.localizations = {}  # version id -> [localization]
+        self.screenshot_sets = {}  # localization id -> [screenshot set]
+        self.screenshots = {}  # screenshot set id -> [screenshot]
+        for app_index in range(app_num):
+            app_id = f'A{app_index:04d}'
+            self.apps.append({
+                'type': 'apps',
+                'id': app_id,
+                'attributes': {'name': f'App {app_index}', 'sku': f'SKU{app_index}',
+                               'bundleId': f'com.example.app{app_index}'}
+            })
+            self.app_infos[app_id] = [{'type': 'appInfos', 'id': f'{app_id}-I',
+                                       'attributes': {'appStoreState': 'READY_FOR_SALE'}}]
+            self.versions[app_id] = []
+            for version_index in range(version_num):
+                version_id = f'{app_id}-V{version_index}'
+                self.versions[app_id].append({
+                    'type': 'appStoreVersions',
+                    'id': version_id,
+                    'attributes': {'versionString': f'1.{version_index}', 'platform': 'IOS',
+                                   'appStoreState': 'PREPARE_FOR_SUBMISSION'}
+                })
+                self.localizations[version_id] = []
+                for locale_index in range(locale_num):
+                    locale_id = f'{version_id}-L{locale_index}'
+                    self.localizations[version_id].append({
+                        'type': 'appStoreVersionLocalizations',
+                        'id': locale_id,
+                        'attributes': {'locale': f'locale-{locale_index}'}
+                    })
+                    self.screenshot_sets[locale_id] = []
+                    for set_index in range(screenshot_set_num):
+                        set_id = f'{locale_id}-S{set_index}'
+                        self.screenshot_sets[locale_id].append({
+                            'type': 'appScreenshotSets',
+                            'id': set_id,
+                            'attributes': {'screenshotDisplayType': 'APP_IPHONE_67'}
+                        })
+                        self.screenshots[set_id] = [
+                            self.new_screenshot(f'{set_id}-P{shot_index}', f'{shot_index}.png',
+                                                1024, state='COMPLETE')
+                            for shot_index in range(screenshot_num)]
+
+    @staticmethod
+    def new_profile(name: str, identifier: str, created_date: datetime = None) -> Dict:
+        created_date = created_date if created_date else datetime(2026, 1, 1)
+        tmp_uuid = str(uuid_lib.uuid5(uuid_lib.NAMESPACE_OID, f'{name}-{created_date}')).upper()
+        plist_text = _MP_TEMPLATE.format(name=name, identifier=identifier, uuid=tmp_uuid)
+        content = b'\x30\x80\x06\x09' + bytes(64) + plist_text.encode() + bytes(2048)
+        return {
+            'type': 'profiles',
+            'id': f'P-{tmp_uuid}',
+            'attributes': {
+                'name': name,
+                'platform': 'IOS',
+                'profileType': 'IOS_APP_DEVELOPMENT',
+                'profileState': 'ACTIVE',
+                'uuid': tmp_uuid,
+                'profileContent': base64.b64encode(content).decode(),
+                'createdDate': _iso(created_date),
+                'expirationDate': _iso(created_date + timedelta(days=365))
+            }
+        }
+
+    @staticmethod
+    def new_screenshot(screenshot_id: str, file_name: str, file_size: int,
+                       state='AWAITING_UPLOAD', upload_operations: List[Dict] = None) -> Dict:
+        return {
+            'type': 'appScreenshots',
+            'id': screenshot_id,
+            'attributes': {
+                'fileName': file_name,
+                'fileSize': file_size,
+                'sourceFileChecksum': None,
+                'uploadOperations': upload_operations,
+                'assetDeliveryState': {'state': state, 'errors': []}
+            }
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # 响应头和响应体分开写入，keep-alive时避免Nagle算法带来的延迟
+    server: '_FakeHTTPServer'
+
+    def setup(self):
+        super().setup()
+        with self.server.fake._lock:
+            self.server.fake.connection_count += 1
+
+    def log_message(self, format, *args):
+        pass  # 基准测试时不打印访问日志
+
+    def _send_json(self, status: int, info: Optional[Dict], headers: Dict = None):
+        body = json.dumps(info).encode() if info is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for tmp_key, tmp_value in (headers or {}).items():
+            self.send_header(tmp_key, tmp_value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _dispatch(self, method: str):
+        fake = self.server.fake
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        status, info, headers = fake.handle_request(method, self.path, self.headers, body)
+        self._send_json(status, info, headers=headers)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PATCH(self):
+        self._dispatch('PATCH')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+
+class _FakeHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # 并发建立大量连接时，避免listen队列溢出导致的重连等待
+    fake: 'FakeASCServer'
+
+    def handle_error(self, request, client_address):
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return  # 客户端超时、断开连接，属于预期内的情况
+        super().handle_error(request, client_address)
+
+
+class FakeASCServer:
+    """
+    进程内的模拟App Store Connect服务器，在后台线程中运行，可作为上下文管理器使用：
+        with FakeASCServer(latency=0.02) as server:
+            agent = APIAgent(token_manager, base_api=server.base_api)
+    """
+
+    def __init__(self, data: FakeASCData = None, latency: float = 0, upload_latency: float = 0,
+                 error_429_every: int = 0, host='127.0.0.1', port=0):
+        """
+        初始化方法
+        @param data: 服务器的数据，默认FakeASCData()
+        @param latency: api请求的延迟，单位：秒
+        @param upload_latency: 上传分片请求的延迟，单位：秒
+        @param error_429_every: 每N个api请求返回一次429错误，默认0，即不返回
+        @param host: 监听的地址
+        @param port: 监听的端口，默认0，即随机端口
+        """
+        self.data = data if data else FakeASCData()
+        self.latency = latency
+        self.upload_latency = upload_latency
+        self.error_429_every = error_429_every
+
+        self._server = _FakeHTTPServer((host, port), _Handler)
+        self._server.fake = self
+        self._thread = None
+        self._lock = threading.Lock()
+        self._local = threading.local()  # 当前请求线程的path、base_api
+        self.request_count = 0
+        self.error_429_count = 0
+        self.upload_bytes = 0
+        self.connection_count = 0  # 已接受的连接数
+        self._routes = [
+            ('GET', r'/v1/devices', self._list_devices),
+            ('GET', r'/v1/certificates', lambda m, q, b: self._page(self.data.certificates, q)),
+            ('GET', r'/v1/bundleIds', lambda m, q, b: self._page(self.data.bundle_ids, q)),
+            ('GET', r'/v1/profiles', lambda m, q, b: self._page(self.data.profiles, q)),
+            ('POST', r'/v1/devices', self._register_device),
+            ('PATCH', r'/v1/devices/(?P<id>[^/]+)', self._modify_device),
+            ('POST', r'/v1/profiles', self._create_profile),
+            ('DELETE', r'/v1/profiles/(?P<id>[^/]+)', self._delete_profile),
+            ('GET', r'/v1/apps', lambda m, q, b: self._page(self.data.apps, q)),
+            ('GET', r'/v1/apps/(?P<id>[^/]+)/appInfos',
+             lambda m, q, b: self._page(self.data.app_infos.get(m['id'], []), q)),
+            ('GET', r'/v1/apps/(?P<id>[^/]+)/appStoreVersions',
+             lambda m, q, b: self._page(self.data.versions.get(m['id'], []), q)),
+            ('GET', r'/v1/appStoreVersions/(?P<id>[^/]+)/appStoreVersionLocalizations',
+             lambda m, q, b: self._page(self.data.localizations.get(m['id'], []), q)),
+            ('GET', r'/v1/appStoreVersionLocalizations/(?P<id>[^/]+)/appScreenshotSets',
+             self._list_screenshot_sets),
+            ('GET', r'/v1/appScreenshotSets/(?P<id>[^/]+)/appScreenshots',
+             lambda m, q, b: self._page(self.data.screenshots.get(m['id'], []), q)),
+            ('POST', r'/v1/appScreenshots', self._create_screenshot),
+            ('PATCH', r'/v1/appScreenshots/(?P<id>[^/]+)', self._commit_screenshot),
+            ('DELETE', r'/v1/appScreenshots/(?P<id>[^/]+)', self._delete_screenshot),
+        ]
+        self._routes = [(tmp_method, re.compile(f'{tmp_pattern}$'), tmp_func)
+                        for tmp_method, tmp_pattern, tmp_func in self._routes]
+
+    @property
+    def base_api(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'FakeASCServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def reset_counters(self):
+        with self._lock:
+            self.request_count = 0
+            self.error_429_count = 0
+            self.upload_bytes = 0
+
+    def _page(self, item_list: List[Dict], query: Dict) -> Dict:
+        """按limit、cursor分页，links.next为下一页的完整url"""
+        limit = min(int(query.get('limit', DEFAULT_LIMIT)), 200)
+        offset = int(query.get('cursor', 0))
+        result = {'data': item_list[offset:offset + limit], 'links': {'self': ''},
+                  'meta': {'paging': {'total': len(item_list), 'limit': limit}}}
+        if offset + limit < len(item_list):
+            next_query = dict(query, cursor=offset + limit)
+            result['links']['next'] = f'{self._local.base_api}{self._local.path}?{urlencode(next_query)}'
+        return result
+
+    def _list_devices(self, match, query, body):
+        device_list = self.data.devices
+        if query.get('sort') == '-id':
+            device_list = sorted(device_list, key=lambda x: x['id'], reverse=True)
+        for tmp_key in ('status', 'platform', 'udid'):
+            tmp_value = query.get(f'filter[{tmp_key}]')
+            if tmp_value:
+                device_list = [tmp_device for tmp_device in device_list
+                               if tmp_device['attributes'][tmp_key] in tmp_value.split(',')]
+        if query.get('filter[id]'):
+            id_set = set(query['filter[id]'].split(','))
+            device_list = [tmp_device for tmp_device in device_list if tmp_device['id'] in id_set]
+        if query.get('fields[devices]'):
+            field_list = query['fields[devices]'].split(',')
+            device_list = [dict(tmp_device, attributes={tmp_key: tmp_device['attributes'].get(tmp_key)
+                                                        for tmp_key in field_list})
+                           for tmp_device in device_list]
+        return self._page(device_list, query)
+
+    def _register_device(self, match, query, body):
+        attributes = json.loads(body)['data']['attributes']
+        with self.data.lock:
+            if any(tmp_device['attributes']['udid'] == attributes['udid']
+                   for tmp_device in self.data.devices):
+                return 409, {'errors': [{
+                    'status': '409', 'code': 'ENTITY_ERROR.ATTRIBUTE.INVALID',
+                    'title': 'An attribute value is invalid.',
+                    'detail': f"A device with number '{attributes['udid']}' already exists on this team."}]}
+            device = {
+                'type': 'devices',
+                'id': f'D{uuid_lib.uuid4().hex[:10].upper()}',
+                'attributes': dict(attributes, addedDate=_iso(datetime.now()), deviceClass='IPHONE',
+                                   model=None, status='ENABLED')
+            }
+            self.data.devices.append(device)
+        return 201, {'data': device}
+
+    def _modify_device(self, match, query, body):
+        attributes = json.loads(body)['data']['attributes']
+        with self.data.lock:
+            for tmp_device in self.data.devices:
+                if tmp_device['id'] == match['id']:
+                    tmp_device['attributes'].update(attributes)
+                    return 200, {'data': tmp_device}
+        return 404, {'errors': [{'status': '404', 'code': 'NOT_FOUND', 'title': 'not found'}]}
+
+    def _list_screenshot_sets(self, match, query, body):
+        set_list = self.data.screenshot_sets.get(match['id'], [])
+        if query.get('include') != 'appScreenshots':
+            return self._page(set_list, query)
+
+        include_limit = int(query.get('limit[appScreenshots]', DEFAULT_LIMIT))
+        result = self._page(set_list, query)
+        data_list = []
+        included_list = []
+        for tmp_set in result['data']:
+            screenshot_list = self.data.screenshots.get(tmp_set['id'], [])[:include_limit]
+            included_list.extend(screenshot_list)
+            data_list.append(dict(tmp_set, relationships={'appScreenshots': {
+                'data': [{'type': 'appScreenshots', 'id': tmp_shot['id']}
+                         for tmp_shot in screenshot_list]}}))
+        result['data'] = data_list
+        result['included'] = included_list
+        return result
+
+    def _create_profile(self, match, query, body):
+        data_dict = json.loads(body)['data']
+        bundle_id = data_dict['relationships']['bundleId']['data']['id']
+        identifier = next((tmp_item['attributes']['identifier'] for tmp_item in self.data.bundle_ids
+                           if tmp_item['id'] == bundle_id), 'com.example.unknown')
+        profile = self.data.new_profile(data_dict['attributes']['name'], identifier,
+                                        created_date=datetime.now())
+        with self.data.lock:
+            self.data.profiles.append(profile)
+        return 201, {'data': profile}
+
+    def _delete_profile(self, match, query, body):
+        with self.data.lock:
+            self.data.profiles = [tmp_item for tmp_item in self.data.profiles
+                                  if tmp_item['id'] != match['id']]
+        return 204, None
+
+    def _create_screenshot(self, match, query, body):
+        data_dict = json.loads(body)['data']
+        attributes = data_dict['attributes']
+        set_id = data_dict['relationships']['appScreenshotSet']['data']['id']
+        screenshot_id = f'{set_id}-U{uuid_lib.uuid4().hex[:8]}'
+        file_size = int(attributes['fileSize'])
+        operation_list = []
+        for offset in range(0, file_size, UPLOAD_PART_SIZE):
+            operation_list.append({
+                'method': 'PUT',
+                'url': f'{self._local.base_api}/upload/{screenshot_id}/{offset}',
+                'length': min(UPLOAD_PART_SIZE, file_size - offset),
+                'offset': offset,
+                'requestHeaders': [{'name': 'Content-Type', 'value': 'image/png'}]
+            })
+        screenshot = self.data.new_screenshot(screenshot_id, attributes['fileName'], file_size,
+                                              upload_operations=operation_list)
+        with self.data.lock:
+            self.data.screenshots.setdefault(set_id, []).append(screenshot)
+        return 201, {'data': screenshot}
+
+    def _commit_screenshot(self, match, query, body):
+        attributes = json.loads(body)['data']['attributes']
+        for screenshot_list in self.data.screenshots.values():
+            for tmp_shot in screenshot_list:
+                if tmp_shot['id'] == match['id']:
+                    tmp_shot['attributes']['sourceFileChecksum'] = attributes.get('sourceFileChecksum')
+                    tmp_shot['attributes']['assetDeliveryState']['state'] = 'COMPLETE'
+                    return 200, {'data': tmp_shot}
+        return 404, {'errors': [{'status': '404', 'code': 'NOT_FOUND', 'title': 'not found'}]}
+
+    def _delete_screenshot(self, match, query, body):
+        with self.data.lock:
+            for set_id, screenshot_list in self.data.screenshots.items():
+                self.data.screenshots[set_id] = [tmp_shot for tmp_shot in screenshot_list
+                                                 if tmp_shot['id'] != match['id']]
+        return 204, None
+
+    def handle_request(self, method: str, raw_path: str, headers, body: bytes,
+                       base_api: str = None) -> Tuple[int, Optional[Dict], Dict]:
+        """
+        处理一个请求，与具体的HTTP服务器无关，HTTP/2的测试服务器（fake_h2.py）也使用此方法
+        @param method: HTTP方法
+        @param raw_path: 请求的path，包括query
+        @param headers: 请求头，支持get方法即可
+        @param body: 请求体
+        @param base_api: 生成links.next、上传url时使用的根地址，默认self.base_api
+        @return: (状态码, 响应的json, 响应头)
+        """
+        split_result = urlsplit(raw_path)
+        if split_result.path.startswith('/upload/'):
+            return self.handle_upload(method, split_result.path, body)
+        self._local.base_api = base_api if base_api else self.base_api
+        return self.handle_api(method, split_result.path, dict(parse_qsl(split_result.query)),
+                               headers, body)
+
+    def handle_api(self, method: str, path: str, query: Dict, headers,
+                   body: bytes) -> Tuple[int, Optional[Dict], Dict]:
+        with self._lock:
+            self.request_count += 1
+            request_count = self.request_count
+        if self.latency:
+            time.sleep(self.latency)
+        if not (headers.get('Authorization') or '').startswith('Bearer '):
+            return 401, {'errors': [{'status': '401', 'code': 'NOT_AUTHORIZED',
+                                     'title': 'missing token'}]}, {}
+        rate_headers = {'X-Rate-Limit': f'user-hour-lim:3600;user-hour-rem:{max(0, 3600 - request_count)};'}
+        if self.error_429_every and request_count % self.error_429_every == 0:
+            with self._lock:
+                self.error_429_count += 1
+            return 429, {'errors': [{'status': '429', 'code': 'RATE_LIMIT_EXCEEDED',
+                                     'title': 'The request rate limit has been reached.'}]}, rate_headers
+
+        for tmp_method, tmp_pattern, tmp_func in self._routes:
+            match = tmp_pattern.match(path)
+            if tmp_method == method and match:
+                self._local.path = path  # 分页时生成links.next需要
+                result = tmp_func(match.groupdict(), query, body)
+                status, info = result if isinstance(result, tuple) else (200, result)
+                return status, info, rate_headers
+        return 404, {'errors': [{'status': '404', 'code': 'NOT_FOUND',
+                                 'title': f'{method} {path}'}]}, {}
+
+    def handle_upload(self, method: str, path: str, body: bytes) -> Tuple[int, None, Dict]:
+        if self.upload_latency:
+            time.sleep(self.upload_latency)
+        with self._lock:
+            self.upload_bytes += len(body)
+        return 200, None, {}
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# _*_ coding:UTF-8 _*_
+"""
+__author__ = 'shede333'
+
+模拟App Store Connect服务器的HTTP/2版本，仅用于基准测试：
+明文HTTP/2（h2c，prior knowledge），基于h2库（pip install OKAppleAPI[http2]），
+请求的处理与FakeASCServer相同；同一个连接上的多个请求（stream）在线程池中并发处理
+"""
+
+import json
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+import h2.config
+import h2.connection
+import h2.events
+import h2.exceptions
+
+from fake_asc import FakeASCServer
+
+
+class _H2Connection:
+    """一个客户端连接，h2的状态机不是线程安全的，所有的读写都在self._condition内进行"""
+
+    def __init__(self, server: 'FakeH2Server', sock: socket.socket):
+        self.server = server
+        self.sock = sock
+        config = h2.config.H2Configuration(client_side=False, header_encoding='utf-8')
+        self.conn = h2.connection.H2Connection(config=config)
+        self._condition = threading.Condition()
+        self._stream_dict = {}  # stream_id -> (请求头dict, 请求体bytearray)
+        self._is_closed = False
+
+    def _flush(self):
+        # 在self._condition内调用
+        data = self.conn.data_to_send()
+        if data:
+            self.sock.sendall(data)
+
+    def run(self):
+        try:
+            with self._condition:
+                self.conn.initiate_connection()
+                self._flush()
+            while True:
+                data = self.sock.recv(65536)
+                if not data:
+                    return
+                with self._condition:
+                    event_list = self.conn.receive_data(data)
+                    for tmp_event in event_list:
+                        self._handle_event(tmp_event)
+                    self._flush()
+                    self._condition.notify_all()  # 可能收到了WindowUpdated
+                if any(isinstance(tmp_event, h2.events.ConnectionTerminated)
+                       for tmp_event in event_list):
+                    return
+        except (OSError, h2.exceptions.ProtocolError):
+            return
+        finally:
+            with self._condition:
+                self._is_closed = True
+                self._condition.notify_all()
+            self.sock.close()
+
+    def _handle_event(self, event):
+        # 在self._condition内调用
+        if isinstance(event, h2.events.RequestReceived):
+            self._stream_dict[event.stream_id] = (dict(event.headers), bytearray())
+        elif isinstance(event, h2.events.DataReceived):
+            self._stream_dict[event.stream_id][1].extend(event.data)
+            self.conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+        elif isinstance(event, h2.events.StreamEnded):
+            headers, body = self._stream_dict.pop(event.stream_id)
+            self.server.executor.submit(self._respond, event.stream_id, headers, bytes(body))
+
+    def _respond(self, stream_id: int, headers: Dict, body: bytes):
+        fake = self.server.fake
+        headers = {tmp_key.title(): tmp_value for tmp_key, tmp_value in headers.items()}
+        status, info, response_headers = fake.handle_request(
+            headers[':Method'], headers[':Path'], headers, body, base_api=self.server.base_api)
+        content = json.dumps(info).encode() if info is not None else b''
+        header_list = [(':status', str(status)), ('content-type', 'application/json'),
+                       ('content-length', str(len(content)))]
+        header_list.extend((tmp_key.lower(), tmp_value) for tmp_key, tmp_value in response_headers.items())
+        try:
+            with self._condition:
+                self.conn.send_headers(stream_id, header_list, end_stream=not content)
+                self._flush()
+                while content:
+                    # 按流量控制窗口分段发送，窗口用完时等待客户端的WindowUpdated
+                    window = min(self.conn.local_flow_control_window(stream_id),
+                                 self.conn.max_outbound_frame_size)
+                    if window <= 0:
+                        if self._is_closed:
+                            return
+                        self._condition.wait()
+                        continue
+                    chunk, content = content[:window], content[window:]
+                    self.conn.send_data(stream_id, chunk, end_stream=not content)
+                    self._flush()
+        except (OSError, h2.exceptions.StreamClosedError):
+            pass  # 客户端已断开
+
+
+class FakeH2Server:
+    """
+    HTTP/2的模拟App Store Connect服务器，在后台线程中运行，可作为上下文管理器使用：
+        with FakeH2Server(FakeASCServer(latency=0.02)) as server:
+            agent = APIAgent(token_manager, base_api=server.base_api,
+                             transport=HTTP2Transport(is_prior_knowledge=True))
+    """
+
+    def __init__(self, fake: FakeASCServer, host='127.0.0.1', port=0, max_workers: int = 128):
+        """
+        初始化方法
+        @param fake: FakeASCServer对象，提供数据、延迟、请求计数，不需要启动
+        @param host: 监听的地址
+        @param port: 监听的端口，默认0，即随机端口
+        @param max_workers: 同时处理的请求（stream）数
+        """
+        self.fake = fake
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.connection_count = 0  # 已接受的连接数，用于对比HTTP/1.1连接池
+        self._sock = socket.create_server((host, port), backlog=128)
+        self._thread = None
+
+    @property
+    def base_api(self) -> str:
+        host, port = self._sock.getsockname()[:2]
+        return f'http://{host}:{port}'
+
+    def _serve(self):
+        while True:
+            try:
+                sock, _ = self._sock.accept()
+            except OSError:
+                return  # stop()关闭了监听的socket
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.connection_count += 1
+            threading.Thread(target=_H2Connection(self, sock).run, daemon=True).start()
+
+    def start(self) -> 'FakeH2Server':
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)  # 唤醒阻塞在accept的线程
+        except OSError:
+            pass
+        self._sock.close()
+        self.executor.shutdown(wait=False)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
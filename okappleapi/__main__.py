@@ -0,0 +1,13 @@
+#!/usr/bin/env python
+# _*_ coding:UTF-8 _*_
+"""
+__author__ = 'shede333'
+
+python -m okappleapi，同命令行okappleapi
+"""
+
+import sys
+
+from .cli import main
+
+sys.exit(main())
@@ -8,26 +8,53 @@ import os
 import json
 import time
 import hashlib
+import logging
+import mmap
+import threading
 from datetime import timedelta
-from pprint import pprint
-from typing import List, Tuple, Optional
+from typing import Callable, List, Tuple, Optional
 from urllib.parse import urljoin, urlencode
 
-import jwt
-import requests
-
+from .circuit_breaker import CircuitBreaker
+from .deadline import ContextThreadPoolExecutor, effective_timeout, remaining_time
+from .log import verbose_level
+from .metrics import RequestEvent, endpoint_template
+from .priority import PriorityDispatcher, current_priority
 from .models import *
+from .transport import (RecordingTransport, RequestsTransport, Transport, TransportError,
+                        TransportTimeout)
 
 BASE_API = "https://api.appstoreconnect.apple.com"
 MAX_LIMIT = 200
+UPLOAD_WORKERS = 4  # 分片上传时，默认的并发数
+CHECKSUM_CHUNK_SIZE = 1024 * 1024  # 计算文件md5时，每次读取的大小
+# App Store Connect API的限流：每个key每小时3600次请求
+RATE_LIMIT_PER_HOUR = 3600
+
+logger = logging.getLogger(__name__)
+
+
+def file_md5(file_path: Union[str, Path], chunk_size: int = CHECKSUM_CHUNK_SIZE) -> str:
+    """
+    分块计算文件的md5，内存占用与文件大小无关
+    @param file_path: 文件路径
+    @param chunk_size: 每次读取的大小
+    @return: md5的16进制字符串
+    """
+    md5 = hashlib.md5()
+    with open(file_path, mode='rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
 
 
 def create_full_url(path: str, params: Dict = None, filters: Dict = None,
-                    fields: Dict = None) -> str:
+                    fields: Dict = None, base_api: str = BASE_API) -> str:
     """
     创建完整的url
+    @param base_api: 接口的根地址，默认BASE_API
     """
-    url = urljoin(BASE_API, path)
+    url = urljoin(base_api, path)
     params = params.copy() if params else {}
 
     if filters:
@@ -42,6 +69,16 @@ def create_full_url(path: str, params: Dict = None, filters: Dict = None,
         return url
 
 
+def is_not_conflict_error(code: str, status: str):
+    """
+    用于创建类的接口：409（例如设备的UDID已注册）重试也不会成功，不重试；其它错误与默认行为一致
+    @param code: 错误码
+    @param status: 错误文案
+    @return:
+    """
+    return int(status) != 409, 1
+
+
 def is_auth_error(code: str, status: str):
     """
     用于判定是否需要重试（即重新发起请求），目前仅验证信息过期才会重新发起请求
@@ -78,6 +115,8 @@ class TokenManager:
         self._token_expired_date = None
 
         self._token = None
+        self._lock = threading.Lock()  # 多线程并发请求时，避免重复生成token
+        self.renew_hooks = []  # 生成新token后调用，参数为TokenManager对象，例如MetricsCollector.on_token_renew
 
     @classmethod
     def from_json(cls, json_info):
@@ -103,10 +142,14 @@ class TokenManager:
                    # 'iat': int(self._token_gen_date.timestamp()),
                    'exp': int(self._token_expired_date.timestamp()),
                    'aud': 'appstoreconnect-v1'}
+        import jwt  # 首次生成token时才导入，jwt会加载cryptography，耗时较长
+
         self._token = jwt.encode(payload=payload,
                                  key=self.key,
                                  headers={'kid': self.key_id, 'typ': 'JWT'},
                                  algorithm='ES256')
+        for tmp_hook in self.renew_hooks:
+            tmp_hook(self)
         return self._token
 
     def _token_is_valid(self):
@@ -126,18 +169,68 @@ class TokenManager:
         获取token
         :return:
         """
-        if self._token_is_valid():
-            return self._token
-        else:
-            return self.renew_token()
+        with self._lock:
+            if self._token_is_valid():
+                return self._token
+            else:
+                return self.renew_token()
 
     def ensure_valid(self):
         """
         确保token有效
         @return:
         """
-        if not self._token_is_valid():
-            self.renew_token()
+        with self._lock:
+            if not self._token_is_valid():
+                self.renew_token()
+
+
+class RateLimiter:
+    """令牌桶限流器，线程安全，用于多线程并发请求时不超过接口的限流"""
+
+    def __init__(self, rate_per_hour: int = RATE_LIMIT_PER_HOUR, burst: int = None):
+        """
+        初始化方法
+        @param rate_per_hour: 每小时允许的请求数
+        @param burst: 令牌桶的容量，即允许瞬时并发的请求数，默认与rate_per_hour相同
+        """
+        self.rate = rate_per_hour / 3600.0  # 每秒生成的令牌数
+        self.capacity = burst if burst else rate_per_hour
+        self._tokens = float(self.capacity)
+        self._update_time = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._update_time) * self.rate)
+        self._update_time = now
+
+    @property
+    def remaining(self) -> int:
+        """当前剩余可用的令牌数"""
+        with self._lock:
+            self._refill()
+            return int(self._tokens)
+
+    def acquire(self, timeout: Optional[float] = None, reserve: int = 0) -> bool:
+        """
+        获取一个令牌，令牌不足时阻塞等待
+        @param timeout: （可选）最长等待时间，单位：秒，默认一直等待
+        @param reserve: 需要保留的令牌数，剩余令牌多于reserve时才能获取，用于为高优先级的请求预留令牌
+        @return: 是否获取到令牌，超过timeout仍获取不到时返回False
+        """
+        end_time = time.monotonic() + timeout if timeout is not None else None
+        need_tokens = 1 + reserve
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= need_tokens:
+                    self._tokens -= 1
+                    return True
+                wait_second = (need_tokens - self._tokens) / self.rate
+            if end_time is not None and time.monotonic() + wait_second > end_time:
+                return False
+            time.sleep(wait_second)
 
 
 class HttpMethod(Enum):
@@ -154,66 +247,223 @@ class APIError(Exception):
         try:
             self.status_code = int(status_code)
         except (ValueError, TypeError):
-            pass
+            self.status_code = None
         super().__init__(error_text)
 
 
+class DeadlineExceededError(APIError):
+    """deadline设置的总耗时预算已用完，见okappleapi.deadline"""
+
+
+class CircuitOpenError(APIError):
+    """接口分组已熔断，请求没有发出，见okappleapi.circuit_breaker"""
+
+
 class APIAgent:
     """api客户端"""
 
-    def __init__(self, token_manager: TokenManager, timeout=None):
+    def __init__(self, token_manager: TokenManager, timeout=None,
+                 rate_limiter: Optional[RateLimiter] = None, base_api: str = BASE_API,
+                 transport: Optional[Transport] = None, record_path: Union[str, Path, None] = None,
+                 circuit_breaker: Optional[CircuitBreaker] = None,
+                 dispatcher: Optional[PriorityDispatcher] = None):
+        """
+        初始化方法
+        @param token_manager: TokenManager对象
+        @param timeout: 单次请求的超时时间，单位：秒
+        @param rate_limiter: 限流器，多个APIAgent使用同一个key时，可共用一个限流器，默认新建一个
+        @param base_api: 接口的根地址，默认BASE_API，可指向本地的模拟服务器
+        @param transport: 传输层，默认RequestsTransport，可替换为MemoryTransport、ReplayTransport等
+        @param record_path: （可选）录制文件路径，传入时将所有的请求/响应/耗时写入此jsonl文件，
+                            Authorization会被隐藏，可由ReplayTransport回放；调用close()后写入完成
+        @param circuit_breaker: （可选）熔断器，连续失败后快速失败，抛出CircuitOpenError，可多个APIAgent共用，
+                                默认None，即不熔断
+        @param dispatcher: （可选）按优先级（okappleapi.priority）分配并发数、限流令牌，可多个APIAgent共用，
+                           默认None，即不限制并发数、不为高优先级预留；max_concurrency需要与连接池的大小相匹配
+        """
         self.timeout = timeout
         self.token_manager = token_manager
+        self.rate_limiter = rate_limiter if rate_limiter else RateLimiter()
+        self.base_api = base_api
+        self.transport = transport if transport else RequestsTransport()
+        if record_path:
+            self.transport = RecordingTransport(self.transport, record_path)
+        self.circuit_breaker = circuit_breaker
+        self.dispatcher = dispatcher
+        # 每次请求（包括重试、上传分片）前后调用，参数为RequestEvent，为空时没有额外开销
+        self.before_hooks: List[Callable[[RequestEvent], None]] = []
+        self.after_hooks: List[Callable[[RequestEvent], None]] = []
+
+    def close(self):
+        """关闭传输层，释放连接"""
+        self.transport.close()
+
+    def _log_extra(self, url: str, attempt: int = 0, start_time: float = None) -> Dict:
+        """
+        请求日志的extra字段，仅在需要输出日志时调用
+        @param url: 完整的url
+        @param attempt: 第几次尝试，0为首次请求
+        @param start_time: （可选）请求开始的time.perf_counter()，用于计算duration_ms
+        @return:
+        """
+        duration_ms = round((time.perf_counter() - start_time) * 1000, 1) if start_time else '-'
+        return {'account': self.token_manager.key_id, 'endpoint': endpoint_template(url),
+                'duration_ms': duration_ms, 'retry': attempt}
+
+    def _check_deadline(self, url: str) -> Optional[float]:
+        """
+        检查deadline的剩余预算
+        @param url: 将要请求的url，用于错误信息
+        @return: 本次请求的超时时间，即timeout与剩余预算中较小的一个
+        """
+        timeout = effective_timeout(self.timeout)
+        if timeout is not None and timeout <= 0:
+            raise DeadlineExceededError(f'deadline exceeded before request: {url}')
+        return timeout
+
+    def _send(self, method: HttpMethod, url: str, headers: Dict, data, attempt: int = 0,
+              timeout: Optional[float] = None):
+        """
+        通过传输层发送请求，有hook时在请求前后调用；
+        有circuit_breaker时，熔断时不发出请求，直接抛出CircuitOpenError，连接失败、超时、5xx计为熔断器的一次失败；
+        有dispatcher时，并发数由dispatcher按当前的优先级分配
+        @param attempt: 第几次尝试，0为首次请求，大于0为重试
+        @param timeout: 本次请求的超时时间
+        @return: TransportResponse对象
+        """
+        if self.dispatcher is None:
+            return self._send_with_circuit(method, url, headers, data, attempt, timeout)
+        priority_value = current_priority()
+        if not self.dispatcher.acquire(priority_value, timeout=remaining_time()):
+            raise DeadlineExceededError(f'deadline exceeded while waiting for dispatcher: {url}')
+        try:
+            return self._send_with_circuit(method, url, headers, data, attempt, timeout)
+        finally:
+            self.dispatcher.release(priority_value)
+
+    def _send_with_circuit(self, method: HttpMethod, url: str, headers: Dict, data, attempt: int,
+                           timeout: Optional[float]):
+        circuit_breaker = self.circuit_breaker
+        if circuit_breaker is None:
+            return self._transport_send(method, url, headers, data, attempt, timeout)
+        if not circuit_breaker.allow(url):
+            raise CircuitOpenError(f'circuit open for {endpoint_template(url)}, '
+                                   f'fail fast: {method.name} {url}')
+        try:
+            result = self._transport_send(method, url, headers, data, attempt, timeout)
+        except TransportTimeout:
+            if timeout != self.timeout:
+                # 被deadline缩短的超时，不是服务端的故障
+                circuit_breaker.release(url)
+            else:
+                circuit_breaker.record_failure(url)
+            raise
+        except TransportError as e:
+            if e.status_code is not None and e.status_code < 500:
+                circuit_breaker.record_success(url)
+            else:
+                circuit_breaker.record_failure(url)
+            raise
+        except BaseException:
+            circuit_breaker.release(url)
+            raise
+        if result.status_code >= 500:
+            circuit_breaker.record_failure(url)
+        else:
+            circuit_breaker.record_success(url)
+        return result
+
+    def _transport_send(self, method: HttpMethod, url: str, headers: Dict, data, attempt: int,
+                        timeout: Optional[float]):
+        if self.before_hooks or self.after_hooks:
+            return self._send_with_hooks(method, url, headers, data, attempt, timeout)
+        return self.transport.send(method.name, url, headers=headers, data=data, timeout=timeout)
+
+    def _send_with_hooks(self, method: HttpMethod, url: str, headers: Dict, data, attempt: int,
+                         timeout: Optional[float]):
+        event = RequestEvent(method.name, url, attempt=attempt)
+        for tmp_hook in self.before_hooks:
+            tmp_hook(event)
+        try:
+            result = self.transport.send(method.name, url, headers=headers, data=data,
+                                         timeout=timeout)
+        except TransportError as e:
+            event.finish(error=e)
+            for tmp_hook in self.after_hooks:
+                tmp_hook(event)
+            raise
+        event.finish(result)
+        for tmp_hook in self.after_hooks:
+            tmp_hook(event)
+        return result
+
+    def _full_url(self, path: str, params: Dict = None, filters: Dict = None,
+                  fields: Dict = None) -> str:
+        """创建完整的url，根地址为self.base_api"""
+        return create_full_url(path, params=params, filters=filters, fields=fields,
+                               base_api=self.base_api)
 
     def _api_call(self, url, method=HttpMethod.GET, headers=None, post_data=None, verbose=False,
-                  retry_num=2, retry_judge_func=None) -> Dict:
+                  retry_num=2, retry_judge_func=None, _attempt=0) -> Dict:
         """
         发起请求
         @param url: 完整的url
         @param method: http方法类型
         @param post_data: post类型时，传递的body参数
-        @param verbose: 是否打印详细信息，默认False
+        @param verbose: 是否以INFO级别输出详细日志（需配置logging，见log.setup_logging），默认False
         @param retry_num: 请求失败后，如果需要重试，重试的次数，默认重试2次
         @param retry_judge_func: 判断是否需要重试方法，该方法需要有2个参数，2个返回值，默认为空代表返回YES
         @return:
         """
-        if verbose:
-            print(url)
+        log_level = verbose_level(verbose)
+        is_log = logger.isEnabledFor(log_level)
         headers = headers if headers else {}
         headers["Authorization"] = f"Bearer {self.token_manager.token}"
+        if self.circuit_breaker is not None and self.circuit_breaker.is_open(url):
+            raise CircuitOpenError(f'circuit open for {endpoint_template(url)}, '
+                                   f'fail fast: {method.name} {url}')
+        reserve = self.dispatcher.rate_reserve(current_priority(), self.rate_limiter.capacity) \
+            if self.dispatcher is not None else 0
+        if not self.rate_limiter.acquire(timeout=remaining_time(), reserve=reserve):
+            raise DeadlineExceededError(f'deadline exceeded while waiting for rate limiter: {url}')
+        timeout = self._check_deadline(url)
 
+        if method in (HttpMethod.POST, HttpMethod.PATCH):
+            if is_log and post_data:
+                logger.log(log_level, '%s %s body: %s', method.name, url, post_data,
+                           extra=self._log_extra(url, _attempt))
+            headers["Content-Type"] = "application/json"
+            data = json.dumps(post_data)
+        elif method == HttpMethod.PUT:
+            data = post_data
+        else:
+            data = None
+        start_time = time.perf_counter()
         try:
-            if method == HttpMethod.GET:
-                result = requests.get(url, headers=headers, timeout=self.timeout)
-            elif method == HttpMethod.POST:
-                if verbose and post_data:
-                    print(f'post-body: {post_data}')
-                headers["Content-Type"] = "application/json"
-                result = requests.post(url=url, headers=headers, data=json.dumps(post_data),
-                                       timeout=self.timeout)
-            elif method == HttpMethod.PATCH:
-                headers["Content-Type"] = "application/json"
-                result = requests.patch(url=url, headers=headers, data=json.dumps(post_data),
-                                        timeout=self.timeout)
-            elif method == HttpMethod.DELETE:
-                result = requests.delete(url=url, headers=headers, timeout=self.timeout)
-            elif method == HttpMethod.PUT:
-                result = requests.put(url=url, headers=headers, data=post_data, timeout=self.timeout)
-            else:
-                raise APIError("Unknown HTTP method")
-        except requests.exceptions.Timeout:
+            result = self._send(method, url, headers, data, attempt=_attempt, timeout=timeout)
+        except TransportTimeout:
+            logger.warning('%s %s timeout after %.3fs', method.name, url, timeout,
+                           extra=self._log_extra(url, _attempt, start_time))
+            if timeout != self.timeout:
+                raise DeadlineExceededError(f'deadline exceeded after {timeout:.3f} seconds: {url}')
             raise APIError(f"Read timeout after {self.timeout} seconds")
+        except TransportError as e:
+            # 连接失败等，转换为APIError，调用方只需要处理APIError
+            raise APIError(f'{method.name} {url} failed: {e}', status_code=e.status_code) from e
 
         try:
             json_info = result.json()
         except Exception:
             json_info = {}
 
-        if not json_info:
-            result.raise_for_status()
+        if not json_info and result.status_code >= 400:
+            # 没有json的错误响应，例如网关返回的502
+            raise APIError(f'{result.status_code} error for url: {url}',
+                           status_code=result.status_code)
 
-        if verbose:
-            pprint(json_info)
+        if is_log:
+            logger.log(log_level, '%s %s -> %s, response: %s', method.name, url, result.status_code,
+                       json_info, extra=self._log_extra(url, _attempt, start_time))
         if 'errors' in json_info:
             errors = list(json_info['errors'])
             for error_dict in errors:
@@ -227,30 +477,53 @@ class APIAgent:
                     is_retry, sleep_time = retry_judge_func(code=code, status=status)
                 if not is_retry:
                     continue
-                pprint(error_dict)
-                print(f'retry_num: {retry_num}, will sleep {sleep_time}s, retry url: {url}')
+                logger.warning('%s %s -> %s, retry_num: %s, will sleep %ss, error: %s',
+                               method.name, url, result.status_code, retry_num, sleep_time,
+                               error_dict, extra=self._log_extra(url, _attempt, start_time))
+                remaining = remaining_time()
+                if remaining is not None and remaining <= sleep_time:
+                    raise DeadlineExceededError(f'deadline exceeded, can not retry: {url}, '
+                                                f'errors: {errors}', error_list=errors,
+                                                status_code=result.status_code)
                 if sleep_time > 0:
                     time.sleep(sleep_time)
                 return self._api_call(url=url, method=method, post_data=post_data,
-                                      verbose=verbose, retry_num=(retry_num - 1))
+                                      verbose=verbose, retry_num=(retry_num - 1),
+                                      _attempt=_attempt + 1)
 
             raise APIError(str(errors), error_list=errors, status_code=result.status_code)
 
         return json_info
 
+    def _iter_pages(self, url: str, verbose=False):
+        """
+        分页请求，依次返回每一页的结果，直到没有links.next为止
+        @param url: 第一页的完整url
+        @param verbose: 是否以INFO级别输出详细日志（需配置logging，见log.setup_logging），默认False
+        @return: 每一页结果字典的生成器
+        """
+        next_url = url
+        while next_url:
+            result_dict = self._api_call(next_url, verbose=verbose)
+            yield result_dict
+
+            next_url = result_dict.get('links', {}).get('next')
+            if next_url:
+                logger.log(verbose_level(verbose), 'next page: %s', next_url)
+
     def list_certificates(self, filters: Dict = None, verbose=False) -> List[Certificate]:
         """
         certificate列表
         https://developer.apple.com/documentation/appstoreconnectapi/list_and_download_certificates
         @param filters: 筛选器
-        @param verbose: 是否打印详细信息，默认False
+        @param verbose: 是否以INFO级别输出详细日志（需配置logging，见log.setup_logging），默认False
         @return:
         """
         endpoint = '/v1/certificates'
         params = {
             'limit': MAX_LIMIT
         }
-        url = create_full_url(endpoint, params, filters)
+        url = self._full_url(endpoint, params, filters)
         result_dict = self._api_call(url, verbose=verbose)
         model_list = []
         for tmp_dict in result_dict.get('data', []):
@@ -263,11 +536,11 @@ class APIAgent:
         下载签名证书，扩展名一般为 .cer
         @param cer_id: 证书id
         @param filters: 筛选器
-        @param verbose: 是否打印详细信息，默认False
+        @param verbose: 是否以INFO级别输出详细日志（需配置logging，见log.setup_logging），默认False
         @return: Certificate证书对象
         """
         endpoint = f'/v1/certificates/{cer_id}'
-        url = create_full_url(endpoint, filters=filters)
+        url = self._full_url(endpoint, filters=filters)
         result_dict = self._api_call(url, verbose=verbose)
         tmp_dict = result_dict.get('data', {})
         return Certificate(tmp_dict) if tmp_dict else None
@@ -279,11 +552,11 @@ class APIAgent:
         https://developer.apple.com/documentation/appstoreconnectapi/create_a_certificate
         @param csr_content: csr内容字符串（即certSigningRequest文件里 begin和end之间的内容，同时去除换行）
         @param certificate_type: 证书类型，CertificateType枚举类型对应的字符串
-        @param verbose: 是否打印详细信息，默认False
+        @param verbose: 是否以INFO级别输出详细日志（需配置logging，见log.setup_logging），默认False
         @return: Certificate证书对象
         """
         endpoint = 'v1/certificates'
-        url = create_full_url(endpoint)
+        url = self._full_url(endpoint)
         if isinstance(certificate_type, CertificateType):
             certificate_type = certificate_type.value  # 兼容老接口的参数
         post_data = {
@@ -305,14 +578,14 @@ class APIAgent:
         bundle id 列表
         https://developer.apple.com/documentation/appstoreconnectapi/list_bundle_ids
         @param filters: 筛选器
-        @param verbose: 是否打印详细信息，默认False
+        @param verbose: 是否以INFO级别输出详细日志（需配置logging，见log.setup_logging），默认False
         @return:
         """
         endpoint = '/v1/bundleIds'
         params = {
             'limit': MAX_LIMIT
         }
-        tmp_url = create_full_url(endpoint, params, filters)
+        tmp_url = self._full_url(endpoint, params, filters)
 
         model_list = []
         def _req_bundle_id_list(full_url: str):
@@ -323,8 +596,7 @@ class APIAgent:
             links = result_dict.get('links', {})
             next_link = links.get('next')
             if next_link:
-                if verbose:
-                    print('\n\nnext:', next_link)
+                logger.log(verbose_level(verbose), 'next page: %s', next_link)
                 _req_bundle_id_list(next_link)
 
         _req_bundle_id_list(tmp_url)
@@ -341,7 +613,7 @@ class APIAgent:
         @return:
         """
         endpoint = 'v1/bundleIds'
-        url = create_full_url(endpoint)
+        url = self._full_url(endpoint)
         post_data = {
             'data': {
                 'attributes': {
@@ -360,14 +632,14 @@ class APIAgent:
         profile(mobileprovision)列表
         https://developer.apple.com/documentation/appstoreconnectapi/list_and_download_profiles
         @param filters: 筛选器
-        @param verbose: 是否打印详细信息，默认False
+        @param verbose: 是否以INFO级别输出详细日志（需配置logging，见log.setup_logging），默认False
         @return:
         """
         endpoint = '/v1/profiles'
         params = {
             'limit': MAX_LIMIT
         }
-        url = create_full_url(endpoint, params, filters)
+        url = self._full_url(endpoint, params, filters)
         result_dict = self._api_call(url, verbose=verbose)
         model_list = []
         for tmp_dict in result_dict.get('data', []):
@@ -386,7 +658,7 @@ class APIAgent:
         @return:
         """
         endpoint = '/v1/profiles'
-        url = create_full_url(endpoint)
+        url = self._full_url(endpoint)
         post_data = {
             'data': {
                 'type': 'profiles',
@@ -417,7 +689,7 @@ class APIAgent:
         @return:
         """
         endpoint = f'/v1/profiles/{profile_id}'
-        url = create_full_url(endpoint)
+        url = self._full_url(endpoint)
         self._api_call(url, method=HttpMethod.DELETE)
 
     def list_devices(self, filters: Dict = None, verbose=False) -> List[Device]:
@@ -425,7 +697,7 @@ class APIAgent:
         设备列表，仅包含有效状态的设备
         https://developer.apple.com/documentation/appstoreconnectapi/list_devices
         @param filters: 筛选器
-        @param verbose: 是否打印详细信息，默认False
+        @param verbose: 是否以INFO级别输出详细日志（需配置logging，见log.setup_logging），默认False
         @return:
         """
         endpoint = '/v1/devices'
@@ -437,13 +709,31 @@ class APIAgent:
         #     'status': DeviceStatus.ENABLED.value,
         #     'platform': BundleIdPlatform.IOS.value
         # }
-        url = create_full_url(endpoint, params, filters)
-        result_dict = self._api_call(url, verbose=verbose)
+        url = self._full_url(endpoint, params, filters)
         model_list = []
-        for tmp_dict in result_dict['data']:
-            model_list.append(Device(tmp_dict))
+        for result_dict in self._iter_pages(url, verbose=verbose):
+            for tmp_dict in result_dict['data']:
+                model_list.append(Device(tmp_dict))
         return model_list
 
+    def list_device_ids(self, filters: Dict = None, verbose=False) -> List[str]:
+        """
+        所有设备的id列表，只请求udid字段（fields[devices]），响应体比list_devices小很多，用于增量同步
+        https://developer.apple.com/documentation/appstoreconnectapi/list_devices
+        @param filters: 筛选器
+        @param verbose: 是否以INFO级别输出详细日志（需配置logging，见log.setup_logging），默认False
+        @return:
+        """
+        endpoint = '/v1/devices'
+        params = {
+            'limit': MAX_LIMIT
+        }
+        url = self._full_url(endpoint, params, filters, fields={'devices': 'udid'})
+        id_list = []
+        for result_dict in self._iter_pages(url, verbose=verbose):
+            id_list.extend(tmp_dict['id'] for tmp_dict in result_dict['data'])
+        return id_list
+
     def register_a_device(self, device_info: DeviceCreateReqAttrs) -> \
             Tuple[Dict, Optional[Device]]:
         """
@@ -453,7 +743,7 @@ class APIAgent:
         @return:
         """
         endpoint = '/v1/devices'
-        url = create_full_url(endpoint)
+        url = self._full_url(endpoint)
         post_data = {
             'data': {
                 'attributes': device_info._asdict(),
@@ -461,7 +751,8 @@ class APIAgent:
             }
         }
 
-        result = self._api_call(url, method=HttpMethod.POST, post_data=post_data)
+        result = self._api_call(url, method=HttpMethod.POST, post_data=post_data,
+                                retry_judge_func=is_not_conflict_error)
         if isinstance(result, dict) and result['data']:
             return result, Device(result['data'])
         else:
@@ -482,7 +773,7 @@ class APIAgent:
             device_info['name'] = device_name
 
         endpoint = f'/v1/devices/{device_id}'
-        url = create_full_url(endpoint)
+        url = self._full_url(endpoint)
         post_data = {
             'data': {
                 'attributes': device_info,
@@ -504,11 +795,11 @@ class APIAgent:
         https://developer.apple.com/documentation/appstoreconnectapi/list_all_capabilities_for_a_bundle_id
         @param inner_bundle_id: BundleId的内部id
         @param filters: 筛选器
-        @param verbose: 是否打印详细信息，默认False
+        @param verbose: 是否以INFO级别输出详细日志（需配置logging，见log.setup_logging），默认False
         @return:
         """
         endpoint = f'/v1/bundleIds/{inner_bundle_id}/bundleIdCapabilities'
-        url = create_full_url(endpoint, filters=filters)
+        url = self._full_url(endpoint, filters=filters)
         result_dict = self._api_call(url, verbose=verbose)
         model_list = []
         for tmp_dict in result_dict.get('data', []):
@@ -524,11 +815,11 @@ class APIAgent:
         @param inner_bundle_id: BundleId的内部id
         @param capability_type: CapabilityType类型对应的字符串
         @param settings: （可选）设置信息列表，见：https://developer.apple.com/documentation/appstoreconnectapi/capabilitysetting
-        @param verbose: 是否打印详细信息，默认False
+        @param verbose: 是否以INFO级别输出详细日志（需配置logging，见log.setup_logging），默认False
         @return:
         """
         endpoint = '/v1/bundleIdCapabilities'
-        url = create_full_url(endpoint)
+        url = self._full_url(endpoint)
 
         attributes = {'capabilityType': capability_type}
         if settings:
@@ -554,6 +845,37 @@ class APIAgent:
         else:
             return result, None
 
+    def modify_a_capabilities(self, capability_id: str, capability_type: str,
+                              settings: Optional[List] = None, verbose=False) -> \
+            Tuple[Dict, Optional[BundleIdCapability]]:
+        """
+        修改 bundleID 的一个能力的设置
+        https://developer.apple.com/documentation/appstoreconnectapi/modify_a_capability_configuration
+        @param capability_id: 代表capability的id
+        @param capability_type: CapabilityType类型对应的字符串
+        @param settings: 设置信息列表，见：https://developer.apple.com/documentation/appstoreconnectapi/capabilitysetting
+        @param verbose: 是否以INFO级别输出详细日志（需配置logging，见log.setup_logging），默认False
+        @return:
+        """
+        endpoint = f'/v1/bundleIdCapabilities/{capability_id}'
+        url = self._full_url(endpoint)
+        post_data = {
+            'data': {
+                'attributes': {
+                    'capabilityType': capability_type,
+                    'settings': settings or []
+                },
+                'id': capability_id,
+                'type': 'bundleIdCapabilities'
+            }
+        }
+
+        result = self._api_call(url, method=HttpMethod.PATCH, post_data=post_data, verbose=verbose)
+        if isinstance(result, dict) and result['data']:
+            return result, BundleIdCapability(result['data'])
+        else:
+            return result, None
+
     def disable_a_capabilities(self, capability_id: str):
         """
         删除bundleId的一个 capability/能力
@@ -562,67 +884,67 @@ class APIAgent:
         @return:
         """
         endpoint = f'/v1/bundleIdCapabilities/{capability_id}'
-        url = create_full_url(endpoint)
+        url = self._full_url(endpoint)
         self._api_call(url, method=HttpMethod.DELETE)
 
-    def list_apps(self, filters: Dict = None, verbose=False) -> List[DataModel]:
+    def list_apps(self, filters: Dict = None, verbose=False) -> List[App]:
         """
         App列表
         https://developer.apple.com/documentation/appstoreconnectapi/list_apps
         @param filters: 筛选器
-        @param verbose: 是否打印详细信息，默认False
+        @param verbose: 是否以INFO级别输出详细日志（需配置logging，见log.setup_logging），默认False
         @return:
         """
         endpoint = '/v1/apps'
         params = {
             'limit': MAX_LIMIT
         }
-        url = create_full_url(endpoint, params, filters)
-        result_dict = self._api_call(url, verbose=verbose)
-        app_list = []
-        for tmp_dict in result_dict['data']:
-            app_list.append(DataModel.from_dict(tmp_dict))
-        return app_list
+        url = self._full_url(endpoint, params, filters)
+        model_list = []
+        for result_dict in self._iter_pages(url, verbose=verbose):
+            for tmp_dict in result_dict['data']:
+                model_list.append(App(tmp_dict))
+        return model_list
     
-    def list_app_info_for_app(self, id: str, filters: Dict = None, verbose=False) -> List[DataModel]:
+    def list_app_info_for_app(self, id: str, filters: Dict = None, verbose=False) -> List[AppInfo]:
         """
         App信息列表
         https://developer.apple.com/documentation/appstoreconnectapi/list_all_app_infos_for_an_app
         @param id: App的内部id(例如：list_apps接口中获取到的id)
         @param filters: 筛选器
-        @param verbose: 是否打印详细信息，默认False
+        @param verbose: 是否以INFO级别输出详细日志（需配置logging，见log.setup_logging），默认False
         @return:
         """
         endpoint = f'/v1/apps/{id}/appInfos'
         params = {
             'limit': MAX_LIMIT
         }
-        url = create_full_url(endpoint, params, filters)
-        result_dict = self._api_call(url, verbose=verbose)
-        app_list = []
-        for tmp_dict in result_dict['data']:
-            app_list.append(DataModel.from_dict(tmp_dict))
-        return app_list
+        url = self._full_url(endpoint, params, filters)
+        model_list = []
+        for result_dict in self._iter_pages(url, verbose=verbose):
+            for tmp_dict in result_dict['data']:
+                model_list.append(AppInfo(tmp_dict))
+        return model_list
     
-    def list_appstore_version(self, id: str, filters: Dict = None, verbose=False) -> List[DataModel]:
+    def list_appstore_version(self, id: str, filters: Dict = None, verbose=False) -> List[AppStoreVersion]:
         """
         App提审版本列表
         https://developer.apple.com/documentation/appstoreconnectapi/list_all_app_store_version_localizations_for_an_app_store_version
-        @param id: App信息id(例如：list_app_info_for_app接口中获取到的id)
+        @param id: App的内部id(例如：list_apps接口中获取到的id)
         @param filters: 筛选器
-        @param verbose: 是否打印详细信息，默认False
+        @param verbose: 是否以INFO级别输出详细日志（需配置logging，见log.setup_logging），默认False
         @return:
         """
         endpoint = f'/v1/apps/{id}/appStoreVersions'
         params = {
             'limit': MAX_LIMIT
         }
-        url = create_full_url(endpoint, params, filters)
-        result_dict = self._api_call(url, verbose=verbose)
-        list = []
-        for tmp_dict in result_dict['data']:
-            list.append(DataModel.from_dict(tmp_dict))
-        return list
+        url = self._full_url(endpoint, params, filters)
+        model_list = []
+        for result_dict in self._iter_pages(url, verbose=verbose):
+            for tmp_dict in result_dict['data']:
+                model_list.append(AppStoreVersion(tmp_dict))
+        return model_list
     
     def list_localization(self, id: str, filters: Dict = None, verbose=False) -> List[AppInfoLocalization]:
         """
@@ -630,14 +952,14 @@ class APIAgent:
         https://developer.apple.com/documentation/appstoreconnectapi/list_all_app_store_version_localizations_for_an_app_store_version
         @param id: App提审版本id(例如：list_appstore_version接口中获取到的id)
         @param filters: 筛选器
-        @param verbose: 是否打印详细信息，默认False
+        @param verbose: 是否以INFO级别输出详细日志（需配置logging，见log.setup_logging），默认False
         @return:
         """
         endpoint = f'/v1/appStoreVersions/{id}/appStoreVersionLocalizations'
         params = {
             'limit': MAX_LIMIT
         }
-        url = create_full_url(endpoint, params, filters)
+        url = self._full_url(endpoint, params, filters)
         result_dict = self._api_call(url, verbose=verbose)
         list = []
         for tmp_dict in result_dict['data']:
@@ -650,13 +972,13 @@ class APIAgent:
         https://developer.apple.com/documentation/appstoreconnectapi/create_an_app_store_version_localization
         @param id: App提审版本id(例如：list_appstore_version接口中获取到的id)
         @param locale: 语言代码（例如：zh-Hans， en-US）
-        @param verbose: 是否打印详细信息，默认False
+        @param verbose: 是否以INFO级别输出详细日志（需配置logging，见log.setup_logging），默认False
         @return:
         """
         endpoint = '/v1/appStoreVersionLocalizations'
         post_data = {
             'data': {
-                'type': 'appInfoLocalizations',
+                'type': 'appStoreVersionLocalizations',
                 'attributes': {
                     'locale': locale
                 },
@@ -670,7 +992,7 @@ class APIAgent:
                 }
             }
         }
-        url = create_full_url(endpoint)
+        url = self._full_url(endpoint)
         result = self._api_call(url, method=HttpMethod.POST, post_data=post_data, verbose=verbose)
         data = result.get('data', {})
         if data:
@@ -682,20 +1004,51 @@ class APIAgent:
         https://developer.apple.com/documentation/appstoreconnectapi/list_all_app_screenshot_sets_for_an_app_store_version_localization
         @param id: 本地化信息id(例如：list_localization接口中获取到的id)
         @param filters: 筛选器
-        @param verbose: 是否打印详细信息，默认False
+        @param verbose: 是否以INFO级别输出详细日志（需配置logging，见log.setup_logging），默认False
         @return:
         """
         endpoint = f'/v1/appStoreVersionLocalizations/{id}/appScreenshotSets'
         params = {
             'limit': MAX_LIMIT
         }
-        url = create_full_url(endpoint, params=params, filters=filters)
+        url = self._full_url(endpoint, params=params, filters=filters)
         result_dict = self._api_call(url, verbose=verbose)
         list = []
         for tmp_dict in result_dict['data']:
             list.append(AppScreenshotSet(tmp_dict))
         return list
     
+    def list_app_screenshot_set_with_screenshots(self, id: str, filters: Dict = None,
+                                                 verbose=False) \
+            -> List[Tuple[AppScreenshotSet, List[AppScreenshot]]]:
+        """
+        截图集列表，通过include=appScreenshots，一次请求同时获取各截图集中的截图
+        https://developer.apple.com/documentation/appstoreconnectapi/list_all_app_screenshot_sets_for_an_app_store_version_localization
+        @param id: 本地化信息id(例如：list_localization接口中获取到的id)
+        @param filters: 筛选器
+        @param verbose: 是否以INFO级别输出详细日志（需配置logging，见log.setup_logging），默认False
+        @return: [(截图集, 按顺序排列的截图列表)]
+        """
+        endpoint = f'/v1/appStoreVersionLocalizations/{id}/appScreenshotSets'
+        params = {
+            'limit': MAX_LIMIT,
+            'include': 'appScreenshots',
+            'limit[appScreenshots]': 50
+        }
+        url = self._full_url(endpoint, params=params, filters=filters)
+        result_list = []
+        for result_dict in self._iter_pages(url, verbose=verbose):
+            screenshot_dict = {tmp_dict['id']: AppScreenshot(tmp_dict)
+                               for tmp_dict in result_dict.get('included', [])
+                               if tmp_dict.get('type') == 'appScreenshots'}
+            for tmp_dict in result_dict['data']:
+                relationship = tmp_dict.get('relationships', {}).get('appScreenshots', {})
+                screenshot_list = [screenshot_dict[tmp_data['id']]
+                                   for tmp_data in relationship.get('data') or []
+                                   if tmp_data['id'] in screenshot_dict]
+                result_list.append((AppScreenshotSet(tmp_dict), screenshot_list))
+        return result_list
+
     def create_app_screenshot_set(self, id: str, screenshotType: ScreenshotDisplayType, verbose=False) -> AppScreenshotSet:
         """创建App截图集"""
         """
@@ -703,7 +1056,7 @@ class APIAgent:
         https://developer.apple.com/documentation/appstoreconnectapi/create_an_app_screenshot_set
         @param id: 本地化信息id(例如：list_localization接口中获取到的id)
         @param screenshotType: 截图集标识（枚举值。具体：https://developer.apple.com/documentation/appstoreconnectapi/screenshotdisplaytype）
-        @param verbose: 是否打印详细信息，默认False
+        @param verbose: 是否以INFO级别输出详细日志（需配置logging，见log.setup_logging），默认False
         @return:
         """
         endpoint = '/v1/appScreenshotSets'
@@ -723,7 +1076,7 @@ class APIAgent:
                 }
             }
         }
-        url = create_full_url(endpoint)
+        url = self._full_url(endpoint)
         result = self._api_call(url, method=HttpMethod.POST, post_data=post_data, verbose=verbose)
         data = result.get('data', {})
         if data:
@@ -735,32 +1088,48 @@ class APIAgent:
         https://developer.apple.com/documentation/appstoreconnectapi/list_all_app_screenshots_for_an_app_screenshot_set
         @param id: 截图集id(例如：list_app_screenshot_set接口中获取到的id)
         @param filters: 筛选器
-        @param verbose: 是否打印详细信息，默认False
+        @param verbose: 是否以INFO级别输出详细日志（需配置logging，见log.setup_logging），默认False
         @return:
         """
         endpoint = f'/v1/appScreenshotSets/{id}/appScreenshots'
         params = {
             'limit': MAX_LIMIT
         }
-        url = create_full_url(endpoint, params=params, filters=filters)
+        url = self._full_url(endpoint, params=params, filters=filters)
         result_dict = self._api_call(url, verbose=verbose)
         list = []
         for tmp_dict in result_dict['data']:
             list.append(AppScreenshot(tmp_dict))
         return list
     
+    def reorder_app_screenshots(self, id: str, screenshot_ids: List[str], verbose=False):
+        """
+        设置截图集中截图的顺序（替换截图集中的所有截图）
+        https://developer.apple.com/documentation/appstoreconnectapi/replace_all_app_screenshots_for_an_app_screenshot_set
+        @param id: 截图集id(例如：list_app_screenshot_set接口中获取到的id)
+        @param screenshot_ids: 按顺序排列的截图id列表
+        @param verbose: 是否以INFO级别输出详细日志（需配置logging，见log.setup_logging），默认False
+        @return:
+        """
+        endpoint = f'/v1/appScreenshotSets/{id}/relationships/appScreenshots'
+        post_data = {
+            'data': [{'type': 'appScreenshots', 'id': tmp_id} for tmp_id in screenshot_ids]
+        }
+        url = self._full_url(endpoint)
+        self._api_call(url, method=HttpMethod.PATCH, post_data=post_data, verbose=verbose)
+
     def delete_app_screenshot(self, id: str, verbose=False):
         """
         删除App截图集中的某个截图
         https://developer.apple.com/documentation/appstoreconnectapi/delete_an_app_screenshot
         @param id: 截图id(例如：list_app_screenshott接口中获取到的id)
-        @param verbose: 是否打印详细信息，默认False
+        @param verbose: 是否以INFO级别输出详细日志（需配置logging，见log.setup_logging），默认False
         @return: 
         """
         if not id:
             return 
         endpoint = f'/v1/appScreenshots/{id}'
-        url = create_full_url(endpoint)
+        url = self._full_url(endpoint)
         self._api_call(url, method=HttpMethod.DELETE, verbose=verbose)
 
     def create_app_screenshot(self, id: str, file_path: str, verbose=False) -> AppScreenshot:
@@ -768,7 +1137,7 @@ class APIAgent:
         在截图集中创建一个App截图
         https://developer.apple.com/documentation/appstoreconnectapi/create_an_app_screenshot
         @param id: 截图集id(例如：list_app_screenshot_set接口中获取到的id)
-        @param verbose: 是否打印详细信息，默认False
+        @param verbose: 是否以INFO级别输出详细日志（需配置logging，见log.setup_logging），默认False
         @return: 
         """
         endpoint = f'/v1/appScreenshots'
@@ -789,41 +1158,113 @@ class APIAgent:
                 }
             }
         }
-        url = create_full_url(endpoint)
+        url = self._full_url(endpoint)
         result = self._api_call(url, method=HttpMethod.POST, post_data=post_data, verbose=verbose)
         data = result.get('data', {})
         if data:
             return AppScreenshot(data)
     
-    def upload_app_screenshot(self, screenshot: AppScreenshot, file_path: str, verbose=False):
+    def _upload_call(self, url: str, method: HttpMethod, headers: Dict, data, retry_num=2,
+                     verbose=False):
         """
-        上传一个App截图
-        https://developer.apple.com/documentation/appstoreconnectapi/uploading_assets_to_app_store_connect
-        @param id: 截图集id(例如：list_app_screenshot_set接口中获取到的id)
-        @param verbose: 是否打印详细信息，默认False)
+        上传一个分片，请求的是上传服务器，不经过限流器、不携带token、不解析json，失败时重试
+        @param url: 上传的url
+        @param method: http方法类型
+        @param headers: uploadOperation中的requestHeaders
+        @param data: 分片数据，支持bytes、memoryview
+        @param retry_num: 失败后重试的次数，默认重试2次
+        @param verbose: 是否以INFO级别输出详细日志（需配置logging，见log.setup_logging），默认False
         @return:
         """
+        attempt = 0
+        while True:
+            start_time = time.perf_counter()
+            timeout = self._check_deadline(url)
+            try:
+                result = self._send(method, url, headers, data, attempt=attempt, timeout=timeout)
+                result.raise_for_status()
+                log_level = verbose_level(verbose)
+                if logger.isEnabledFor(log_level):
+                    logger.log(log_level, 'upload %s %s, %s bytes', method.name, url, len(data),
+                               extra=self._log_extra(url, attempt, start_time))
+                return
+            except TransportError as e:
+                remaining = remaining_time()
+                if remaining is not None and remaining <= 1:
+                    raise DeadlineExceededError(f'deadline exceeded, upload failed: {url}, {e}')
+                if retry_num <= 0:
+                    raise APIError(f'upload failed: {url}, {e}', status_code=e.status_code) from e
+                logger.warning('upload %s %s failed, retry_num: %s, will sleep 1s, error: %s',
+                               method.name, url, retry_num, e,
+                               extra=self._log_extra(url, attempt, start_time))
+                retry_num -= 1
+                attempt += 1
+                time.sleep(1)
+
+    def upload_app_screenshot(self, screenshot: AppScreenshot, file_path: str,
+                              max_workers: int = UPLOAD_WORKERS, verbose=False,
+                              upload_operations: List[Dict] = None, skip_offsets=(),
+                              on_chunk_done=None) -> str:
+        """
+        上传一个App截图，各分片在线程池中并发上传，分片数据直接从文件的内存映射中切片，不复制；
+        上传的同时，在当前线程中分块计算文件的md5，可直接传给verify_app_screenshot
+        https://developer.apple.com/documentation/appstoreconnectapi/uploading_assets_to_app_store_connect
+        @param screenshot: create_app_screenshot接口返回的AppScreenshot对象
+        @param file_path: 截图文件路径
+        @param max_workers: 并发上传的分片数，默认4
+        @param verbose: 是否以INFO级别输出详细日志（需配置logging，见log.setup_logging），默认False
+        @param upload_operations: （可选）上传分片信息，默认使用screenshot.attributes中的uploadOperations
+        @param skip_offsets: （可选）已上传完成的分片的offset，这些分片不再上传，用于断点续传
+        @param on_chunk_done: （可选）单个分片上传完成的回调，参数为分片的offset，会在上传线程中调用
+        @return: 文件的md5
+        """
         # 获取上传URL
-        upload_operations = screenshot.attributes['uploadOperations']
+        if not upload_operations:
+            upload_operations = screenshot.attributes.get('uploadOperations')
         if not upload_operations:
             raise ValueError(f'获取截图上传URL失败')
-        for upload_operation in upload_operations:
-            # 分片上传
-            with open(file_path, mode='rb') as file:
-                file.seek(upload_operation['offset'])
-                data = file.read(upload_operation['length'])
-
-            url = upload_operation['url']
-            method = HttpMethod[upload_operation['method']]
-            headers={h['name']: h['value'] for h in upload_operation['requestHeaders']}
-            self._api_call(url, method=method, headers=headers, post_data=data, verbose=verbose)
-    
-    def verify_app_screenshot(self, id: str, file_path: str, verbose=False) -> AppScreenshotState:
+
+        with open(file_path, mode='rb') as file, \
+                mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as file_map:
+
+            def _upload(upload_operation: Dict):
+                # 分片上传
+                offset = upload_operation['offset']
+                url = upload_operation['url']
+                method = HttpMethod[upload_operation['method']]
+                headers = {h['name']: h['value'] for h in upload_operation['requestHeaders']}
+                with memoryview(file_map) as file_view, \
+                        file_view[offset:offset + upload_operation['length']] as data:
+                    self._upload_call(url, method=method, headers=headers, data=data,
+                                      verbose=verbose)
+                if on_chunk_done:
+                    on_chunk_done(offset)
+
+            skip_offsets = set(skip_offsets)
+            with ContextThreadPoolExecutor(max_workers=max_workers) as executor:
+                future_list = [executor.submit(_upload, tmp_operation)
+                               for tmp_operation in upload_operations
+                               if tmp_operation['offset'] not in skip_offsets]
+
+                md5 = hashlib.md5()
+                with memoryview(file_map) as file_view:
+                    for offset in range(0, len(file_view), CHECKSUM_CHUNK_SIZE):
+                        with file_view[offset:offset + CHECKSUM_CHUNK_SIZE] as chunk:
+                            md5.update(chunk)
+
+                for tmp_future in future_list:
+                    tmp_future.result()
+        return md5.hexdigest()
+
+    def verify_app_screenshot(self, id: str, file_path: str = None, verbose=False,
+                              checksum: str = None) -> AppScreenshotState:
         """
         验证App截图集
         https://developer.apple.com/documentation/appstoreconnectapi/verify_an_app_screenshot_set
         @param id: 截图id(例如：create_app_screenshot接口中获取到的id)
-        @param verbose: 是否打印详细信息，默认False
+        @param file_path: 截图文件路径，传了checksum时可不传
+        @param verbose: 是否以INFO级别输出详细日志（需配置logging，见log.setup_logging），默认False
+        @param checksum: （可选）文件的md5，例如upload_app_screenshot的返回值，不传则分块读取file_path计算
         @return: AWAITING_UPLOAD, UPLOAD_COMPLETE, COMPLETE, FAILED
         """
         endpoint = f'/v1/appScreenshots/{id}'
@@ -833,11 +1274,11 @@ class APIAgent:
                 "id": id,
                 "attributes": {
                     "uploaded": True,
-                    "sourceFileChecksum": hashlib.md5(open(file_path, 'rb').read()).hexdigest()
+                    "sourceFileChecksum": checksum if checksum else file_md5(file_path)
                 }
             }
         }
-        url = create_full_url(endpoint)
+        url = self._full_url(endpoint)
         result_dict = self._api_call(url, method=HttpMethod.PATCH, post_data=post_data, verbose=verbose)
         data = result_dict.get('data', {})
         if data:
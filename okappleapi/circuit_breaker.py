@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# _*_ coding:UTF-8 _*_
+"""
+__author__ = 'shede333'
+
+熔断器：按 host + 接口分组（例如profiles、devices、upload）统计连续失败次数，
+App Store Connect故障时快速失败，避免所有并发任务都阻塞到timeout再重试：
+closed（正常） -> 连续失败failure_threshold次 -> open（快速失败）
+-> 经过recovery_timeout秒 -> half_open（只放行一个探测请求） -> 成功则closed，失败则重新open
+"""
+
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+from urllib.parse import urlsplit
+
+from .metrics import endpoint_template
+from .models import EnumAutoName, auto
+
+
+class CircuitState(EnumAutoName):
+    closed = auto()
+    half_open = auto()
+    open = auto()
+
+
+def endpoint_group(url: str) -> str:
+    """
+    url所属的接口分组，即接口模板中的资源类型，例如：
+    /v1/profiles/{id}/devices -> profiles，上传分片的url -> upload
+    @param url: 完整的url
+    @return:
+    """
+    template = endpoint_template(url)
+    if template.startswith('upload:'):
+        return 'upload'
+    return template.split('/')[2]
+
+
+class _Circuit:
+    __slots__ = ('state', 'failure_count', 'open_time', 'is_probing')
+
+    def __init__(self):
+        self.state = CircuitState.closed
+        self.failure_count = 0  # 连续失败次数
+        self.open_time = 0.0  # 进入open状态的time.monotonic()
+        self.is_probing = False  # half_open状态下，是否已有探测请求在进行中
+
+
+class CircuitBreaker:
+    """
+    熔断器，线程安全，多个APIAgent可共用一个；
+    请求前调用allow，请求结束后调用record_success或record_failure
+    """
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30,
+                 group_func: Callable[[str], str] = endpoint_group):
+        """
+        初始化方法
+        @param failure_threshold: 连续失败（包括超时、5xx）多少次后熔断，默认5次，为0时不熔断
+        @param recovery_timeout: 熔断后经过多少秒进入half_open状态，放行一个探测请求，默认30秒
+        @param group_func: url -> 接口分组，默认endpoint_group
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.group_func = group_func
+        # 状态变化后调用，参数为(host, group, CircuitState)，例如MetricsCollector.on_circuit_state
+        self.state_hooks: List[Callable[[str, str, CircuitState], None]] = []
+        self._circuit_dict: Dict[Tuple[str, str], _Circuit] = {}
+        self._lock = threading.Lock()
+
+    def circuit_key(self, url: str) -> Tuple[str, str]:
+        """
+        @param url: 完整的url
+        @return: (host, 接口分组)
+        """
+        return urlsplit(url).netloc, self.group_func(url)
+
+    @staticmethod
+    def _set_state(circuit: _Circuit, state: CircuitState) -> bool:
+        # 在锁内调用，返回状态是否发生变化
+        if circuit.state == state:
+            return False
+        circuit.state = state
+        if state == CircuitState.open:
+            circuit.open_time = time.monotonic()
+        return True
+
+    def _notify(self, key: Tuple[str, str], state: CircuitState):
+        for tmp_hook in self.state_hooks:
+            tmp_hook(key[0], key[1], state)
+
+    def allow(self, url: str) -> bool:
+        """
+        请求前调用，判断是否允许发起请求
+        @param url: 完整的url
+        @return: closed状态，或half_open状态下的探测请求，返回True；其余返回False，即需要快速失败
+        """
+        if self.failure_threshold <= 0:
+            return True
+        key = self.circuit_key(url)
+        with self._lock:
+            circuit = self._circuit_dict.get(key)
+            if circuit is None or circuit.state == CircuitState.closed:
+                return True
+            if circuit.state == CircuitState.open:
+                if time.monotonic() - circuit.open_time < self.recovery_timeout:
+                    return False
+                self._set_state(circuit, CircuitState.half_open)
+                is_changed = True
+            else:
+                is_changed = False
+            if circuit.is_probing:
+                return False
+            circuit.is_probing = True
+        if is_changed:
+            self._notify(key, CircuitState.half_open)
+        return True
+
+    def is_open(self, url: str) -> bool:
+        """url所属分组是否处于open状态且未到探测时间，不占用探测名额，用于在限流器之前快速失败"""
+        with self._lock:
+            circuit = self._circuit_dict.get(self.circuit_key(url))
+            return circuit is not None and circuit.state == CircuitState.open \
+                and time.monotonic() - circuit.open_time < self.recovery_timeout
+
+    def record_success(self, url: str):
+        """请求成功（包括4xx等非故障的响应），重置连续失败次数；探测请求成功时恢复为closed"""
+        if self.failure_threshold <= 0:
+            return
+        key = self.circuit_key(url)
+        with self._lock:
+            circuit = self._circuit_dict.get(key)
+            if circuit is None:
+                return
+            circuit.failure_count = 0
+            circuit.is_probing = False
+            is_changed = self._set_state(circuit, CircuitState.closed)
+        if is_changed:
+            self._notify(key, CircuitState.closed)
+
+    def record_failure(self, url: str):
+        """请求失败（连接失败、超时、5xx），连续失败达到阈值、或探测请求失败时熔断"""
+        if self.failure_threshold <= 0:
+            return
+        key = self.circuit_key(url)
+        with self._lock:
+            circuit = self._circuit_dict.get(key)
+            if circuit is None:
+                circuit = self._circuit_dict[key] = _Circuit()
+            circuit.failure_count += 1
+            is_changed = False
+            if circuit.state == CircuitState.half_open \
+                    or circuit.failure_count >= self.failure_threshold:
+                circuit.is_probing = False
+                is_changed = self._set_state(circuit, CircuitState.open)
+        if is_changed:
+            self._notify(key, CircuitState.open)
+
+    def release(self, url: str):
+        """请求没有结果（例如被deadline中断）时调用，仅释放half_open状态下的探测名额"""
+        key = self.circuit_key(url)
+        with self._lock:
+            circuit = self._circuit_dict.get(key)
+            if circuit is not None:
+                circuit.is_probing = False
+
+    def state(self, url: str) -> CircuitState:
+        """url所属分组的当前状态，open状态已超过recovery_timeout时仍返回open，直到下一次allow"""
+        with self._lock:
+            circuit = self._circuit_dict.get(self.circuit_key(url))
+            return circuit.state if circuit else CircuitState.closed
+
+    def snapshot(self) -> Dict[Tuple[str, str], CircuitState]:
+        """
+        所有出现过失败的分组的当前状态
+        @return: {(host, group): CircuitState}
+        """
+        with self._lock:
+            return {tmp_key: tmp_circuit.state for tmp_key, tmp_circuit in self._circuit_dict.items()}
+
+    def reset(self):
+        """恢复所有分组为closed"""
+        with self._lock:
+            key_list = [tmp_key for tmp_key, tmp_circuit in self._circuit_dict.items()
+                        if tmp_circuit.state != CircuitState.closed]
+            self._circuit_dict.clear()
+        for tmp_key in key_list:
+            self._notify(tmp_key, CircuitState.closed)
@@ -0,0 +1,373 @@
+#!/usr/bin/env python
+# _*_ coding:UTF-8 _*_
+"""
+__author__ = 'shede333'
+
+命令行入口（okappleapi，或python -m okappleapi），结果以json输出到stdout：
+    okappleapi --key-json key.json list devices --filter status=ENABLED
+    okappleapi --key-json key.json register-device --name "iPhone 15" --udid 00008030-...
+    okappleapi --key-json key.json update-profile dev-profile --bundle-id com.example.app --save
+    okappleapi --key-json key.json screenshot-sync VERSION_ID ./screenshots
+--batch时从stdin逐行读取JSON Lines命令，所有命令共用一个APIAgent（token、连接池、限流器）和OKProfileManager（缓存），
+每个命令完成后立即输出一行结果：
+    {"id": 1, "command": "register-device", "name": "iPhone 15", "udid": "00008030-..."}
+    {"id": 1, "command": "register-device", "ok": true, "result": {...}, "duration_ms": 812.3}
+batch中的字段名可以使用命令行参数名（去掉"--"），例如"bundle-id"、"save"，
+也可以使用方法的参数名，例如"bundle_id"、"is_save"，见batch_params
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from enum import Enum
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, TextIO
+
+from .apple_api_agent import APIAgent, TokenManager
+from .deadline import ContextThreadPoolExecutor
+from .log import setup_logging
+from .models import BundleIdPlatform, DeviceCreateReqAttrs, load_device_infos
+from .ok_agent import OKProfileManager
+
+logger = logging.getLogger(__name__)
+
+PROG = 'okappleapi'
+ENV_KEY_JSON = 'OKAPPLEAPI_KEY_JSON'  # 未传入--key-json等参数时，从环境变量读取
+ENV_ISSUER_ID = 'OKAPPLEAPI_ISSUER_ID'
+ENV_KEY_ID = 'OKAPPLEAPI_KEY_ID'
+ENV_KEY = 'OKAPPLEAPI_KEY'
+LIST_RESOURCES = ('devices', 'profiles', 'certificates', 'bundle-ids', 'apps')
+CONTENT_KEYS = ('profileContent', 'certificateContent')  # base64的文件内容，体积较大，默认不输出
+
+
+def to_jsonable(obj, is_with_content=False):
+    """
+    将结果转换为可以json序列化的对象：数据对象转换为接口返回的字典，namedtuple转换为字典，枚举转换为value
+    @param obj: 命令的结果
+    @param is_with_content: 是否保留profileContent、certificateContent，默认False
+    @return:
+    """
+    if obj is None or isinstance(obj, (str, int, float, bool)):
+        return obj
+    if isinstance(obj, Enum):
+        return obj.value
+    if isinstance(obj, (Path, Exception)):
+        return str(obj)
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    if hasattr(obj, '_asdict'):
+        obj = obj._asdict()
+    elif hasattr(obj, 'info_dict'):
+        obj = obj.info_dict
+        if not is_with_content and any(tmp_key in obj.get('attributes', {}) for tmp_key in CONTENT_KEYS):
+            obj = dict(obj, attributes={tmp_key: tmp_value for tmp_key, tmp_value in obj['attributes'].items()
+                                        if tmp_key not in CONTENT_KEYS})
+    if isinstance(obj, dict):
+        return {str(tmp_key): to_jsonable(tmp_value, is_with_content) for tmp_key, tmp_value in obj.items()}
+    if isinstance(obj, (list, tuple, set)):
+        return [to_jsonable(tmp_value, is_with_content) for tmp_value in obj]
+    return str(obj)
+
+
+def cmd_list(manager: OKProfileManager, resource: str, filters: Dict = None,
+             is_with_content=False) -> List:
+    """
+    获取列表
+    @param manager: OKProfileManager对象
+    @param resource: 资源类型，见LIST_RESOURCES
+    @param filters: （可选）筛选器，例如{'status': 'ENABLED'}
+    @param is_with_content: 是否输出profile、证书的文件内容，默认False
+    @return:
+    """
+    agent = manager.agent
+    func_dict = {
+        'devices': agent.list_devices,
+        'profiles': agent.list_profiles,
+        'certificates': agent.list_certificates,
+        'bundle-ids': agent.list_bundle_id,
+        'apps': agent.list_apps,
+    }
+    if resource not in func_dict:
+        raise ValueError(f'unknown resource: {resource}, supported: {", ".join(LIST_RESOURCES)}')
+    return to_jsonable(func_dict[resource](filters=filters), is_with_content=is_with_content)
+
+
+def cmd_register_device(manager: OKProfileManager, name: str = None, udid: str = None,
+                        platform: str = BundleIdPlatform.IOS.value, file: str = None,
+                        is_reenable=False) -> List:
+    """
+    注册设备：与已注册的设备去重，已注册的返回EXISTS
+    @param manager: OKProfileManager对象
+    @param name: 设备名称，与udid一起使用
+    @param udid: 设备的UDID
+    @param platform: 设备的系统类型，默认IOS
+    @param file: （可选）设备信息的json/csv文件，格式见load_device_infos，与name、udid二选一
+    @param is_reenable: 已注册但为DISABLED状态的设备，是否重新启用，默认False
+    @return: 每个设备的DeviceRegisterResult
+    """
+    if file:
+        device_infos = load_device_infos(file)
+    elif udid:
+        device_infos = [DeviceCreateReqAttrs(name or udid, udid, platform.upper())]
+    else:
+        raise ValueError('need udid or file')
+    return to_jsonable(manager.register_devices(device_infos, is_reenable=is_reenable))
+
+
+def cmd_update_profile(manager: OKProfileManager, name: str, bundle_id: str = None,
+                       is_distribution=False, is_save=False, budget: float = None) -> Dict:
+    """
+    更新profile，使用所有的设备、证书，见OKProfileManager.update_profile
+    @param manager: OKProfileManager对象
+    @param name: profile的name
+    @param bundle_id: profile不存在时，使用此bundleId创建
+    @param is_distribution: 是否为发布类型的证书，默认False，即开发类型
+    @param is_save: 是否保存到系统默认的目录下，默认False
+    @param budget: （可选）总耗时上限，单位：秒
+    @return:
+    """
+    profile = manager.update_profile(name, bundle_id_str=bundle_id, is_dev=not is_distribution,
+                                     is_save=is_save, budget=budget)
+    return to_jsonable(profile)
+
+
+def cmd_screenshot_sync(manager: OKProfileManager, version_id: str, root_dir: str,
+                        max_workers: int = 4, is_wait_complete=False,
+                        journal_path: str = None) -> List:
+    """
+    将本地截图目录同步到App Store的一个版本上，见ScreenshotSyncer.sync
+    @param manager: OKProfileManager对象
+    @param version_id: App提审版本的id
+    @param root_dir: 本地截图根目录
+    @param max_workers: 并发同步的截图集数量，默认4
+    @param is_wait_complete: 是否等待截图处理完成，默认False
+    @param journal_path: （可选）上传日志文件路径，用于断点续传
+    @return: 各截图集的同步结果
+    """
+    from .screenshot_sync import ScreenshotSyncer
+
+    syncer = ScreenshotSyncer(manager.agent, max_workers=max_workers,
+                              is_wait_complete=is_wait_complete, journal_path=journal_path)
+    return to_jsonable(syncer.sync(version_id, root_dir))
+
+
+# 命令名 -> 方法，方法的参数名与命令行参数的dest相同
+COMMANDS: Dict[str, Callable] = {
+    'list': cmd_list,
+    'register-device': cmd_register_device,
+    'update-profile': cmd_update_profile,
+    'screenshot-sync': cmd_screenshot_sync,
+}
+
+
+# 命令行参数名（"-"替换为"_"）-> 方法的参数名，仅列出两者不同的
+OPTION_DESTS = {
+    'filter': 'filters',
+    'with_content': 'is_with_content',
+    'reenable': 'is_reenable',
+    'distribution': 'is_distribution',
+    'save': 'is_save',
+    'wait_complete': 'is_wait_complete',
+}
+
+
+def batch_params(params: Dict) -> Dict:
+    """
+    将batch中一行命令的字段转换为方法的参数：命令行参数名（例如"bundle-id"、"save"）转换为参数名，
+    filters也可以是"key=value"字符串的列表，与--filter相同
+    @param params: 一行命令中除id、command外的字段
+    @return:
+    """
+    result = {}
+    for tmp_key, tmp_value in params.items():
+        tmp_key = tmp_key.replace('-', '_')
+        result[OPTION_DESTS.get(tmp_key, tmp_key)] = tmp_value
+    filters = result.get('filters')
+    if isinstance(filters, list):
+        result['filters'] = dict(_parse_filter(tmp_text) for tmp_text in filters)
+    return result
+
+
+def _parse_filter(text: str):
+    key, sep, value = text.partition('=')
+    if not sep:
+        raise argparse.ArgumentTypeError(f'filter需要为key=value的格式：{text}')
+    return key, value
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog=PROG, description='OK App Store Connect API')
+    group = parser.add_argument_group('key', f'默认读取环境变量{ENV_KEY_JSON}，或{ENV_ISSUER_ID}、'
+                                             f'{ENV_KEY_ID}、{ENV_KEY}')
+    group.add_argument('--key-json', help='json配置文件，字段参考TokenManager初始化方法的参数')
+    group.add_argument('--issuer-id')
+    group.add_argument('--key-id')
+    group.add_argument('--key', help='key文件内容，或key文件路径（*.p8）')
+    parser.add_argument('--timeout', type=float, default=60, help='单次请求的超时时间，单位：秒，默认60')
+    parser.add_argument('--base-api', help='接口的根地址，默认App Store Connect')
+    parser.add_argument('--http2', action='store_true', help='使用HTTP/2传输层，需要安装OKAppleAPI[http2]')
+    parser.add_argument('--record', help='将请求、响应录制到此jsonl文件')
+    parser.add_argument('-v', '--verbose', action='store_true', help='输出详细日志到stderr')
+    parser.add_argument('--batch', action='store_true', help='从stdin逐行读取JSON Lines命令，逐行输出结果')
+    parser.add_argument('--batch-workers', type=int, default=4, help='batch时并发执行的命令数，默认4')
+
+    subparsers = parser.add_subparsers(dest='command', metavar='command')
+    sub = subparsers.add_parser('list', help='获取列表')
+    sub.add_argument('resource', choices=LIST_RESOURCES)
+    sub.add_argument('--filter', dest='filters', type=_parse_filter, action='append',
+                     help='筛选器，key=value，可多次传入，例如--filter platform=IOS')
+    sub.add_argument('--with-content', dest='is_with_content', action='store_true',
+                     help='输出profile、证书的文件内容')
+
+    sub = subparsers.add_parser('register-device', help='注册设备，已注册的设备会被跳过')
+    sub.add_argument('--name')
+    sub.add_argument('--udid')
+    sub.add_argument('--platform', default=BundleIdPlatform.IOS.value)
+    sub.add_argument('--file', help='设备信息的json/csv文件，与--name、--udid二选一')
+    sub.add_argument('--reenable', dest='is_reenable', action='store_true',
+                     help='重新启用已注册但为DISABLED状态的设备')
+
+    sub = subparsers.add_parser('update-profile', help='更新profile，使用所有的设备、证书')
+    sub.add_argument('name')
+    sub.add_argument('--bundle-id', help='profile不存在时，使用此bundleId创建')
+    sub.add_argument('--distribution', dest='is_distribution', action='store_true',
+                     help='使用发布类型的证书，默认为开发类型')
+    sub.add_argument('--save', dest='is_save', action='store_true', help='保存到系统默认的目录下')
+    sub.add_argument('--budget', type=float, help='总耗时上限，单位：秒')
+
+    sub = subparsers.add_parser('screenshot-sync', help='将本地截图目录同步到App Store的一个版本上')
+    sub.add_argument('version_id')
+    sub.add_argument('root_dir')
+    sub.add_argument('--max-workers', type=int, default=4)
+    sub.add_argument('--wait-complete', dest='is_wait_complete', action='store_true')
+    sub.add_argument('--journal-path')
+    return parser
+
+
+def create_token_manager(args: argparse.Namespace) -> TokenManager:
+    key_json = args.key_json or os.environ.get(ENV_KEY_JSON)
+    if key_json:
+        return TokenManager.from_json(key_json)
+    issuer_id = args.issuer_id or os.environ.get(ENV_ISSUER_ID)
+    key_id = args.key_id or os.environ.get(ENV_KEY_ID)
+    key = args.key or os.environ.get(ENV_KEY)
+    if not (issuer_id and key_id and key):
+        raise ValueError(f'need --key-json, or --issuer-id, --key-id and --key '
+                         f'(or environment variable {ENV_KEY_JSON})')
+    return TokenManager(issuer_id, key_id, key)
+
+
+def create_manager(args: argparse.Namespace) -> OKProfileManager:
+    kwargs = {'timeout': args.timeout, 'record_path': args.record}
+    if args.base_api:
+        kwargs['base_api'] = args.base_api
+    if args.http2:
+        from .transport import HTTP2Transport
+
+        kwargs['transport'] = HTTP2Transport()
+    return OKProfileManager(APIAgent(create_token_manager(args), **kwargs))
+
+
+def run_command(manager: OKProfileManager, command: str, params: Dict):
+    """
+    执行一个命令
+    @param manager: OKProfileManager对象
+    @param command: 命令名，见COMMANDS
+    @param params: 命令的参数
+    @return: 可以json序列化的结果
+    """
+    func = COMMANDS.get(command)
+    if not func:
+        raise ValueError(f'unknown command: {command}, supported: {", ".join(COMMANDS)}')
+    return func(manager, **params)
+
+
+def run_batch(manager: OKProfileManager, input_stream: TextIO, output_stream: TextIO,
+              max_workers: int = 4) -> int:
+    """
+    逐行读取JSON Lines命令并执行，每个命令完成后立即输出一行结果（顺序可能与输入不同，可通过id对应）
+    @param manager: OKProfileManager对象，所有命令共用
+    @param input_stream: 输入，每行一个json对象：command为命令名，id（可选）原样返回，其余字段为命令的参数，见batch_params
+    @param output_stream: 输出，每行一个json对象：id、command、ok、result或error、duration_ms
+    @param max_workers: 并发执行的命令数
+    @return: 失败的命令数
+    """
+    lock = threading.Lock()
+    failed_count = 0
+
+    def _write(info: Dict):
+        nonlocal failed_count
+        with lock:
+            if not info['ok']:
+                failed_count += 1
+            output_stream.write(json.dumps(info, ensure_ascii=False) + '\n')
+            output_stream.flush()
+
+    def _run(line_id, command: Optional[str], params: Dict):
+        info = {'id': line_id, 'command': command}
+        start_time = time.perf_counter()
+        try:
+            result = run_command(manager, command, batch_params(params))
+            info.update(ok=True, result=result)
+        except Exception as e:
+            logger.warning('batch command failed: %s, %s', line_id, e)
+            info.update(ok=False, error=str(e), error_type=type(e).__name__)
+        info['duration_ms'] = round((time.perf_counter() - start_time) * 1000, 1)
+        _write(info)
+
+    with ContextThreadPoolExecutor(max_workers=max_workers) as executor:
+        for line_no, tmp_line in enumerate(input_stream, start=1):
+            tmp_line = tmp_line.strip()
+            if not tmp_line:
+                continue
+            try:
+                params = json.loads(tmp_line)
+                if not isinstance(params, dict):
+                    raise ValueError('need a json object')
+            except ValueError as e:
+                _write({'id': line_no, 'command': None, 'ok': False,
+                        'error': f'invalid json line: {e}', 'error_type': type(e).__name__})
+                continue
+            line_id = params.pop('id', line_no)
+            executor.submit(_run, line_id, params.pop('command', None), params)
+    return failed_count
+
+
+def main(argv=None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not args.batch and not args.command:
+        parser.error('need a command, or --batch')
+    if args.verbose:
+        setup_logging(logging.INFO)
+    try:
+        manager = create_manager(args)
+    except ValueError as e:
+        parser.error(str(e))
+
+    try:
+        if args.batch:
+            return 1 if run_batch(manager, sys.stdin, sys.stdout, args.batch_workers) else 0
+
+        params = {tmp_key: tmp_value for tmp_key, tmp_value in vars(args).items()
+                  if tmp_key not in vars(parser.parse_args([])) and tmp_key != 'command'}
+        if params.get('filters'):
+            params['filters'] = dict(params['filters'])
+        try:
+            result = run_command(manager, args.command, params)
+        except Exception as e:
+            print(f'{PROG}: error: {type(e).__name__}: {e}', file=sys.stderr)
+            return 1
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return 0
+    finally:
+        manager.agent.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
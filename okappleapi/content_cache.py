@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# _*_ coding:UTF-8 _*_
+"""
+__author__ = 'shede333'
+"""
+
+import hashlib
+import os
+import shutil
+import threading
+import uuid as uuid_lib
+from typing import Optional
+
+from .models import *
+
+DEFAULT_CACHE_DIR = Path('~/.cache/okappleapi').expanduser()
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def _json_default(obj):
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    if isinstance(obj, bytes):
+        return base64.b64encode(obj).decode()
+    raise TypeError(f'{type(obj)} is not JSON serializable')
+
+
+class ContentCache:
+    """
+    解码后的profile、certificate文件的磁盘缓存
+    以 profile的uuid（或certificate的serial_number）+ 内容hash 为key，同一份内容只解码、写入一次，
+    之后复制到目标路径（不使用硬链接，目标文件被修改时不会影响缓存）；超过容量上限时，按最近使用时间淘汰
+    """
+
+    def __init__(self, root_dir: Union[str, Path] = DEFAULT_CACHE_DIR,
+                 max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        初始化方法
+        @param root_dir: 缓存目录，默认~/.cache/okappleapi
+        @param max_bytes: 缓存的容量上限，单位：字节，默认256MB
+        """
+        self.root_dir = Path(root_dir)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # 缓存文件的总大小，首次写入时扫描一次，之后累加，超过max_bytes时才扫描目录、淘汰
+        self._total_bytes = None
+
+    def _get_or_put(self, kind: str, key: str, b64_content: str, ext: str) -> Path:
+        """
+        获取缓存文件路径，不存在时解码b64_content并写入缓存
+        @param kind: 分类，即子目录名
+        @param key: uuid或serial_number
+        @param b64_content: base64编码的内容
+        @param ext: 文件扩展名
+        @return: 缓存文件路径
+        """
+        content_hash = hashlib.sha256(b64_content.encode()).hexdigest()[:32]
+        file_path = self.root_dir.joinpath(kind, f'{key}-{content_hash}{ext}')
+        if file_path.is_file():
+            os.utime(file_path)  # 更新使用时间，用于LRU淘汰
+            return file_path
+
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = file_path.with_name(f'.{file_path.name}.{uuid_lib.uuid4().hex}')
+        content = base64.b64decode(b64_content)
+        tmp_path.write_bytes(content)
+        os.replace(tmp_path, file_path)
+        with self._lock:
+            is_evict = (self._total_bytes is None) or \
+                       (self._total_bytes + len(content) > self.max_bytes)
+            if not is_evict:
+                self._total_bytes += len(content)
+        if is_evict:
+            self.evict(keep_path=file_path)
+        return file_path
+
+    def profile_path(self, attributes: ProfileAttributes) -> Path:
+        """
+        profile解码后的mobileprovision文件路径
+        @param attributes: ProfileAttributes对象
+        @return: 缓存文件路径，请勿修改此文件
+        """
+        return self._get_or_put('profiles', attributes.uuid, attributes.profile_content,
+                                '.mobileprovision')
+
+    def certificate_path(self, cer: Certificate) -> Optional[Path]:
+        """
+        certificate解码后的cer文件路径
+        @param cer: Certificate对象
+        @return: 缓存文件路径，没有certificate_content时返回None，请勿修改此文件
+        """
+        if not cer.attributes.certificate_content:
+            return None
+        key = cer.attributes.serial_number or cer.id
+        return self._get_or_put('certificates', key, cer.attributes.certificate_content, '.cer')
+
+    def profile_metadata(self, attributes: ProfileAttributes) -> Dict:
+        """
+        profile中plist部分解析后的信息，仅在第一次时解析，之后从缓存的json文件读取
+        @param attributes: ProfileAttributes对象
+        @return: plist信息字典，日期为isoformat字符串，二进制数据为base64字符串
+        """
+        mp_path = self.profile_path(attributes)
+        json_path = mp_path.with_suffix('.json')
+        if json_path.is_file():
+            return json.loads(json_path.read_text())
+
+        info = parse_mp_plist(mp_path.read_bytes())
+        info.pop('DeveloperCertificates', None)  # 体积较大，需要时请读取mobileprovision文件
+        tmp_path = json_path.with_name(f'.{json_path.name}.{uuid_lib.uuid4().hex}')
+        tmp_path.write_text(json.dumps(info, default=_json_default))
+        os.replace(tmp_path, json_path)
+        return json.loads(json_path.read_text())
+
+    @staticmethod
+    def copy_to(src_path: Path, dst_path: Path) -> Path:
+        """
+        将缓存文件复制到dst_path：先复制到同目录下的临时文件，再原子重命名，dst_path已存在时会被替换
+        @param src_path: 缓存文件路径
+        @param dst_path: 目标文件路径
+        @return: dst_path
+        """
+        dst_path = Path(dst_path)
+        tmp_path = dst_path.with_name(f'.{dst_path.name}.{uuid_lib.uuid4().hex}')
+        shutil.copyfile(src_path, tmp_path)
+        os.replace(tmp_path, dst_path)
+        return dst_path
+
+    def evict(self, keep_path: Path = None):
+        """
+        扫描缓存目录，超过容量上限时，按最近使用时间，删除最久未使用的文件；
+        写入缓存时，仅在累计大小超过上限（或首次写入）时调用
+        @param keep_path: （可选）不删除此文件，一般为刚写入的文件
+        @return:
+        """
+        with self._lock:
+            file_list = []
+            total_bytes = 0
+            for tmp_path in self.root_dir.glob('*/*'):
+                if tmp_path.name.startswith('.') or tmp_path.suffix == '.json':
+                    continue
+                try:
+                    stat_result = tmp_path.stat()
+                except FileNotFoundError:
+                    continue
+                file_list.append((stat_result.st_mtime, stat_result.st_size, tmp_path))
+                total_bytes += stat_result.st_size
+            if total_bytes <= self.max_bytes:
+                self._total_bytes = total_bytes
+                return
+
+            file_list.sort()
+            for _, file_size, tmp_path in file_list:
+                if total_bytes <= self.max_bytes:
+                    break
+                if tmp_path == keep_path:
+                    continue
+                for tmp_file in (tmp_path, tmp_path.with_suffix('.json')):
+                    try:
+                        tmp_file.unlink()
+                    except FileNotFoundError:
+                        pass
+                total_bytes -= file_size
+            self._total_bytes = total_bytes
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# _*_ coding:UTF-8 _*_
+"""
+__author__ = 'shede333'
+"""
+
+import logging
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Iterator, List, Optional
+
+from .apple_api_agent import APIAgent
+from .deadline import ContextThreadPoolExecutor
+from .log import verbose_level
+from .priority import Priority, low_priority, priority
+from .models import *
+
+logger = logging.getLogger(__name__)
+
+
+class NodeKind(EnumAutoName):
+    """App元数据树中节点的类型，即资源的type"""
+    apps = auto()
+    appInfos = auto()
+    appStoreVersions = auto()
+    appStoreVersionLocalizations = auto()
+    appScreenshotSets = auto()
+    appScreenshots = auto()
+
+
+class CrawlNode:
+    """App元数据树中的一个节点"""
+
+    def __init__(self, kind: NodeKind, model: DataModel, parent: 'CrawlNode' = None):
+        self.kind = kind
+        self.model = model
+        self.parent = parent
+        self.depth = parent.depth + 1 if parent else 0
+        self.children = []  # 子节点列表，由crawl/iter_nodes填充
+
+    def __repr__(self):
+        return f'CrawlNode({self.kind.value}, {self.model.id}, depth={self.depth})'
+
+
+class AppCrawler:
+    """
+    App元数据树的并发爬取：
+    apps -> appInfos、appStoreVersions -> appStoreVersionLocalizations -> appScreenshotSets -> appScreenshots
+    按广度优先的顺序展开节点，同时最多有max_workers个请求；截图集通过include=appScreenshots一并获取截图
+    """
+
+    def __init__(self, agent: APIAgent, max_workers: int = 8, max_depth: int = 4,
+                 is_include=True, verbose=False):
+        """
+        初始化方法
+        @param agent: APIAgent对象
+        @param max_workers: 最大并发请求数，默认8
+        @param max_depth: 最大深度，apps为0，appScreenshots为4，默认4，即爬取完整的树
+        @param is_include: 截图集是否使用include=appScreenshots一并获取截图，默认True
+        @param verbose: 是否以INFO级别输出详细日志（需配置logging，见log.setup_logging），默认False
+        """
+        self.agent = agent
+        self.max_workers = max_workers
+        self.max_depth = max_depth
+        self.is_include = is_include
+        self.verbose = verbose
+
+    @low_priority
+    def _expand(self, node: CrawlNode) -> List[CrawlNode]:
+        """
+        请求节点的子节点
+        @param node: 节点
+        @return: 子节点列表；截图集include了截图时，截图会直接放入截图集节点的children中
+        """
+        model_id = node.model.id
+        if node.kind == NodeKind.apps:
+            child_list = [CrawlNode(NodeKind.appInfos, tmp_model, node)
+                          for tmp_model in self.agent.list_app_info_for_app(model_id)]
+            child_list.extend(CrawlNode(NodeKind.appStoreVersions, tmp_model, node)
+                              for tmp_model in self.agent.list_appstore_version(model_id))
+        elif node.kind == NodeKind.appStoreVersions:
+            child_list = [CrawlNode(NodeKind.appStoreVersionLocalizations, tmp_model, node)
+                          for tmp_model in self.agent.list_localization(model_id)]
+        elif node.kind == NodeKind.appStoreVersionLocalizations:
+            if self.is_include and self.max_depth > node.depth + 1:
+                child_list = []
+                for tmp_set, screenshot_list in \
+                        self.agent.list_app_screenshot_set_with_screenshots(model_id):
+                    set_node = CrawlNode(NodeKind.appScreenshotSets, tmp_set, node)
+                    set_node.children = [CrawlNode(NodeKind.appScreenshots, tmp_model, set_node)
+                                         for tmp_model in screenshot_list]
+                    child_list.append(set_node)
+            else:
+                child_list = [CrawlNode(NodeKind.appScreenshotSets, tmp_model, node)
+                              for tmp_model in self.agent.list_app_screenshot_set(model_id)]
+        elif node.kind == NodeKind.appScreenshotSets:
+            child_list = [CrawlNode(NodeKind.appScreenshots, tmp_model, node)
+                          for tmp_model in self.agent.list_app_screenshot(model_id)]
+        else:
+            child_list = []
+        logger.log(verbose_level(self.verbose), 'crawl: %s, children: %s', node, len(child_list))
+        return child_list
+
+    def _need_expand(self, node: CrawlNode) -> bool:
+        if node.depth >= self.max_depth or node.kind in (NodeKind.appInfos, NodeKind.appScreenshots):
+            return False
+        # 已通过include获取到截图的截图集，不需要再请求
+        return not (node.kind == NodeKind.appScreenshotSets and self.is_include)
+
+    def iter_nodes(self, apps: Optional[List[App]] = None, filters: Dict = None) \
+            -> Iterator[CrawlNode]:
+        """
+        爬取App元数据树，按发现的顺序依次返回节点（先返回父节点，再返回子节点）
+        @param apps: （可选）作为根节点的App列表，默认请求list_apps获取全部App
+        @param filters: （可选）list_apps的筛选器
+        @return: CrawlNode的生成器
+        """
+        if apps is None:
+            with priority(Priority.low):
+                apps = self.agent.list_apps(filters=filters, verbose=self.verbose)
+        root_list = [CrawlNode(NodeKind.apps, tmp_app) for tmp_app in apps]
+
+        with ContextThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            future_dict = {}  # Future -> 节点
+
+            def _visit(node: CrawlNode):
+                # 返回节点，并提交其展开请求；include得到的子节点直接返回
+                yield node
+                if self._need_expand(node):
+                    future_dict[executor.submit(self._expand, node)] = node
+                else:
+                    for tmp_child in node.children:
+                        yield from _visit(tmp_child)
+
+            for tmp_root in root_list:
+                yield from _visit(tmp_root)
+            while future_dict:
+                done_set, _ = wait(future_dict, return_when=FIRST_COMPLETED)
+                for tmp_future in done_set:
+                    node = future_dict.pop(tmp_future)
+                    node.children = tmp_future.result()
+                    for tmp_child in node.children:
+                        yield from _visit(tmp_child)
+
+    def crawl(self, apps: Optional[List[App]] = None, filters: Dict = None) -> List[CrawlNode]:
+        """
+        爬取完整的App元数据树
+        @param apps: （可选）作为根节点的App列表，默认请求list_apps获取全部App
+        @param filters: （可选）list_apps的筛选器
+        @return: 根节点（App）列表，子节点在各节点的children中
+        """
+        return [tmp_node for tmp_node in self.iter_nodes(apps=apps, filters=filters)
+                if tmp_node.depth == 0]
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# _*_ coding:UTF-8 _*_
+"""
+__author__ = 'shede333'
+
+多次请求组成的流程（例如update_profile）的总耗时上限：
+with deadline(60)内的所有请求共用60秒的预算，每次请求使用剩余的预算作为超时时间，预算耗尽时抛出DeadlineExceededError；
+预算保存在contextvars中，通过ContextThreadPoolExecutor提交的任务会继承当前的预算
+"""
+
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Optional
+
+_deadline_var = contextvars.ContextVar('okappleapi_deadline', default=None)
+
+
+@contextmanager
+def deadline(seconds: Optional[float]):
+    """
+    在with内设置总耗时上限，可嵌套，内层的上限不会超过外层剩余的预算
+    @param seconds: 总耗时上限，单位：秒，为None时不设置上限
+    @return: 截止时间（time.monotonic()），没有上限时为None
+    """
+    if seconds is None:
+        yield _deadline_var.get()
+        return
+    end_time = time.monotonic() + seconds
+    outer_end_time = _deadline_var.get()
+    if outer_end_time is not None:
+        end_time = min(end_time, outer_end_time)
+    token = _deadline_var.set(end_time)
+    try:
+        yield end_time
+    finally:
+        _deadline_var.reset(token)
+
+
+def remaining_time() -> Optional[float]:
+    """
+    当前剩余的预算
+    @return: 单位：秒，可能小于等于0；没有设置上限时为None
+    """
+    end_time = _deadline_var.get()
+    if end_time is None:
+        return None
+    return end_time - time.monotonic()
+
+
+def effective_timeout(timeout: Optional[float]) -> Optional[float]:
+    """
+    单次请求实际使用的超时时间：请求的超时时间 与 剩余预算 中较小的一个
+    @param timeout: 请求的超时时间，单位：秒，None为不限制
+    @return:
+    """
+    remaining = remaining_time()
+    if remaining is None:
+        return timeout
+    return remaining if timeout is None else min(timeout, remaining)
+
+
+class ContextThreadPoolExecutor(ThreadPoolExecutor):
+    """提交的任务在提交时的contextvars上下文中执行，继承deadline等上下文，其余与ThreadPoolExecutor相同"""
+
+    def submit(self, fn, *args, **kwargs):
+        context = contextvars.copy_context()
+        return super().submit(context.run, fn, *args, **kwargs)
@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+# _*_ coding:UTF-8 _*_
+"""
+__author__ = 'shede333'
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from datetime import timedelta
+from typing import Callable, List, Optional, Tuple, Union
+
+from .models import *
+from .ok_agent import OKProfileManager
+from .priority import low_priority
+
+ExpiryItem = Union[Profile, Certificate]
+
+logger = logging.getLogger(__name__)
+
+
+def _expiry_key(item: ExpiryItem) -> Tuple[str, str]:
+    return item.type, item.id
+
+
+def _expiration_timestamp(item: ExpiryItem) -> float:
+    return item.attributes.expiration_date.timestamp()
+
+
+class ExpiryIndex:
+    """
+    profile、certificate按过期时间排序的索引（最小堆），
+    查询"N天内过期"的复杂度为O(k log k)，k为结果数量，与总数无关
+    """
+
+    def __init__(self, items: List[ExpiryItem] = None):
+        self._heap = []  # [过期时间戳, 序号, key, item]，item为None代表已删除
+        self._entry_dict = {}  # key -> 堆中的entry
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        for tmp_item in items or []:
+            self.add(tmp_item)
+
+    @classmethod
+    def from_manager(cls, manager: OKProfileManager, is_include_cer=True):
+        """
+        使用OKProfileManager缓存的profile、certificate列表创建索引
+        @param manager: OKProfileManager对象
+        @param is_include_cer: 是否包含certificate，默认True
+        @return:
+        """
+        items = list(manager.profile_list)
+        if is_include_cer:
+            items.extend(manager.get_cer_list(is_dev=True))
+            items.extend(manager.get_cer_list(is_dev=False))
+        return cls(items)
+
+    def __len__(self):
+        return len(self._entry_dict)
+
+    def add(self, item: ExpiryItem, timestamp: float = None):
+        """
+        添加或更新一个profile/certificate
+        @param item: Profile或Certificate对象
+        @param timestamp: （可选）排序使用的时间戳，默认为item的过期时间，例如更新失败后推迟重试
+        @return:
+        """
+        timestamp = timestamp if timestamp is not None else _expiration_timestamp(item)
+        with self._lock:
+            self._discard(_expiry_key(item))
+            entry = [timestamp, next(self._counter), _expiry_key(item), item]
+            self._entry_dict[entry[2]] = entry
+            heapq.heappush(self._heap, entry)
+
+    def remove(self, item: ExpiryItem):
+        """
+        删除一个profile/certificate，堆中的entry延迟删除
+        @param item: Profile或Certificate对象
+        @return:
+        """
+        with self._lock:
+            self._discard(_expiry_key(item))
+
+    def _discard(self, key):
+        entry = self._entry_dict.pop(key, None)
+        if entry:
+            entry[-1] = None
+
+    def _prune_top(self):
+        while self._heap and self._heap[0][-1] is None:
+            heapq.heappop(self._heap)
+
+    def peek(self) -> Optional[Tuple[float, ExpiryItem]]:
+        """
+        最早过期的一项
+        @return: (过期时间戳, item)，索引为空时返回None
+        """
+        with self._lock:
+            self._prune_top()
+            if self._heap:
+                return self._heap[0][0], self._heap[0][-1]
+
+    def expiring_before(self, timestamp: float) -> List[Tuple[float, ExpiryItem]]:
+        """
+        在timestamp之前过期的所有项，不修改索引
+        只遍历堆中过期时间不大于timestamp的节点（及其子节点），再对结果排序
+        @param timestamp: 时间戳
+        @return: [(过期时间戳, item)]，按过期时间升序
+        """
+        result = []
+        with self._lock:
+            stack = [0] if self._heap else []
+            while stack:
+                index = stack.pop()
+                entry = self._heap[index]
+                if entry[0] > timestamp:
+                    continue
+                if entry[-1] is not None:
+                    result.append((entry[0], entry[1], entry[-1]))
+                for child_index in (2 * index + 1, 2 * index + 2):
+                    if child_index < len(self._heap):
+                        stack.append(child_index)
+        result.sort(key=lambda x: x[:2])
+        return [(tmp_ts, tmp_item) for tmp_ts, _, tmp_item in result]
+
+    def expiring_within(self, days: float, now: float = None) -> List[Tuple[float, ExpiryItem]]:
+        """
+        未来days天内过期的所有项（包含已过期的）
+        @param days: 天数
+        @param now: 当前时间戳，默认time.time()
+        @return: [(过期时间戳, item)]，按过期时间升序
+        """
+        now = now if now is not None else time.time()
+        return self.expiring_before(now + timedelta(days=days).total_seconds())
+
+    def pop_before(self, timestamp: float) -> List[Tuple[float, ExpiryItem]]:
+        """
+        取出并删除在timestamp之前过期的所有项
+        @param timestamp: 时间戳
+        @return: [(过期时间戳, item)]，按过期时间升序
+        """
+        result = []
+        with self._lock:
+            self._prune_top()
+            while self._heap and self._heap[0][0] <= timestamp:
+                entry = heapq.heappop(self._heap)
+                self._entry_dict.pop(entry[2], None)
+                result.append((entry[0], entry[-1]))
+                self._prune_top()
+        return result
+
+
+class ExpiryScheduler:
+    """在profile过期前，自动调用update_profile更新；certificate无法自动更新，仅回调通知"""
+
+    def __init__(self, manager: OKProfileManager, lead_time: timedelta = timedelta(days=3),
+                 is_dev=True, is_save=False,
+                 on_expiring: Callable[[ExpiryItem], None] = None,
+                 max_sleep_second: float = 3600,
+                 retry_interval: timedelta = timedelta(minutes=30)):
+        """
+        初始化方法
+        @param manager: OKProfileManager对象
+        @param lead_time: 提前多久更新，默认提前3天
+        @param is_dev: 更新profile时，是否使用dev类型的证书，见update_profile
+        @param is_save: 更新profile时，是否保存到系统的默认目录下，见update_profile
+        @param on_expiring: （可选）即将过期的certificate，以及更新失败的profile的回调
+        @param max_sleep_second: run_forever时，单次最长的等待时间，单位：秒
+        @param retry_interval: profile更新失败后，间隔多久重试，默认30分钟
+        """
+        self.manager = manager
+        self.lead_time = lead_time
+        self.is_dev = is_dev
+        self.is_save = is_save
+        self.on_expiring = on_expiring
+        self.max_sleep_second = max_sleep_second
+        self.retry_interval = retry_interval
+        self.index = ExpiryIndex.from_manager(manager)
+
+    def next_run_timestamp(self) -> Optional[float]:
+        """
+        下一次需要处理的时间戳，索引为空时返回None
+        @return:
+        """
+        top = self.index.peek()
+        if top:
+            return top[0] - self.lead_time.total_seconds()
+
+    @low_priority
+    def run_pending(self, now: float = None) -> List[Profile]:
+        """
+        处理所有已到提前时间的项：profile调用update_profile更新，并将新profile加入索引；
+        更新失败的profile在retry_interval后重试，单个失败不影响其他项
+        @param now: 当前时间戳，默认time.time()
+        @return: 更新后的profile列表
+        """
+        now = now if now is not None else time.time()
+        due_list = self.index.pop_before(now + self.lead_time.total_seconds())
+        # 重试时间加上lead_time，使其在now + retry_interval时再次到期
+        retry_timestamp = now + self.retry_interval.total_seconds() + self.lead_time.total_seconds()
+        result_list = []
+        for _, tmp_item in due_list:
+            if not isinstance(tmp_item, Profile):
+                self._notify(tmp_item)
+                continue
+            try:
+                bundle_id_str = None
+                if not self.manager.get_profile(tmp_item.name):
+                    # 上次更新时旧profile已删除、但创建失败，使用旧profile的bundleId重新创建
+                    bundle_id_str = tmp_item.attributes.mobile_provision.app_id()
+                new_profile = self.manager.update_profile(tmp_item.name, bundle_id_str=bundle_id_str,
+                                                          is_dev=self.is_dev, is_save=self.is_save)
+            except Exception as e:
+                logger.warning('update profile failed: %s, retry after %s, error: %s',
+                               tmp_item.name, self.retry_interval, e)
+                new_profile = None
+            if not new_profile:
+                self.index.add(tmp_item, timestamp=retry_timestamp)
+                self._notify(tmp_item)
+                continue
+            self.index.add(new_profile)
+            result_list.append(new_profile)
+        return result_list
+
+    def _notify(self, item: ExpiryItem):
+        if not self.on_expiring:
+            return
+        try:
+            self.on_expiring(item)
+        except Exception:
+            logger.exception('on_expiring failed: %s', item.id)
+
+    def run_forever(self, stop_event: threading.Event = None):
+        """
+        循环执行run_pending，每次等待到下一个需要处理的时间，直到stop_event被设置
+        @param stop_event: （可选）用于停止循环
+        @return:
+        """
+        stop_event = stop_event if stop_event else threading.Event()
+        while not stop_event.is_set():
+            self.run_pending()
+            next_timestamp = self.next_run_timestamp()
+            sleep_second = self.max_sleep_second
+            if next_timestamp is not None:
+                sleep_second = min(max(next_timestamp - time.time(), 0), sleep_second)
+            stop_event.wait(sleep_second)
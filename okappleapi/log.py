@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# _*_ coding:UTF-8 _*_
+"""
+__author__ = 'shede333'
+
+okappleapi的日志：各模块使用logging.getLogger(__name__)，默认不输出；
+verbose=True的信息为INFO级别，其余详细信息为DEBUG级别，重试、失败为WARNING级别；
+库本身不添加Handler、不修改logging的配置，需要查看日志时，由调用方配置logging，或调用setup_logging
+请求相关的日志带有extra字段：account(key_id)、endpoint(接口模板)、duration_ms、retry
+"""
+
+import logging
+import sys
+
+LOGGER_NAME = 'okappleapi'
+CONTEXT_FIELDS = ('account', 'endpoint', 'duration_ms', 'retry')
+LOG_FORMAT = ('%(asctime)s %(levelname)s [%(threadName)s] %(name)s: %(message)s '
+              '[account=%(account)s endpoint=%(endpoint)s duration_ms=%(duration_ms)s retry=%(retry)s]')
+
+
+def verbose_level(verbose: bool) -> int:
+    """verbose为True时，日志为INFO级别，否则为DEBUG级别，仅决定单条日志的级别，不修改logging的配置"""
+    return logging.INFO if verbose else logging.DEBUG
+
+
+class ContextFilter(logging.Filter):
+    """为没有携带extra字段的日志补上默认值"-"，使LOG_FORMAT可用于所有日志"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for tmp_field in CONTEXT_FIELDS:
+            if not hasattr(record, tmp_field):
+                setattr(record, tmp_field, '-')
+        return True
+
+
+def setup_logging(level=logging.INFO, stream=None, fmt: str = LOG_FORMAT) -> logging.Handler:
+    """
+    将okappleapi的日志输出到stream，用于命令行、脚本中快速查看日志
+    @param level: 日志级别，默认INFO，即包含verbose=True的信息
+    @param stream: 输出流，默认sys.stderr
+    @param fmt: 日志格式，默认LOG_FORMAT
+    @return: 添加的Handler
+    """
+    handler = logging.StreamHandler(stream if stream else sys.stderr)
+    handler.setFormatter(logging.Formatter(fmt))
+    handler.addFilter(ContextFilter())
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    return handler
@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+# _*_ coding:UTF-8 _*_
+"""
+__author__ = 'shede333'
+"""
+
+import bisect
+import re
+import threading
+import time
+from collections import namedtuple
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+# 请求耗时直方图的桶，单位：秒
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+_RATE_LIMIT_PATTERN = re.compile(r'user-hour-(lim|rem):(\d+)')
+# 熔断器状态对应的指标值
+CIRCUIT_STATE_VALUES = {'closed': 0, 'half_open': 1, 'open': 2}
+
+# 请求耗时直方图的key，字段即Prometheus的标签
+LatencyKey = namedtuple('LatencyKey', 'endpoint, method')
+
+
+def endpoint_template(url: str) -> str:
+    """
+    将url转换为接口模板，id替换为{id}，用于按接口聚合指标，例如：
+    https://api.appstoreconnect.apple.com/v1/apps/123/appInfos?limit=200 -> /v1/apps/{id}/appInfos
+    非App Store Connect接口（例如上传分片的url）返回 "upload:host"
+    @param url: 完整的url
+    @return:
+    """
+    split_result = urlsplit(url)
+    segment_list = split_result.path.split('/')
+    if len(segment_list) < 3 or not re.fullmatch(r'v\d+', segment_list[1]):
+        return f'upload:{split_result.netloc}'
+    # /v1/资源类型/id/关系/...，偶数位置为id
+    for index in range(3, len(segment_list), 2):
+        segment_list[index] = '{id}'
+    return '/'.join(segment_list)
+
+
+def parse_rate_limit(headers: Dict) -> Optional[Tuple[int, int]]:
+    """
+    解析响应头中的X-Rate-Limit，例如"user-hour-lim:3600;user-hour-rem:3599;"
+    @param headers: 响应头
+    @return: (每小时的上限, 剩余次数)，没有此响应头时返回None
+    """
+    value = headers.get('X-Rate-Limit') or headers.get('x-rate-limit')
+    if not value:
+        return None
+    info = dict(_RATE_LIMIT_PATTERN.findall(value))
+    if 'lim' not in info or 'rem' not in info:
+        return None
+    return int(info['lim']), int(info['rem'])
+
+
+class RequestEvent:
+    """一次请求的信息，传递给APIAgent的before_hooks、after_hooks"""
+
+    __slots__ = ('method', 'url', 'attempt', 'start_time', 'elapsed', 'status_code',
+                 'response_bytes', 'headers', 'error')
+
+    def __init__(self, method: str, url: str, attempt: int = 0):
+        """
+        初始化方法
+        @param method: HTTP方法
+        @param url: 完整的url
+        @param attempt: 第几次尝试，0为首次请求，大于0为重试
+        """
+        self.method = method
+        self.url = url
+        self.attempt = attempt
+        self.start_time = time.perf_counter()
+        self.elapsed = 0.0  # 耗时，单位：秒
+        self.status_code = None
+        self.response_bytes = 0
+        self.headers = {}  # 响应头
+        self.error = None  # 传输层的异常
+
+    @property
+    def endpoint(self) -> str:
+        """接口模板，见endpoint_template"""
+        return endpoint_template(self.url)
+
+    def finish(self, response=None, error: Exception = None):
+        """
+        记录请求的结果
+        @param response: TransportResponse对象
+        @param error: 请求失败时的异常
+        @return:
+        """
+        self.elapsed = time.perf_counter() - self.start_time
+        self.error = error
+        if response is not None:
+            self.status_code = response.status_code
+            self.response_bytes = len(response.content)
+            self.headers = response.headers
+
+
+class _Histogram:
+    __slots__ = ('bucket_counts', 'count', 'total')
+
+    def __init__(self):
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS) + 1)  # 最后一个为+Inf
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.bucket_counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+
+
+def _label_text(label_dict: Dict) -> str:
+    label_list = []
+    for tmp_key, tmp_value in label_dict.items():
+        tmp_value = str(tmp_value).replace('\\', '\\\\').replace('"', '\\"')
+        label_list.append(f'{tmp_key}="{tmp_value}"')
+    return '{' + ','.join(label_list) + '}'
+
+
+class MetricsCollector:
+    """
+    请求指标收集器，通过attach挂到APIAgent的hook上，未挂载时没有任何开销：
+    按 接口模板 + HTTP方法 统计耗时直方图、响应字节数、重试次数、错误数，
+    以及限流剩余次数（X-Rate-Limit）、token的生成次数、熔断器的状态；
+    可导出为Prometheus文本格式，或在每次请求结束时调用callback
+    """
+
+    def __init__(self, callback: Callable[[RequestEvent], None] = None, namespace='okappleapi'):
+        """
+        初始化方法
+        @param callback: （可选）每次请求结束时调用，参数为RequestEvent
+        @param namespace: Prometheus指标名的前缀
+        """
+        self.callback = callback
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._histogram_dict = {}  # LatencyKey -> _Histogram
+        self._counter_dict = {}  # (指标名, 标签tuple) -> 数值
+        self._gauge_dict = {}  # (指标名, 标签tuple) -> 数值
+
+    def attach(self, agent) -> 'MetricsCollector':
+        """
+        挂载到APIAgent（及其TokenManager、CircuitBreaker）上
+        @param agent: APIAgent对象
+        @return: self
+        """
+        agent.after_hooks.append(self.after_request)
+        agent.token_manager.renew_hooks.append(self.on_token_renew)
+        if agent.circuit_breaker is not None:
+            agent.circuit_breaker.state_hooks.append(self.on_circuit_state)
+            for (host, group), state in agent.circuit_breaker.snapshot().items():
+                self.on_circuit_state(host, group, state, is_transition=False)
+        return self
+
+    def detach(self, agent):
+        """
+        从APIAgent上卸载
+        @param agent: APIAgent对象
+        @return:
+        """
+        if self.after_request in agent.after_hooks:
+            agent.after_hooks.remove(self.after_request)
+        if self.on_token_renew in agent.token_manager.renew_hooks:
+            agent.token_manager.renew_hooks.remove(self.on_token_renew)
+        circuit_breaker = agent.circuit_breaker
+        if circuit_breaker is not None and self.on_circuit_state in circuit_breaker.state_hooks:
+            circuit_breaker.state_hooks.remove(self.on_circuit_state)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """计数器加value"""
+        key = (name, tuple(labels.items()))
+        with self._lock:
+            self._counter_dict[key] = self._counter_dict.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        """设置当前值"""
+        with self._lock:
+            self._gauge_dict[(name, tuple(labels.items()))] = value
+
+    def after_request(self, event: RequestEvent):
+        """APIAgent的after_hook，记录一次请求"""
+        latency_key = LatencyKey(event.endpoint, event.method)
+        labels = tuple(latency_key._asdict().items())
+        if event.error is not None:
+            status = 'error'
+        else:
+            status = str(event.status_code)
+        rate_limit = parse_rate_limit(event.headers) if event.headers else None
+        with self._lock:
+            histogram = self._histogram_dict.get(latency_key)
+            if histogram is None:
+                histogram = self._histogram_dict[latency_key] = _Histogram()
+            histogram.observe(event.elapsed)
+            for name, value, tmp_labels in (
+                    ('requests_total', 1, labels + (('status', status),)),
+                    ('response_bytes_total', event.response_bytes, labels),
+                    ('retries_total', 1 if event.attempt else 0, labels)):
+                key = (name, tmp_labels)
+                self._counter_dict[key] = self._counter_dict.get(key, 0) + value
+            if rate_limit:
+                self._gauge_dict[('rate_limit_limit', ())] = rate_limit[0]
+                self._gauge_dict[('rate_limit_remaining', ())] = rate_limit[1]
+        if self.callback:
+            self.callback(event)
+
+    def on_token_renew(self, token_manager):
+        """TokenManager的renew_hook，记录token的生成次数"""
+        self.inc('token_renewals_total', key_id=token_manager.key_id)
+
+    def on_circuit_state(self, host: str, group: str, state, is_transition=True):
+        """
+        CircuitBreaker的state_hook，记录熔断器的状态（0: closed，1: half_open，2: open）、熔断次数
+        @param host: 请求的host
+        @param group: 接口分组
+        @param state: CircuitState
+        @param is_transition: 是否为状态变化，为False时只记录当前状态
+        @return:
+        """
+        self.set_gauge('circuit_state', CIRCUIT_STATE_VALUES[state.value], host=host, group=group)
+        if is_transition and state.value == 'open':
+            self.inc('circuit_opens_total', host=host, group=group)
+
+    def snapshot(self) -> Dict:
+        """
+        当前所有指标的快照
+        @return: {'latency': {LatencyKey: {'count', 'sum', 'buckets'}}, 'counters': {...}, 'gauges': {...}}
+        """
+        with self._lock:
+            latency_dict = {}
+            for latency_key, histogram in self._histogram_dict.items():
+                latency_dict[latency_key] = {
+                    'count': histogram.count,
+                    'sum': histogram.total,
+                    'buckets': dict(zip(LATENCY_BUCKETS + (float('inf'),), histogram.bucket_counts))
+                }
+            return {
+                'latency': latency_dict,
+                'counters': dict(self._counter_dict),
+                'gauges': dict(self._gauge_dict),
+            }
+
+    def to_prometheus(self) -> str:
+        """
+        导出为Prometheus的文本格式
+        @return:
+        """
+        prefix = self.namespace
+        line_list = []
+        with self._lock:
+            name = f'{prefix}_request_duration_seconds'
+            line_list.append(f'# HELP {name} App Store Connect API request latency.')
+            line_list.append(f'# TYPE {name} histogram')
+            for latency_key, histogram in sorted(self._histogram_dict.items()):
+                labels = latency_key._asdict()
+                cumulative = 0
+                for bound, bucket_count in zip(LATENCY_BUCKETS + ('+Inf',),
+                                               histogram.bucket_counts):
+                    cumulative += bucket_count
+                    label_text = _label_text(dict(labels, le=bound))
+                    line_list.append(f'{name}_bucket{label_text} {cumulative}')
+                label_text = _label_text(labels)
+                line_list.append(f'{name}_sum{label_text} {histogram.total}')
+                line_list.append(f'{name}_count{label_text} {histogram.count}')
+
+            for metric_type, metric_dict in (('counter', self._counter_dict),
+                                             ('gauge', self._gauge_dict)):
+                type_name_set = set()
+                for (tmp_name, labels), value in sorted(metric_dict.items(), key=lambda x: x[0]):
+                    full_name = f'{prefix}_{tmp_name}'
+                    if tmp_name not in type_name_set:
+                        type_name_set.add(tmp_name)
+                        line_list.append(f'# TYPE {full_name} {metric_type}')
+                    label_text = _label_text(dict(labels)) if labels else ''
+                    line_list.append(f'{full_name}{label_text} {value}')
+        return '\n'.join(line_list) + '\n'
@@ -5,14 +5,18 @@ __author__ = 'shede333'
 """
 
 import base64
-import tempfile
+import csv
+import json
+import plistlib
+import re
 from collections import namedtuple
 from datetime import datetime
 from enum import Enum, auto
 from pathlib import Path
-from typing import Dict, Union
+from typing import TYPE_CHECKING, Dict, List, Union
 
-from mobileprovision.parser import MobileProvisionModel
+if TYPE_CHECKING:
+    from mobileprovision.parser import MobileProvisionModel
 
 
 class EnumAutoName(Enum):
@@ -167,6 +171,74 @@ class Device(DataModel):
 DeviceCreateReqAttrs = namedtuple('DeviceCreateReqAttrs', 'name, udid, platform',
                                   defaults=[BundleIdPlatform.IOS.value])
 
+# 40位16进制的老设备UDID；"8位-16位"16进制的新设备UDID；Mac等设备的UUID格式
+_UDID_LEGACY_PATTERN = re.compile(r'[0-9a-fA-F]{40}')
+_UDID_NEW_PATTERN = re.compile(r'[0-9a-fA-F]{8}-[0-9a-fA-F]{16}')
+_UDID_UUID_PATTERN = re.compile(r'[0-9a-fA-F]{8}-([0-9a-fA-F]{4}-){3}[0-9a-fA-F]{12}')
+
+
+def normalize_udid(udid: str) -> str:
+    """
+    校验并规范化设备的UDID，老格式的UDID转为小写，其它格式转为大写
+    @param udid: 设备的UDID
+    @return: 规范化后的UDID
+    """
+    tmp_udid = (udid or '').strip()
+    if _UDID_LEGACY_PATTERN.fullmatch(tmp_udid):
+        return tmp_udid.lower()
+    if _UDID_NEW_PATTERN.fullmatch(tmp_udid) or _UDID_UUID_PATTERN.fullmatch(tmp_udid):
+        return tmp_udid.upper()
+    raise ValueError(f'invalid udid: {udid}')
+
+
+def load_device_infos(file_path: Union[Path, str]) -> List[DeviceCreateReqAttrs]:
+    """
+    从json或csv文件中读取设备信息
+    json文件为字典列表，csv文件需要有表头；字段名支持name/udid/platform，
+    也支持Apple后台导出的"Device Name/Device ID/Device Platform"
+    @param file_path: 文件路径
+    @return: 设备信息列表，UDID未做校验
+    """
+    file_path = Path(file_path)
+    if file_path.suffix.lower() == '.json':
+        row_list = json.loads(file_path.read_text())
+    else:
+        text = file_path.read_text()
+        try:
+            dialect = csv.Sniffer().sniff(text.splitlines()[0], delimiters=',\t;')
+        except csv.Error:
+            dialect = csv.excel
+        row_list = list(csv.DictReader(text.splitlines(), dialect=dialect))
+
+    key_map = {'device name': 'name', 'device id': 'udid', 'device platform': 'platform'}
+    info_list = []
+    for tmp_row in row_list:
+        tmp_row = {key_map.get(k.strip().lower(), k.strip().lower()): (v or '').strip()
+                   for k, v in tmp_row.items() if k}
+        platform = tmp_row.get('platform') or BundleIdPlatform.IOS.value
+        info_list.append(DeviceCreateReqAttrs(tmp_row.get('name', ''), tmp_row.get('udid', ''),
+                                              platform.upper()))
+    return info_list
+
+
+class DeviceRegisterStatus(EnumAutoName):
+    """批量注册设备时，单个设备的结果"""
+    CREATED = auto()  # 新注册成功
+    EXISTS = auto()  # 已注册过
+    REENABLED = auto()  # 已注册过且为DISABLED，已重新启用
+    DUPLICATE = auto()  # 与本批次中前面的UDID重复
+    INVALID = auto()  # UDID格式错误
+    FAILED = auto()  # 请求失败
+
+
+# 批量注册设备时，单个设备的结果
+DeviceRegisterResult = namedtuple('DeviceRegisterResult', 'name, udid, status, device, error',
+                                  defaults=[None, None])
+
+# 批量修改设备时，单个设备的结果；is_skipped代表无需修改或已在checkpoint中完成
+DeviceModifyResult = namedtuple('DeviceModifyResult', 'device_id, device, error, is_skipped',
+                                defaults=[None, None, False])
+
 
 class ProfileState(EnumAutoName):
     """profile的状态"""
@@ -192,6 +264,21 @@ class ProfileType(EnumAutoName):
     MAC_CATALYST_APP_DIRECT = auto()
 
 
+_MP_PLIST_PATTERN = re.compile(rb'<\?xml.+</plist>', flags=re.DOTALL)
+
+
+def parse_mp_plist(content: bytes) -> Dict:
+    """
+    从mobileprovision文件内容里，提取并解析plist部分，不依赖临时文件
+    @param content: mobileprovision文件的二进制内容
+    @return: plist字典
+    """
+    result = _MP_PLIST_PATTERN.search(content)
+    if not result:
+        raise ValueError('invalid mobileprovision content')
+    return plistlib.loads(result.group())
+
+
 class ProfileAttributes:
     """
     profile的Attributes
@@ -212,8 +299,12 @@ class ProfileAttributes:
         self._mobile_provision = None
 
     @property
-    def mobile_provision(self) -> MobileProvisionModel:
+    def mobile_provision(self) -> 'MobileProvisionModel':
         if not self._mobile_provision:
+            # 首次使用时才导入，避免import okappleapi时就加载mobileprovision、tempfile
+            import tempfile
+            from mobileprovision.parser import MobileProvisionModel
+
             with tempfile.TemporaryDirectory() as temp_dir_path:
                 tmp_file_path = Path(temp_dir_path).joinpath('tmp.mobileprovision')
                 self.save_content(tmp_file_path)
@@ -233,20 +324,29 @@ class ProfileAttributes:
         """
         return ProfileState(self.attributes.get('profileState')) == ProfileState.ACTIVE
 
-    def save_content(self, file_path: Path) -> Path:
+    def save_content(self, file_path: Path, cache=None) -> Path:
         """
         将profile_content保存为mobileprovision文件
         :param file_path: 目录/文件路径，当为目录是，会自动生成文件名
+        :param cache: （可选）ContentCache对象，复制缓存中已解码的文件
         :return: 文件路径
         """
         if file_path.is_dir():
             file_name = f'{self.name}-{self.uuid}.mobileprovision'
             file_path = file_path.joinpath(file_name)
+        if cache:
+            return cache.copy_to(cache.profile_path(self), file_path)
         content = base64.b64decode(self.profile_content)
         file_path.write_bytes(content)
         return file_path
 
 
+# 批量安装profile时，单个profile的结果；removed_paths为被替换掉的同名旧文件
+ProfileInstallResult = namedtuple('ProfileInstallResult',
+                                  'name, uuid, path, is_skipped, removed_paths',
+                                  defaults=[False, ()])
+
+
 class Profile:
     """
     profile信息
@@ -325,13 +425,17 @@ class Certificate(DataModel):
     #     """是否有效，即是否在有效期内"""
     #     return self.attributes.expiration_date < datetime.now()
 
-    def save_cer(self, cer_path: Union[Path, str]) -> bool:
+    def save_cer(self, cer_path: Union[Path, str], cache=None) -> bool:
         """
         将attributes.certificate_content内容保存为cer文件
         @param cer_path: 保存的cer文件的路径，一般使用.cer做为扩展名
+        @param cache: （可选）ContentCache对象，复制缓存中已解码的文件
         @return: 是否成功
         """
         if self.attributes.certificate_content:
+            if cache:
+                cache.copy_to(cache.certificate_path(self), Path(cer_path))
+                return True
             tmp_content = base64.b64decode(self.attributes.certificate_content)
             Path(cer_path).write_bytes(tmp_content)
             return True
@@ -394,6 +498,19 @@ BundleIdCapabilityAttributes = namedtuple('BundleIdCapabilityAttributes',
                                           'capabilityType, settings')
 
 
+class CapabilityAction(EnumAutoName):
+    """同步bundleId能力时的修改类型"""
+    ENABLE = auto()
+    MODIFY = auto()
+    DISABLE = auto()
+
+
+# 同步bundleId能力时的一个修改
+CapabilityChange = namedtuple('CapabilityChange',
+                              'identifier, action, capability_type, settings, capability_id, error',
+                              defaults=[None, None, None])
+
+
 # BundleIdCapabilityAttrSettingItem = namedtuple('BundleIdCapabilityAttrSettingItem',
 #                                                'key, options')
 
@@ -408,6 +525,50 @@ class BundleIdCapability(DataModel):
         attributes = info_dict.get('attributes', {})
         self.attributes = BundleIdCapabilityAttributes(**attributes) if attributes else None
 
+
+class App(DataModel):
+    """
+    App信息
+    https://developer.apple.com/documentation/appstoreconnectapi/app
+    """
+
+    def __init__(self, info_dict: Dict):
+        super().__init__(info_dict['id'], info_dict['type'])
+        self.info_dict = info_dict
+        self.attributes = info_dict.get('attributes', {})
+        self.name = self.attributes.get('name')
+        self.bundle_id = self.attributes.get('bundleId')
+        self.sku = self.attributes.get('sku')
+
+
+class AppInfo(DataModel):
+    """
+    AppInfo信息
+    https://developer.apple.com/documentation/appstoreconnectapi/appinfo
+    """
+
+    def __init__(self, info_dict: Dict):
+        super().__init__(info_dict['id'], info_dict['type'])
+        self.info_dict = info_dict
+        self.attributes = info_dict.get('attributes', {})
+        self.app_store_state = self.attributes.get('appStoreState')
+
+
+class AppStoreVersion(DataModel):
+    """
+    AppStoreVersion信息
+    https://developer.apple.com/documentation/appstoreconnectapi/appstoreversion
+    """
+
+    def __init__(self, info_dict: Dict):
+        super().__init__(info_dict['id'], info_dict['type'])
+        self.info_dict = info_dict
+        self.attributes = info_dict.get('attributes', {})
+        self.version_string = self.attributes.get('versionString')
+        self.platform = self.attributes.get('platform')
+        self.app_store_state = self.attributes.get('appStoreState')
+
+
 class AppInfoLocalization(DataModel):
     """
     AppInfoLocalization信息
@@ -440,5 +601,22 @@ class AppScreenshot(DataModel):
         super().__init__(info_dict['id'], info_dict['type'])
         self.info_dict = info_dict
         self.attributes = info_dict.get('attributes', {})
-        state = self.attributes.get('assetDeliveryState', {}).get('state', '')
-        self.updateState = AppScreenshotState[state] if state else AppScreenshotState.FAILED
\ No newline at end of file
+        state = (self.attributes.get('assetDeliveryState') or {}).get('state', '')
+        self.updateState = AppScreenshotState[state] if state else AppScreenshotState.FAILED
+
+    @property
+    def source_file_checksum(self) -> str:
+        """上传时提交的文件md5"""
+        return self.attributes.get('sourceFileChecksum') or ''
+
+    @property
+    def file_name(self) -> str:
+        """文件名"""
+        return self.attributes.get('fileName') or ''
+
+
+# 同步一个截图集的结果
+ScreenshotSetSyncResult = namedtuple('ScreenshotSetSyncResult',
+                                     'locale, display_type, set_id, uploaded, skipped, deleted, '
+                                     'is_reordered, error',
+                                     defaults=[0, 0, 0, False, None])
@@ -3,13 +3,30 @@
 """
 __author__ = 'shede333'
 """
+import json
+import logging
+import os
 import re
-from typing import List, Optional, Tuple
+import shutil
+import stat
+import threading
+import uuid as uuid_lib
+from concurrent.futures import as_completed
+from datetime import timedelta
+from typing import Callable, List, Optional, Tuple
+
+from .apple_api_agent import APIAgent, APIError, TokenManager
+from .deadline import ContextThreadPoolExecutor, deadline
+from .priority import low_priority
+from .log import verbose_level
+from .models import *
 
-from mobileprovision.util import import_mobileprovision
+# 增量同步时，按id批量获取新设备，每次请求的id数量
+DEVICE_SYNC_BATCH = 100
+# 注册的设备UDID已存在时，Apple返回的HTTP状态码
+DEVICE_CONFLICT_STATUS = 409
 
-from .apple_api_agent import APIAgent, TokenManager
-from .models import *
+logger = logging.getLogger(__name__)
 
 
 class OKProfileError(Exception):
@@ -33,9 +50,15 @@ class OKProfileManager:
 
         self._profile_list = []
         self._bundle_id_list = []
+        self._bundle_id_index = {}  # identifier -> BundleId
         self._device_list = []
         self._cer_list = []
 
+        self._device_full_sync_date = None  # 最近一次全量同步设备列表的时间
+        # 保护以上缓存：多线程共用一个manager时（例如命令行的--batch），缓存只请求一次，
+        # 其他线程等待请求完成后直接使用；可重入，sync_devices等方法之间会相互调用
+        self._lock = threading.RLock()
+
     @classmethod
     def from_token_manager(cls, token_manager: TokenManager):
         agent = APIAgent(token_manager)
@@ -47,9 +70,10 @@ class OKProfileManager:
         Profile信息列表
         @return:
         """
-        if not self._profile_list:
-            self._profile_list = self.agent.list_profiles()
-        return self._profile_list.copy()
+        with self._lock:
+            if not self._profile_list:
+                self._profile_list = self.agent.list_profiles()
+            return self._profile_list.copy()
 
     def get_profile(self, name: str) -> Profile:
         """
@@ -67,10 +91,11 @@ class OKProfileManager:
         BundleId信息列表
         @return:
         """
-        if not self._bundle_id_list:
-            self._bundle_id_list = self.agent.list_bundle_id()
-
-        return self._bundle_id_list.copy()
+        with self._lock:
+            if not self._bundle_id_list:
+                self._bundle_id_list = self.agent.list_bundle_id()
+                self._bundle_id_index = {}
+            return self._bundle_id_list.copy()
 
     def get_bundle_id(self, identifier: str) -> BundleId:
         """
@@ -78,21 +103,275 @@ class OKProfileManager:
         @param identifier: BundleId的identifier, 例如：com.hello.world
         @return:
         """
-        for tmp_bundle_id in self.bundle_id_list:
-            if tmp_bundle_id.attributes.identifier == identifier:
-                return tmp_bundle_id
+        with self._lock:
+            bundle_id_list = self.bundle_id_list
+            if not self._bundle_id_index:
+                # identifier相同时，与原来的顺序查找一致，保留第一个
+                for tmp_bundle_id in reversed(bundle_id_list):
+                    self._bundle_id_index[tmp_bundle_id.attributes.identifier] = tmp_bundle_id
+            return self._bundle_id_index.get(identifier)
 
     @property
     def ios_device_list(self) -> List[Device]:
         """
         iOS设备列表
         """
-        if not self._device_list:
-            self._device_list = self.agent.list_devices()
+        with self._lock:
+            if not self._device_list:
+                self._device_list = self.agent.list_devices()
+            device_list = self._device_list
 
-        result = filter(lambda x: x.platform == BundleIdPlatform.IOS, self._device_list)
+        result = filter(lambda x: x.platform == BundleIdPlatform.IOS, device_list)
         return list(result)
 
+    def sync_devices(self, full_sync_interval: int = 3600, verbose=False) -> List[Device]:
+        """
+        增量同步设备列表（包含所有系统类型的设备）
+        设备只会新增、不会删除，但设备的id是无序的，新设备可能出现在列表的任意位置，
+        所以增量同步时用list_device_ids获取所有设备的id（只请求udid字段，响应体很小），
+        再按id批量获取新设备的完整信息，合并到缓存的设备列表中；
+        设备的状态变化（例如被禁用），由间隔为full_sync_interval的全量同步来更新
+        @param full_sync_interval: 全量同步的间隔，单位：秒，默认1小时
+        @param verbose: 是否以INFO级别输出详细日志（需配置logging，见log.setup_logging），默认False
+        @return: 同步后的设备列表
+        """
+        with self._lock:
+            now = datetime.now()
+            is_full_sync = (not self._device_list) or (not self._device_full_sync_date) or \
+                           (now - self._device_full_sync_date >= timedelta(seconds=full_sync_interval))
+            if is_full_sync:
+                self._device_list = self.agent.list_devices(verbose=verbose)
+                self._device_full_sync_date = now
+                logger.log(verbose_level(verbose), 'full sync devices: %s', len(self._device_list))
+                return self._device_list.copy()
+
+            known_ids = {tmp_device.id for tmp_device in self._device_list}
+            new_ids = [tmp_id for tmp_id in self.agent.list_device_ids(verbose=verbose)
+                       if tmp_id not in known_ids]
+            new_device_list = []
+            for index in range(0, len(new_ids), DEVICE_SYNC_BATCH):
+                tmp_filters = {'id': ','.join(new_ids[index:index + DEVICE_SYNC_BATCH])}
+                new_device_list.extend(self.agent.list_devices(filters=tmp_filters, verbose=verbose))
+            logger.log(verbose_level(verbose), 'delta sync devices, new: %s', len(new_device_list))
+            self._device_list = new_device_list + self._device_list
+            return self._device_list.copy()
+
+    def udid_index(self, is_sync=True) -> Dict[str, Device]:
+        """
+        规范化后的UDID -> Device 的索引，包含所有系统类型的设备
+        @param is_sync: 是否先增量同步设备列表，默认True
+        @return:
+        """
+        device_list = self.sync_devices() if is_sync else self._device_list.copy()
+        index = {}
+        for tmp_device in device_list:
+            try:
+                tmp_udid = normalize_udid(tmp_device.udid)
+            except ValueError:
+                tmp_udid = (tmp_device.udid or '').upper()
+            index[tmp_udid] = tmp_device
+        return index
+
+    def _find_device(self, udid: str) -> Optional[Device]:
+        """
+        按udid查询已注册的设备，不使用缓存
+        @param udid: 规范化后的UDID
+        @return: 没有找到时返回None
+        """
+        for tmp_device in self.agent.list_devices(filters={'udid': udid}):
+            try:
+                if normalize_udid(tmp_device.udid) == udid:
+                    return tmp_device
+            except ValueError:
+                continue
+        return None
+
+    @low_priority
+    def register_devices(self, device_infos: List[DeviceCreateReqAttrs], is_reenable=False,
+                         max_workers: int = 8, verbose=False) -> List[DeviceRegisterResult]:
+        """
+        批量注册设备：本地校验UDID、与已注册设备去重，再并发注册剩余的设备（受agent的限流器约束）；
+        上次同步后在其他地方注册的设备，注册时Apple返回409，按udid查询后返回EXISTS
+        @param device_infos: 设备信息列表，可以用load_device_infos从json/csv文件中读取
+        @param is_reenable: 已注册但为DISABLED状态的设备，是否重新启用，默认False
+        @param max_workers: 并发请求的线程数，默认8
+        @param verbose: 是否以INFO级别输出详细日志（需配置logging，见log.setup_logging），默认False
+        @return: 与device_infos一一对应的结果列表
+        """
+        udid_index = self.udid_index()
+        result_list = [None] * len(device_infos)
+        seen_udids = set()
+        create_tasks = []  # (index, DeviceCreateReqAttrs)
+        reenable_tasks = []  # (index, DeviceCreateReqAttrs, Device)
+        for index, tmp_info in enumerate(device_infos):
+            try:
+                udid = normalize_udid(tmp_info.udid)
+            except ValueError as e:
+                result_list[index] = DeviceRegisterResult(tmp_info.name, tmp_info.udid,
+                                                          DeviceRegisterStatus.INVALID, error=e)
+                continue
+            if udid in seen_udids:
+                result_list[index] = DeviceRegisterResult(tmp_info.name, udid,
+                                                          DeviceRegisterStatus.DUPLICATE)
+                continue
+            seen_udids.add(udid)
+
+            platform = tmp_info.platform
+            if isinstance(platform, BundleIdPlatform):
+                platform = platform.value
+            tmp_info = DeviceCreateReqAttrs(tmp_info.name, udid, platform)
+            exist_device = udid_index.get(udid)
+            if not exist_device:
+                create_tasks.append((index, tmp_info))
+            elif is_reenable and exist_device.status == DeviceStatus.DISABLED:
+                reenable_tasks.append((index, tmp_info, exist_device))
+            else:
+                result_list[index] = DeviceRegisterResult(tmp_info.name, udid,
+                                                          DeviceRegisterStatus.EXISTS, exist_device)
+
+        def _create(tmp_info: DeviceCreateReqAttrs):
+            try:
+                _, tmp_device = self.agent.register_a_device(tmp_info)
+                return DeviceRegisterResult(tmp_info.name, tmp_info.udid,
+                                            DeviceRegisterStatus.CREATED, tmp_device)
+            except APIError as e:
+                if getattr(e, 'status_code', None) != DEVICE_CONFLICT_STATUS:
+                    return DeviceRegisterResult(tmp_info.name, tmp_info.udid,
+                                                DeviceRegisterStatus.FAILED, error=e)
+                # 上次同步后在其他地方注册的设备，Apple返回409，按udid查询已注册的设备
+                exist_device = self._find_device(tmp_info.udid)
+                if not exist_device:
+                    return DeviceRegisterResult(tmp_info.name, tmp_info.udid,
+                                                DeviceRegisterStatus.FAILED, error=e)
+                if is_reenable and exist_device.status == DeviceStatus.DISABLED:
+                    return _reenable(tmp_info, exist_device)
+                return DeviceRegisterResult(tmp_info.name, tmp_info.udid,
+                                            DeviceRegisterStatus.EXISTS, exist_device)
+            except Exception as e:
+                return DeviceRegisterResult(tmp_info.name, tmp_info.udid,
+                                            DeviceRegisterStatus.FAILED, error=e)
+
+        def _reenable(tmp_info: DeviceCreateReqAttrs, exist_device: Device):
+            try:
+                _, tmp_device = self.agent.modify_a_device(exist_device.id,
+                                                           device_status=DeviceStatus.ENABLED)
+                return DeviceRegisterResult(tmp_info.name, tmp_info.udid,
+                                            DeviceRegisterStatus.REENABLED, tmp_device)
+            except Exception as e:
+                return DeviceRegisterResult(tmp_info.name, tmp_info.udid,
+                                            DeviceRegisterStatus.FAILED, exist_device, e)
+
+        with ContextThreadPoolExecutor(max_workers=max_workers) as executor:
+            future_dict = {}
+            for index, tmp_info in create_tasks:
+                future_dict[index] = executor.submit(_create, tmp_info)
+            for index, tmp_info, exist_device in reenable_tasks:
+                future_dict[index] = executor.submit(_reenable, tmp_info, exist_device)
+            for index, tmp_future in future_dict.items():
+                result_list[index] = tmp_future.result()
+                logger.log(verbose_level(verbose), 'register device: %s, %s',
+                           result_list[index].udid, result_list[index].status.value)
+
+        # 更新缓存的设备列表，包括注册时才发现已存在的设备
+        changed_dict = {tmp_result.device.id: tmp_result.device for tmp_result in result_list
+                        if tmp_result.device and tmp_result.status in
+                        (DeviceRegisterStatus.CREATED, DeviceRegisterStatus.REENABLED,
+                         DeviceRegisterStatus.EXISTS)}
+        if changed_dict:
+            with self._lock:
+                tmp_list = [changed_dict.pop(tmp_device.id, tmp_device)
+                            for tmp_device in self._device_list]
+                self._device_list = list(changed_dict.values()) + tmp_list
+        return result_list
+
+    @low_priority
+    def modify_devices(self, predicate: Callable[[Device], bool] = None,
+                       device_ids: List[str] = None, device_status: DeviceStatus = None,
+                       device_name: Union[str, Callable[[Device], str], None] = None,
+                       checkpoint_path: Union[str, Path, None] = None,
+                       progress_func: Callable[[int, int, DeviceModifyResult], None] = None,
+                       max_workers: int = 8, verbose=False) -> List[DeviceModifyResult]:
+        """
+        批量修改设备的status/name，例如禁用很久之前添加的设备：
+        modify_devices(lambda d: d.added_date < datetime(2023, 1, 1), device_status=DeviceStatus.DISABLED)
+        @param predicate: 筛选设备的方法，参数为Device对象，与device_ids二选一
+        @param device_ids: 设备id列表，与predicate二选一
+        @param device_status: 修改后的状态，仅支持ENABLED, DISABLED，不传代表不修改状态
+        @param device_name: 修改后的名称，也可以是参数为Device对象的方法，不传代表不修改名称
+        @param checkpoint_path: （可选）checkpoint文件路径，记录已完成的设备id，中断后再次调用会跳过这些设备
+        @param progress_func: （可选）进度回调，参数为(已完成数, 总数, DeviceModifyResult)
+        @param max_workers: 并发请求的线程数，默认8
+        @param verbose: 是否以INFO级别输出详细日志（需配置logging，见log.setup_logging），默认False
+        @return: 与device_ids（或predicate筛选出的设备）一一对应的结果列表，失败的设备error字段为对应的异常
+        """
+        if (predicate is None) == (device_ids is None):
+            raise ValueError('need one of predicate or device_ids')
+
+        device_dict = {tmp_device.id: tmp_device for tmp_device in self.sync_devices()}
+        if predicate:
+            device_ids = [tmp_id for tmp_id, tmp_device in device_dict.items()
+                          if predicate(tmp_device)]
+
+        checkpoint_path = Path(checkpoint_path) if checkpoint_path else None
+        done_ids = set()
+        if checkpoint_path and checkpoint_path.is_file():
+            done_ids = set(json.loads(checkpoint_path.read_text()).get('done', []))
+        lock = threading.Lock()
+        result_list = [None] * len(device_ids)
+        done_count = 0
+
+        def _on_done(index: int, tmp_result: DeviceModifyResult):
+            nonlocal done_count
+            with lock:
+                result_list[index] = tmp_result
+                done_count += 1
+                if not tmp_result.error:
+                    done_ids.add(tmp_result.device_id)
+                    if tmp_result.device:
+                        device_dict[tmp_result.device_id] = tmp_result.device
+                    if checkpoint_path:
+                        tmp_path = checkpoint_path.with_name(f'{checkpoint_path.name}.tmp')
+                        tmp_path.write_text(json.dumps({'done': sorted(done_ids)}))
+                        os.replace(tmp_path, checkpoint_path)
+                if progress_func:
+                    progress_func(done_count, len(device_ids), tmp_result)
+                logger.log(verbose_level(verbose), 'modify device: %s/%s, %s, error: %s',
+                           done_count, len(device_ids), tmp_result.device_id, tmp_result.error)
+
+        def _modify(device_id: str):
+            tmp_device = device_dict.get(device_id)
+            try:
+                tmp_status = device_status if device_status else \
+                    (tmp_device.status if tmp_device else None)
+                if not tmp_status:
+                    raise ValueError(f'unknown device: {device_id}')
+                tmp_name = device_name(tmp_device) if callable(device_name) else device_name
+                if tmp_device and (tmp_device.status == tmp_status) and \
+                        ((not tmp_name) or (tmp_device.name == tmp_name)):
+                    return DeviceModifyResult(device_id, tmp_device, is_skipped=True)
+                _, new_device = self.agent.modify_a_device(device_id, device_name=tmp_name,
+                                                           device_status=tmp_status)
+                return DeviceModifyResult(device_id, new_device)
+            except Exception as e:
+                return DeviceModifyResult(device_id, tmp_device, e)
+
+        with ContextThreadPoolExecutor(max_workers=max_workers) as executor:
+            future_dict = {}  # future -> device_ids中的位置
+            for index, tmp_id in enumerate(device_ids):
+                if tmp_id in done_ids:
+                    _on_done(index, DeviceModifyResult(tmp_id, device_dict.get(tmp_id),
+                                                       is_skipped=True))
+                else:
+                    future_dict[executor.submit(_modify, tmp_id)] = index
+            for tmp_future in as_completed(future_dict):
+                _on_done(future_dict[tmp_future], tmp_future.result())
+
+        # 更新缓存的设备列表
+        with self._lock:
+            self._device_list = [device_dict.get(tmp_device.id, tmp_device)
+                                 for tmp_device in self._device_list]
+        return result_list
+
     @property
     def valid_device_list(self) -> List[Device]:
         """
@@ -117,15 +396,17 @@ class OKProfileManager:
         @param is_dev: 是否为iOS的dev证书，反之则为iOS的release类型，默认True
         @return:
         """
-        if not self._cer_list:
-            self._cer_list = self.agent.list_certificates()
+        with self._lock:
+            if not self._cer_list:
+                self._cer_list = self.agent.list_certificates()
+            all_cer_list = self._cer_list
 
         if is_dev:
             supported_types = [CertificateType.DEVELOPMENT, CertificateType.IOS_DEVELOPMENT]
         else:
             supported_types = [CertificateType.DISTRIBUTION, CertificateType.IOS_DISTRIBUTION]
         cer_list = []
-        for tmp_cer in self._cer_list:
+        for tmp_cer in all_cer_list:
             platform = tmp_cer.attributes.platform
             is_ios = (not platform) or (platform == BundleIdPlatform.IOS)
             if is_ios and (tmp_cer.attributes.certificate_type in supported_types):
@@ -133,19 +414,27 @@ class OKProfileManager:
                 cer_list.append(tmp_cer)
         return cer_list
 
-    def update_profile(self, name, bundle_id_str=None, is_dev=True, is_save=False) -> Profile:
+    def update_profile(self, name, bundle_id_str=None, is_dev=True, is_save=False,
+                       budget: Optional[float] = None) -> Profile:
         """
         更新名为name的Profile，新Profile使用所有的device+cer信息
         @param name: Profile的name
         @param bundle_id_str: 如果Profile不存在，则使用此bundle_id创建一个新的Profile
         @param is_dev: 是否将dev类型的证书，反之则为release类型，默认True
         @param is_save: 是否将新的Profile，保存到系统默认的目录下
+        @param budget: （可选）整个更新流程的总耗时上限，单位：秒，超过时抛出DeadlineExceededError
         @return:
         """
-        print(f'\nupdate profile: {name}')
+        with deadline(budget):
+            return self._update_profile(name, bundle_id_str=bundle_id_str, is_dev=is_dev,
+                                        is_save=is_save)
+
+    def _update_profile(self, name, bundle_id_str=None, is_dev=True, is_save=False) -> Profile:
+        log_extra = {'account': self.agent.token_manager.key_id}
+        logger.info('update profile: %s', name, extra=log_extra)
         tmp_profile = self.get_profile(name)
         if tmp_profile:
-            print(f'delete profile: {tmp_profile.name}')
+            logger.info('delete profile: %s', tmp_profile.name, extra=log_extra)
             self.agent.delete_a_profile(tmp_profile.id)
             if not bundle_id_str:
                 bundle_id_str = tmp_profile.attributes.mobile_provision.app_id()
@@ -153,24 +442,24 @@ class OKProfileManager:
             exp_info = f'{name} profile not exist, need bundle_id_str params to create new profile'
             raise OKProfileError(exp_info)
 
-        print(f'create profile: {name}')
         attrs = ProfileCreateReqAttrs(name)
         bundle_id = self.get_bundle_id(bundle_id_str)
-        print(f'profile bundle_id: {bundle_id.attributes.identifier}')
         device_list = self.valid_device_list
-        print(f'valid devices: {len(device_list)}')
         cer_list = self.get_cer_list(is_dev=is_dev)
-        print(f'cer: {len(cer_list)}, is_dev: {is_dev}')
+        logger.info('create profile: %s, bundle_id: %s, valid devices: %s, cer: %s, is_dev: %s',
+                    name, bundle_id.attributes.identifier, len(device_list), len(cer_list), is_dev,
+                    extra=log_extra)
         # 创建新的Profile
         result_profile = self.agent.create_a_profile(attrs=attrs, bundle_id=bundle_id,
                                                      devices=device_list, certificates=cer_list)
         if result_profile:
             if is_save:
                 self.save_mobile_provision(result_profile)
-            tmp_list = list(filter(lambda x: x.name != name, self.profile_list))
-            tmp_list.append(result_profile)
-            self._profile_list = tmp_list
-        print(f'update profile success: {name}')
+            with self._lock:
+                tmp_list = list(filter(lambda x: x.name != name, self.profile_list))
+                tmp_list.append(result_profile)
+                self._profile_list = tmp_list
+        logger.info('update profile success: %s', name, extra=log_extra)
         return result_profile
 
     @staticmethod
@@ -180,6 +469,9 @@ class OKProfileManager:
         @param profile: Profile对象
         @return:
         """
+        import tempfile
+        from mobileprovision.util import import_mobileprovision
+
         # 创建临时目录
         with tempfile.TemporaryDirectory() as temp_dir_path:
             tmp_file_path = Path(temp_dir_path).joinpath('tmp.mobileprovision')
@@ -187,13 +479,84 @@ class OKProfileManager:
 
             import_mobileprovision(tmp_file_path)
 
+    @staticmethod
+    def install_profiles(profiles: List[Profile], target_dir: Union[str, Path, None] = None,
+                         is_remove_same_name=True, cache=None,
+                         verbose=False) -> List[ProfileInstallResult]:
+        """
+        批量将profile直接写入目标目录（默认为系统的默认目录），不使用临时目录：
+        目录中已有相同UUID的跳过；先写入同目录下的临时文件再原子重命名为"UUID.mobileprovision"；
+        最后一次性删除同名（Name相同、UUID不同）的旧profile
+        @param profiles: Profile对象列表，同名的profile仅安装created_date最新的一个
+        @param target_dir: （可选）目标目录，默认~/Library/MobileDevice/Provisioning Profiles
+        @param is_remove_same_name: 是否删除同名的旧profile，默认True
+        @param cache: （可选）ContentCache对象，使用缓存中已解码的文件
+        @param verbose: 是否以INFO级别输出详细日志（需配置logging，见log.setup_logging），默认False
+        @return: 安装结果列表，与去重后的profiles对应
+        """
+        from mobileprovision.util import MP_EXT_NAME, MP_ROOT_PATH
+
+        target_dir = Path(target_dir) if target_dir else MP_ROOT_PATH
+        target_dir.mkdir(parents=True, exist_ok=True)
+
+        # 同名的profile，仅保留最新创建的
+        profile_dict = {}
+        for tmp_profile in profiles:
+            exist_profile = profile_dict.get(tmp_profile.name)
+            if (not exist_profile) or \
+                    exist_profile.attributes.created_date < tmp_profile.attributes.created_date:
+                profile_dict[tmp_profile.name] = tmp_profile
+
+        # 目录中已有的文件，仅扫描解析一次
+        exist_dict = {}  # 文件路径 -> (Name, UUID)
+        for tmp_path in target_dir.glob(f'*{MP_EXT_NAME}'):
+            try:
+                info = parse_mp_plist(tmp_path.read_bytes())
+            except (OSError, ValueError):
+                continue
+            exist_dict[tmp_path] = (info.get('Name'), info.get('UUID'))
+        uuid_path_dict = {tmp_uuid: tmp_path for tmp_path, (_, tmp_uuid) in exist_dict.items()}
+
+        result_list = []
+        for tmp_profile in profile_dict.values():
+            attributes = tmp_profile.attributes
+            dst_path = target_dir.joinpath(f'{attributes.uuid}{MP_EXT_NAME}')
+            if attributes.uuid in uuid_path_dict:
+                result_list.append(ProfileInstallResult(attributes.name, attributes.uuid,
+                                                        uuid_path_dict[attributes.uuid],
+                                                        is_skipped=True))
+                continue
+
+            tmp_path = target_dir.joinpath(f'.{attributes.uuid}.{uuid_lib.uuid4().hex}.tmp')
+            if cache:
+                shutil.copyfile(cache.profile_path(attributes), tmp_path)
+            else:
+                tmp_path.write_bytes(base64.b64decode(attributes.profile_content))
+            # 修改文件权限"-rw-r--r-- "
+            tmp_path.chmod(stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IROTH)
+            os.replace(tmp_path, dst_path)
+            result_list.append(ProfileInstallResult(attributes.name, attributes.uuid, dst_path))
+            logger.log(verbose_level(verbose), 'install profile: %s, %s', attributes.name, dst_path)
+
+        if is_remove_same_name:
+            index_dict = {tmp_result.name: index for index, tmp_result in enumerate(result_list)}
+            for tmp_path, (tmp_name, tmp_uuid) in exist_dict.items():
+                index = index_dict.get(tmp_name)
+                if (index is not None) and (tmp_uuid != result_list[index].uuid):
+                    tmp_path.unlink()
+                    tmp_result = result_list[index]
+                    result_list[index] = tmp_result._replace(
+                        removed_paths=tmp_result.removed_paths + (tmp_path,))
+                    logger.log(verbose_level(verbose), 'remove profile: %s, %s', tmp_name, tmp_path)
+        return result_list
+
     def create_certificates(self, csr_file_path: Union[str, Path], certificate_type: str,
                             verbose=False) -> Optional[Certificate]:
         """
         请求创建签名证书
         @param csr_file_path: csr（即certSigningRequest文件）路径
         @param certificate_type: 证书类型，CertificateType枚举类型对应的字符串
-        @param verbose: 是否打印详细信息，默认False
+        @param verbose: 是否以INFO级别输出详细日志（需配置logging，见log.setup_logging），默认False
         @return: Certificate证书对象
         """
         file_content = Path(csr_file_path).read_text()
@@ -211,11 +574,8 @@ class OKProfileManager:
         @param bundle_id: bundle_id
         @return:
         """
-        inner_id = ''
-        for id_obj in self.bundle_id_list:
-            if id_obj.attributes.identifier == bundle_id:
-                inner_id = id_obj.id
-                break
+        id_obj = self.get_bundle_id(bundle_id)
+        inner_id = id_obj.id if id_obj else ''
         if not inner_id:
             raise OKBundleIdError(f'bundle_id({bundle_id}) is not exist!')
         return inner_id
@@ -226,7 +586,7 @@ class OKProfileManager:
         设备列表，仅包含有效状态的设备
         @param bundle_id: bundle_id
         @param filters: 筛选器
-        @param verbose: 是否打印详细信息，默认False
+        @param verbose: 是否以INFO级别输出详细日志（需配置logging，见log.setup_logging），默认False
         @return:
         """
         inner_bundle_id = self._id_from_bundle_id(bundle_id)
@@ -242,7 +602,7 @@ class OKProfileManager:
         @param bundle_id: bundle_id
         @param capability_type: CapabilityType类型对应的字符串
         @param settings: （可选）设置信息列表，见：https://developer.apple.com/documentation/appstoreconnectapi/capabilitysetting
-        @param verbose: 是否打印详细信息，默认False
+        @param verbose: 是否以INFO级别输出详细日志（需配置logging，见log.setup_logging），默认False
         @return:
         """
         inner_bundle_id = self._id_from_bundle_id(bundle_id)
@@ -250,6 +610,97 @@ class OKProfileManager:
                                                 capability_type=capability_type,
                                                 settings=settings, verbose=verbose)
 
+    @staticmethod
+    def _settings_key(settings: Optional[List]):
+        """
+        将capability的settings转为可比较的值：{setting的key: 选中的option的key集合}
+        @param settings: settings列表
+        @return:
+        """
+        result = {}
+        for tmp_setting in settings or []:
+            option_keys = {tmp_option.get('key') for tmp_option in tmp_setting.get('options') or []
+                           if tmp_option.get('enabled', True)}
+            result[tmp_setting.get('key')] = frozenset(option_keys)
+        return result
+
+    def diff_capabilities(self, identifier: str, desired: Dict,
+                          current: List[BundleIdCapability], is_prune=False) \
+            -> List[CapabilityChange]:
+        """
+        计算一个bundleId的能力从current变为desired所需的最少修改
+        @param identifier: bundleId的identifier
+        @param desired: {CapabilityType（或对应的字符串）: settings列表，None代表不关心settings}
+        @param current: 当前的能力列表
+        @param is_prune: 是否关闭desired中没有的能力，默认False
+        @return: 修改列表
+        """
+        desired = {(k.value if isinstance(k, CapabilityType) else k): v for k, v in desired.items()}
+        current_dict = {tmp_cap.attributes.capabilityType: tmp_cap for tmp_cap in current
+                        if tmp_cap.attributes}
+        change_list = []
+        for cap_type, settings in desired.items():
+            tmp_cap = current_dict.get(cap_type)
+            if not tmp_cap:
+                change_list.append(CapabilityChange(identifier, CapabilityAction.ENABLE, cap_type,
+                                                    settings))
+            elif (settings is not None) and \
+                    self._settings_key(settings) != self._settings_key(tmp_cap.attributes.settings):
+                change_list.append(CapabilityChange(identifier, CapabilityAction.MODIFY, cap_type,
+                                                    settings, tmp_cap.id))
+        if is_prune:
+            for cap_type, tmp_cap in current_dict.items():
+                if cap_type not in desired:
+                    change_list.append(CapabilityChange(identifier, CapabilityAction.DISABLE,
+                                                        cap_type, capability_id=tmp_cap.id))
+        return change_list
+
+    @low_priority
+    def sync_capabilities(self, desired: Dict[str, Dict], is_prune=False, is_dry_run=False,
+                          max_workers: int = 8, verbose=False) -> List[CapabilityChange]:
+        """
+        按声明的配置，同步多个bundleId的能力：并发获取当前能力，计算最少修改，再并发执行修改
+        @param desired: {bundleId的identifier: {CapabilityType: settings列表或None}}
+        @param is_prune: 是否关闭desired中没有声明的能力，默认False
+        @param is_dry_run: 仅计算修改，不执行，默认False
+        @param max_workers: 并发请求的线程数，默认8
+        @param verbose: 是否以INFO级别输出详细日志（需配置logging，见log.setup_logging），默认False
+        @return: 修改列表，执行失败的修改，error字段为对应的异常
+        """
+        inner_id_dict = {identifier: self._id_from_bundle_id(identifier) for identifier in desired}
+        change_list = []
+        with ContextThreadPoolExecutor(max_workers=max_workers) as executor:
+            future_dict = {identifier: executor.submit(self.agent.bundle_id_capabilities, inner_id)
+                           for identifier, inner_id in inner_id_dict.items()}
+            for identifier, tmp_future in future_dict.items():
+                change_list.extend(self.diff_capabilities(identifier, desired[identifier],
+                                                          tmp_future.result(), is_prune=is_prune))
+            log_level = verbose_level(verbose)
+            if logger.isEnabledFor(log_level):
+                for tmp_change in change_list:
+                    logger.log(log_level, 'capability: %s, %s, %s', tmp_change.identifier,
+                               tmp_change.action.value, tmp_change.capability_type)
+            if is_dry_run:
+                return change_list
+
+            def _apply(tmp_change: CapabilityChange) -> CapabilityChange:
+                try:
+                    if tmp_change.action == CapabilityAction.ENABLE:
+                        inner_id = inner_id_dict[tmp_change.identifier]
+                        self.agent.enable_a_capabilities(inner_id, tmp_change.capability_type,
+                                                         settings=tmp_change.settings)
+                    elif tmp_change.action == CapabilityAction.MODIFY:
+                        self.agent.modify_a_capabilities(tmp_change.capability_id,
+                                                         tmp_change.capability_type,
+                                                         settings=tmp_change.settings)
+                    else:
+                        self.agent.disable_a_capabilities(tmp_change.capability_id)
+                    return tmp_change
+                except Exception as e:
+                    return tmp_change._replace(error=e)
+
+            return list(executor.map(_apply, change_list))
+
 
 def main():
     pass
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# _*_ coding:UTF-8 _*_
+"""
+__author__ = 'shede333'
+
+请求的优先级：同一个APIAgent同时服务于交互式请求（例如等待profile）和批量的后台任务（例如批量修改设备、同步截图），
+批量任务使用低优先级，PriorityDispatcher为高优先级请求预留一部分并发数和限流令牌，避免交互式请求被饿死；
+优先级保存在contextvars中，通过ContextThreadPoolExecutor提交的任务会继承当前的优先级
+"""
+
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from enum import IntEnum
+from typing import Dict, Optional
+
+DEFAULT_MAX_CONCURRENCY = 16  # 与RequestsTransport默认的连接池大小相同
+DEFAULT_RESERVED_CONCURRENCY = 4
+DEFAULT_RESERVED_RATE_SHARE = 0.25
+
+
+class Priority(IntEnum):
+    high = 0  # 交互式请求，默认
+    low = 1  # 批量的后台任务
+
+
+_priority_var = contextvars.ContextVar('okappleapi_priority', default=Priority.high)
+
+
+@contextmanager
+def priority(value: Priority):
+    """
+    在with内设置请求的优先级，可嵌套
+    @param value: Priority
+    @return: value
+    """
+    token = _priority_var.set(value)
+    try:
+        yield value
+    finally:
+        _priority_var.reset(token)
+
+
+def current_priority() -> Priority:
+    """当前的优先级，默认Priority.high"""
+    return _priority_var.get()
+
+
+def low_priority(func):
+    """装饰器：被装饰的方法（批量的后台任务）中发起的请求，使用低优先级"""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with priority(Priority.low):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+class PriorityDispatcher:
+    """
+    按优先级分配并发数，线程安全，多个APIAgent可共用一个：
+    最多同时有max_concurrency个请求，其中reserved_concurrency个只供高优先级使用，
+    有高优先级的请求在等待时，低优先级的请求不会获得空出的并发数；
+    限流令牌中reserved_rate_share比例只供高优先级使用，见rate_reserve
+    """
+
+    def __init__(self, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 reserved_concurrency: int = DEFAULT_RESERVED_CONCURRENCY,
+                 reserved_rate_share: float = DEFAULT_RESERVED_RATE_SHARE):
+        """
+        初始化方法
+        @param max_concurrency: 最大并发请求数，默认16
+        @param reserved_concurrency: 为高优先级预留的并发数，默认4，需要小于max_concurrency
+        @param reserved_rate_share: 为高优先级预留的限流令牌比例，默认0.25，为0时不预留
+        """
+        if not 0 <= reserved_concurrency < max_concurrency:
+            raise ValueError(f'reserved_concurrency需要在[0, {max_concurrency})之间：'
+                             f'{reserved_concurrency}')
+        self.max_concurrency = max_concurrency
+        self.reserved_concurrency = reserved_concurrency
+        self.reserved_rate_share = reserved_rate_share
+        self._active_dict = {tmp_priority: 0 for tmp_priority in Priority}  # 优先级 -> 进行中的请求数
+        self._waiting_dict = {tmp_priority: 0 for tmp_priority in Priority}  # 优先级 -> 等待中的请求数
+        self._condition = threading.Condition()
+
+    def _can_run(self, priority_value: Priority) -> bool:
+        # 在锁内调用
+        active_count = sum(self._active_dict.values())
+        if priority_value == Priority.high:
+            return active_count < self.max_concurrency
+        return active_count < self.max_concurrency - self.reserved_concurrency \
+            and not self._waiting_dict[Priority.high]
+
+    def acquire(self, priority_value: Priority, timeout: Optional[float] = None) -> bool:
+        """
+        获取一个并发数，不足时阻塞等待，高优先级先被唤醒
+        @param priority_value: 请求的优先级
+        @param timeout: （可选）最长等待时间，单位：秒，默认一直等待
+        @return: 是否获取到，超过timeout仍获取不到时返回False
+        """
+        end_time = time.monotonic() + timeout if timeout is not None else None
+        with self._condition:
+            self._waiting_dict[priority_value] += 1
+            try:
+                while not self._can_run(priority_value):
+                    wait_second = end_time - time.monotonic() if end_time is not None else None
+                    if wait_second is not None and wait_second <= 0:
+                        return False
+                    self._condition.wait(wait_second)
+                self._active_dict[priority_value] += 1
+                return True
+            finally:
+                self._waiting_dict[priority_value] -= 1
+                if priority_value == Priority.high and not self._waiting_dict[priority_value]:
+                    self._condition.notify_all()  # 低优先级的请求可能在等待高优先级的请求离开队列
+
+    def release(self, priority_value: Priority):
+        """请求结束后，释放acquire获取到的并发数"""
+        with self._condition:
+            self._active_dict[priority_value] -= 1
+            self._condition.notify_all()
+
+    def rate_reserve(self, priority_value: Priority, capacity: int) -> int:
+        """
+        限流器需要为高优先级保留的令牌数，见RateLimiter.acquire的reserve参数
+        @param priority_value: 请求的优先级
+        @param capacity: 限流器令牌桶的容量
+        @return: 高优先级为0；低优先级为capacity * reserved_rate_share，至少给低优先级留下1个令牌
+        """
+        if priority_value == Priority.high:
+            return 0
+        return max(0, min(int(capacity * self.reserved_rate_share), capacity - 1))
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        """
+        当前各优先级进行中、等待中的请求数
+        @return: {'active': {'high': 1, 'low': 12}, 'waiting': {...}}
+        """
+        with self._condition:
+            return {'active': {tmp_key.name: tmp_value for tmp_key, tmp_value in self._active_dict.items()},
+                    'waiting': {tmp_key.name: tmp_value for tmp_key, tmp_value in self._waiting_dict.items()}}
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# _*_ coding:UTF-8 _*_
+"""
+__author__ = 'shede333'
+"""
+
+import struct
+from typing import Dict, List, Optional, Set, Tuple
+
+from .models import *
+
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# JPEG中包含图片尺寸的SOF标记，不包括DHT(C4)、JPG(C8)、DAC(CC)
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+# 各截图类型支持的尺寸（竖屏，宽x高），横屏尺寸会自动加入
+# https://developer.apple.com/help/app-store-connect/reference/screenshot-specifications
+_PORTRAIT_SIZES = {
+    'IPHONE_67': {(1290, 2796), (1320, 2868), (1260, 2736)},
+    'IPHONE_65': {(1242, 2688), (1284, 2778)},
+    'IPHONE_61': {(1170, 2532), (1179, 2556), (1206, 2622), (1125, 2436), (1080, 2340)},
+    'IPHONE_58': {(1125, 2436), (1080, 2340), (1170, 2532)},
+    'IPHONE_55': {(1242, 2208)},
+    'IPHONE_47': {(750, 1334)},
+    'IPHONE_40': {(640, 1096), (640, 1136)},
+    'IPHONE_35': {(640, 920), (640, 960)},
+    'IPAD_PRO_3GEN_129': {(2048, 2732), (2064, 2752)},
+    'IPAD_PRO_3GEN_11': {(1668, 2388), (1640, 2360), (1668, 2420), (1488, 2266)},
+    'IPAD_PRO_129': {(2048, 2732)},
+    'IPAD_105': {(1668, 2224)},
+    'IPAD_97': {(1536, 2048), (1536, 2008), (768, 1024), (768, 1004)},
+}
+
+
+def _both_orientations(size_set: Set[Tuple[int, int]]) -> Set[Tuple[int, int]]:
+    return size_set | {(height, width) for width, height in size_set}
+
+
+def _default_size_table() -> Dict[ScreenshotDisplayType, Set[Tuple[int, int]]]:
+    table = {}
+    for tmp_name, size_set in _PORTRAIT_SIZES.items():
+        for tmp_prefix in ('APP_', 'IMESSAGE_APP_'):
+            display_type = ScreenshotDisplayType.__members__.get(f'{tmp_prefix}{tmp_name}')
+            if display_type:
+                table[display_type] = _both_orientations(size_set)
+    table[ScreenshotDisplayType.APP_WATCH_ULTRA] = {(410, 502), (422, 514)}
+    table[ScreenshotDisplayType.APP_WATCH_SERIES_7] = {(396, 484)}
+    table[ScreenshotDisplayType.APP_WATCH_SERIES_4] = {(368, 448)}
+    table[ScreenshotDisplayType.APP_WATCH_SERIES_3] = {(312, 390)}
+    table[ScreenshotDisplayType.APP_DESKTOP] = {(1280, 800), (1440, 900), (2560, 1600),
+                                                (2880, 1800)}
+    table[ScreenshotDisplayType.APP_APPLE_TV] = {(1920, 1080), (3840, 2160)}
+    table[ScreenshotDisplayType.APP_APPLE_VISION_PRO] = {(3840, 2160)}
+    return table
+
+
+# 截图类型 -> 支持的尺寸集合 {(宽, 高)}
+SCREENSHOT_SIZES = _default_size_table()
+
+
+class ScreenshotSizeError(Exception):
+    def __init__(self, error_text, error_list: List = None):
+        self.error_list = error_list if error_list else []
+        super().__init__(error_text)
+
+
+def read_image_size(file_path: Union[str, Path]) -> Tuple[int, int]:
+    """
+    仅读取PNG/JPEG文件头来获取图片尺寸，不解码图片
+    @param file_path: 图片文件路径
+    @return: (宽, 高)
+    """
+    with open(file_path, mode='rb') as file:
+        head = file.read(24)
+        if head.startswith(_PNG_SIGNATURE):
+            # 第一个chunk一定是IHDR：长度(4) + 'IHDR'(4) + 宽(4) + 高(4)
+            if head[12:16] != b'IHDR':
+                raise ValueError(f'invalid png file: {file_path}')
+            return struct.unpack('>II', head[16:24])
+
+        if not head.startswith(b'\xff\xd8'):
+            raise ValueError(f'unsupported image format: {file_path}')
+        file.seek(2)
+        while True:
+            marker = file.read(2)
+            if len(marker) < 2 or marker[0] != 0xFF:
+                raise ValueError(f'invalid jpeg file: {file_path}')
+            if marker[1] == 0xFF:
+                # 填充字节
+                file.seek(-1, 1)
+                continue
+            if marker[1] in (0x01, 0xD8) or 0xD0 <= marker[1] <= 0xD7:
+                # 没有长度字段的标记
+                continue
+            segment_length = struct.unpack('>H', file.read(2))[0]
+            if marker[1] in _JPEG_SOF_MARKERS:
+                # 精度(1) + 高(2) + 宽(2)
+                _, height, width = struct.unpack('>BHH', file.read(5))
+                return width, height
+            file.seek(segment_length - 2, 1)
+
+
+def validate_screenshots(local_dict: Dict[str, Dict[ScreenshotDisplayType, List[Path]]],
+                         size_table: Optional[Dict] = None, is_raise=True) -> List[str]:
+    """
+    批量校验本地截图的尺寸是否符合截图类型的要求，仅读取文件头，用于在请求网络前尽早发现错误
+    @param local_dict: {locale: {ScreenshotDisplayType: [截图文件路径]}}，见scan_screenshot_dir
+    @param size_table: （可选）截图类型 -> 支持的尺寸集合，默认SCREENSHOT_SIZES
+    @param is_raise: 有错误时是否抛出ScreenshotSizeError，默认True
+    @return: 错误信息列表
+    """
+    size_table = size_table if size_table else SCREENSHOT_SIZES
+    error_list = []
+    for type_dict in local_dict.values():
+        for display_type, file_list in type_dict.items():
+            size_set = size_table.get(display_type)
+            if not size_set:
+                continue
+            for tmp_path in file_list:
+                try:
+                    tmp_size = read_image_size(tmp_path)
+                except (OSError, ValueError, struct.error) as e:
+                    error_list.append(f'{tmp_path}: {e}')
+                    continue
+                if tmp_size not in size_set:
+                    error_list.append(f'{tmp_path}: {tmp_size[0]}x{tmp_size[1]} is not valid '
+                                      f'for {display_type.name}')
+    if error_list and is_raise:
+        raise ScreenshotSizeError('\n'.join(error_list), error_list=error_list)
+    return error_list
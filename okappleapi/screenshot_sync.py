@@ -0,0 +1,366 @@
+#!/usr/bin/env python
+# _*_ coding:UTF-8 _*_
+"""
+__author__ = 'shede333'
+"""
+
+import logging
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+from typing import List, Tuple
+
+from .apple_api_agent import APIAgent, UPLOAD_WORKERS, file_md5
+from .deadline import ContextThreadPoolExecutor
+from .priority import low_priority
+from .log import verbose_level
+from .models import *
+from .screenshot_size import validate_screenshots
+from .upload_journal import UploadJournal
+
+SCREENSHOT_EXT_NAMES = ('.png', '.jpg', '.jpeg')
+
+logger = logging.getLogger(__name__)
+
+
+def scan_screenshot_dir(root_dir: Union[str, Path]) -> Dict[str, Dict[ScreenshotDisplayType, List[Path]]]:
+    """
+    扫描本地截图目录，目录结构为：root_dir/locale/ScreenshotDisplayType/截图文件，
+    例如：root_dir/en-US/APP_IPHONE_67/01.png，同一截图集中的截图按文件名排序
+    @param root_dir: 本地截图根目录
+    @return: {locale: {ScreenshotDisplayType: [截图文件路径]}}，目录名不是ScreenshotDisplayType的类型时抛出ValueError
+    """
+    result = {}
+    for locale_dir in sorted(Path(root_dir).iterdir()):
+        if not locale_dir.is_dir() or locale_dir.name.startswith('.'):
+            continue
+        type_dict = {}
+        for type_dir in sorted(locale_dir.iterdir()):
+            if not type_dir.is_dir() or type_dir.name.startswith('.'):
+                continue
+            try:
+                display_type = ScreenshotDisplayType[type_dir.name]
+            except KeyError:
+                raise ValueError(f'unknown ScreenshotDisplayType: {type_dir.name}, '
+                                 f'path: {type_dir}') from None
+            type_dict[display_type] = sorted(tmp_path for tmp_path in type_dir.iterdir()
+                                             if tmp_path.suffix.lower() in SCREENSHOT_EXT_NAMES)
+        result[locale_dir.name] = type_dict
+    return result
+
+
+class AssetDeliveryWaiter:
+    """
+    批量等待截图处理完成（assetDeliveryState为COMPLETE或FAILED）：
+    每轮对每个截图集只请求一次list_app_screenshot，轮询间隔自适应地指数增长，有截图完成时重置；
+    每个截图对应一个Future，结果为最终状态的AppScreenshot
+    """
+
+    def __init__(self, agent: APIAgent, min_interval: float = 2, max_interval: float = 60,
+                 factor: float = 2, timeout: float = 1800, verbose=False):
+        """
+        初始化方法
+        @param agent: APIAgent对象
+        @param min_interval: 最小轮询间隔，单位：秒
+        @param max_interval: 最大轮询间隔，单位：秒
+        @param factor: 没有截图完成时，轮询间隔的增长倍数
+        @param timeout: 单个截图的最长等待时间，超时后Future抛出TimeoutError，单位：秒
+        @param verbose: 是否以INFO级别输出详细日志（需配置logging，见log.setup_logging），默认False
+        """
+        self.agent = agent
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.factor = factor
+        self.timeout = timeout
+        self.verbose = verbose
+
+        self._pending = defaultdict(dict)  # 截图集id -> {截图id: (Future, 超时时间)}
+        self._lock = threading.Lock()
+        self._is_added = False  # 上一轮轮询后，是否有新添加的截图
+        self._thread = None
+
+    def add(self, set_id: str, screenshot_id: str) -> Future:
+        """
+        添加一个需要等待的截图，后台轮询线程未运行时会自动启动
+        @param set_id: 截图所在的截图集id
+        @param screenshot_id: 截图id
+        @return: Future对象，结果为最终状态的AppScreenshot
+        """
+        with self._lock:
+            tmp_item = self._pending[set_id].get(screenshot_id)
+            if tmp_item:
+                return tmp_item[0]
+            tmp_future = Future()
+            self._pending[set_id][screenshot_id] = (tmp_future, time.monotonic() + self.timeout)
+            self._is_added = True
+            if not self._thread:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        return tmp_future
+
+    def wait(self, screenshots: List[Tuple[str, str]]) -> Dict[str, AppScreenshot]:
+        """
+        等待多个截图处理完成
+        @param screenshots: [(截图集id, 截图id)]
+        @return: {截图id: 最终状态的AppScreenshot}
+        """
+        future_dict = {screenshot_id: self.add(set_id, screenshot_id)
+                       for set_id, screenshot_id in screenshots}
+        return {screenshot_id: tmp_future.result()
+                for screenshot_id, tmp_future in future_dict.items()}
+
+    def _poll_set(self, set_id: str) -> int:
+        """
+        请求一次截图集中的截图列表，完成已处理完的截图对应的Future
+        @param set_id: 截图集id
+        @return: 本次完成的截图数
+        """
+        with self._lock:
+            item_dict = dict(self._pending.get(set_id, {}))
+        if not item_dict:
+            return 0
+        try:
+            screenshot_dict = {tmp_screenshot.id: tmp_screenshot
+                               for tmp_screenshot in self.agent.list_app_screenshot(set_id)}
+        except Exception as e:
+            logger.warning('poll screenshot set failed: %s, %s', set_id, e)
+            screenshot_dict = None
+
+        done_count = 0
+        now = time.monotonic()
+        for screenshot_id, (tmp_future, expired_time) in item_dict.items():
+            tmp_screenshot = screenshot_dict.get(screenshot_id) if screenshot_dict else None
+            if screenshot_dict is not None and not tmp_screenshot:
+                tmp_future.set_exception(KeyError(f'screenshot not found: {screenshot_id}'))
+            elif tmp_screenshot and tmp_screenshot.updateState in (AppScreenshotState.COMPLETE,
+                                                                   AppScreenshotState.FAILED):
+                tmp_future.set_result(tmp_screenshot)
+            elif now > expired_time:
+                tmp_future.set_exception(TimeoutError(f'wait screenshot timeout: {screenshot_id}'))
+            else:
+                continue
+            done_count += 1
+            with self._lock:
+                self._pending[set_id].pop(screenshot_id, None)
+                if not self._pending[set_id]:
+                    self._pending.pop(set_id)
+        return done_count
+
+    @low_priority
+    def _run(self):
+        interval = self.min_interval
+        while True:
+            time.sleep(interval)
+            with self._lock:
+                set_ids = list(self._pending)
+                is_added, self._is_added = self._is_added, False
+            done_count = sum(self._poll_set(set_id) for set_id in set_ids)
+            logger.log(verbose_level(self.verbose), 'poll screenshot sets: %s, done: %s, interval: %ss',
+                       len(set_ids), done_count, interval)
+            interval = self.min_interval if (done_count or is_added) else \
+                min(interval * self.factor, self.max_interval)
+            with self._lock:
+                if not self._pending:
+                    self._thread = None
+                    return
+
+
+class ScreenshotSyncer:
+    """
+    将本地截图目录同步到App Store的一个版本上：
+    对比本地文件与远端截图的md5（sourceFileChecksum），跳过未修改的截图，
+    仅上传修改过的截图，各截图集之间并发同步，同步后截图集中截图的顺序与本地文件名的顺序一致
+    """
+
+    def __init__(self, agent: APIAgent, max_workers: int = 4,
+                 upload_workers: int = UPLOAD_WORKERS, is_wait_complete=False,
+                 journal_path: Union[str, Path, None] = None, is_validate_size=True,
+                 verbose=False):
+        """
+        初始化方法
+        @param agent: APIAgent对象
+        @param max_workers: 并发同步的截图集数量，默认4
+        @param upload_workers: 单个截图并发上传的分片数
+        @param is_wait_complete: 是否等待上传的截图处理完成（COMPLETE），默认False
+        @param journal_path: （可选）上传日志文件路径，中断后再次同步时，从已完成的分片继续上传
+        @param is_validate_size: 同步前是否校验本地截图的尺寸，尺寸不符时不发起任何请求，默认True
+        @param verbose: 是否以INFO级别输出详细日志（需配置logging，见log.setup_logging），默认False
+        """
+        self.agent = agent
+        self.max_workers = max_workers
+        self.upload_workers = upload_workers
+        self.verbose = verbose
+        self.waiter = AssetDeliveryWaiter(agent, verbose=verbose) if is_wait_complete else None
+        self.journal = UploadJournal(journal_path) if journal_path else None
+        self.is_validate_size = is_validate_size
+
+    def _log(self, msg: str, *args):
+        logger.log(verbose_level(self.verbose), msg, *args)
+
+    def _upload_screenshot(self, set_id: str, file_path: Path, checksum: str,
+                           screenshot: AppScreenshot = None) -> AppScreenshot:
+        """
+        创建并上传一个截图
+        @param set_id: 截图集id
+        @param file_path: 截图文件路径
+        @param checksum: 截图文件的md5
+        @param screenshot: （可选）上传日志中已预留、未上传完的截图，传此值时从已完成的分片继续上传
+        @return: 新的截图，updateState为verify后的状态
+        """
+        upload_operations = None
+        skip_offsets = ()
+        if screenshot:
+            entry = self.journal.get(screenshot.id)
+            upload_operations = entry['upload_operations']
+            skip_offsets = entry['done_offsets']
+        else:
+            screenshot = self.agent.create_app_screenshot(set_id, str(file_path))
+            if self.journal:
+                self.journal.reserve(screenshot.id, set_id, file_path.name, checksum,
+                                     screenshot.attributes.get('uploadOperations'))
+
+        on_chunk_done = None
+        if self.journal:
+            def on_chunk_done(offset: int):
+                self.journal.mark_chunk_done(screenshot.id, offset)
+        self.agent.upload_app_screenshot(screenshot, str(file_path),
+                                         max_workers=self.upload_workers,
+                                         upload_operations=upload_operations,
+                                         skip_offsets=skip_offsets, on_chunk_done=on_chunk_done)
+        screenshot.updateState = self.agent.verify_app_screenshot(screenshot.id, checksum=checksum)
+        if self.journal:
+            self.journal.remove(screenshot.id)
+        if screenshot.updateState == AppScreenshotState.FAILED:
+            raise ValueError(f'upload screenshot failed: {file_path}')
+        return screenshot
+
+    def sync_screenshot_set(self, screenshot_set: AppScreenshotSet, file_list: List[Path],
+                            checksum_dict: Dict[Path, str], locale: str = '') \
+            -> ScreenshotSetSyncResult:
+        """
+        同步一个截图集：先删除远端多余的截图，再按顺序上传修改过的截图，最后调整顺序
+        @param screenshot_set: 截图集
+        @param file_list: 按顺序排列的本地截图文件路径列表
+        @param checksum_dict: 本地截图文件路径 -> md5
+        @param locale: 截图集对应的语言代码，仅用于结果中
+        @return: 同步结果
+        """
+        display_type = ScreenshotDisplayType[screenshot_set.screenshotTypeString]
+        result = ScreenshotSetSyncResult(locale, display_type, screenshot_set.id)
+        try:
+            remote_list = self.agent.list_app_screenshot(screenshot_set.id)
+            # 上传日志中已预留、未上传完的截图，远端还没有md5，使用日志中记录的md5
+            journal_dict = self.journal.checksum_dict(screenshot_set.id) if self.journal else {}
+            remote_dict = defaultdict(list)  # md5 -> [可复用的远端截图]
+            for tmp_screenshot in remote_list:
+                if tmp_screenshot.updateState == AppScreenshotState.FAILED:
+                    continue
+                tmp_checksum = tmp_screenshot.source_file_checksum
+                if tmp_screenshot.updateState == AppScreenshotState.AWAITING_UPLOAD:
+                    tmp_checksum = journal_dict.get(tmp_screenshot.id)
+                if tmp_checksum:
+                    remote_dict[tmp_checksum].append(tmp_screenshot)
+
+            # 可复用的远端截图，每个只复用一次
+            reuse_list = []
+            for tmp_path in file_list:
+                same_list = remote_dict.get(checksum_dict[tmp_path])
+                reuse_list.append(same_list.pop(0) if same_list else None)
+
+            # 先删除多余的截图，避免超过截图集的数量上限
+            reuse_ids = {tmp_screenshot.id for tmp_screenshot in reuse_list if tmp_screenshot}
+            for tmp_screenshot in remote_list:
+                if tmp_screenshot.id not in reuse_ids:
+                    self.agent.delete_app_screenshot(tmp_screenshot.id)
+                    if self.journal:
+                        self.journal.remove(tmp_screenshot.id)
+                    result = result._replace(deleted=result.deleted + 1)
+
+            final_ids = []
+            wait_dict = {}  # 截图id -> 等待处理完成的Future
+            for tmp_path, tmp_screenshot in zip(file_list, reuse_list):
+                if tmp_screenshot and \
+                        tmp_screenshot.updateState != AppScreenshotState.AWAITING_UPLOAD:
+                    result = result._replace(skipped=result.skipped + 1)
+                else:
+                    self._log('upload screenshot: %s, %s, %s', locale, display_type.name,
+                              tmp_path.name)
+                    tmp_screenshot = self._upload_screenshot(screenshot_set.id, tmp_path,
+                                                             checksum_dict[tmp_path],
+                                                             screenshot=tmp_screenshot)
+                    result = result._replace(uploaded=result.uploaded + 1)
+                    if self.waiter and \
+                            tmp_screenshot.updateState == AppScreenshotState.UPLOAD_COMPLETE:
+                        wait_dict[tmp_screenshot.id] = self.waiter.add(screenshot_set.id,
+                                                                       tmp_screenshot.id)
+                final_ids.append(tmp_screenshot.id)
+
+            current_ids = [tmp_screenshot.id for tmp_screenshot in remote_list
+                           if tmp_screenshot.id in reuse_ids]
+            current_ids.extend(tmp_id for tmp_id in final_ids if tmp_id not in reuse_ids)
+            if final_ids != current_ids:
+                self.agent.reorder_app_screenshots(screenshot_set.id, final_ids)
+                result = result._replace(is_reordered=True)
+
+            for tmp_id, tmp_future in wait_dict.items():
+                if tmp_future.result().updateState == AppScreenshotState.FAILED:
+                    raise ValueError(f'process screenshot failed: {tmp_id}')
+        except Exception as e:
+            result = result._replace(error=e)
+        self._log('sync screenshot set: %s', result)
+        return result
+
+    def _prepare_sets(self, localization: AppInfoLocalization,
+                      type_dict: Dict[ScreenshotDisplayType, List[Path]]) -> List[AppScreenshotSet]:
+        """
+        获取本地化信息下，本地目录中所有截图类型对应的截图集，不存在的截图集会被创建
+        @param localization: 本地化信息
+        @param type_dict: {ScreenshotDisplayType: [截图文件路径]}
+        @return: 截图集列表
+        """
+        set_dict = {tmp_set.screenshotTypeString: tmp_set
+                    for tmp_set in self.agent.list_app_screenshot_set(localization.id)}
+        set_list = []
+        for display_type in type_dict:
+            tmp_set = set_dict.get(display_type.name)
+            if not tmp_set:
+                self._log('create screenshot set: %s, %s', localization.locale, display_type.name)
+                tmp_set = self.agent.create_app_screenshot_set(localization.id, display_type)
+            set_list.append(tmp_set)
+        return set_list
+
+    @low_priority
+    def sync(self, version_id: str, root_dir: Union[str, Path]) -> List[ScreenshotSetSyncResult]:
+        """
+        将本地截图目录同步到App Store的一个版本上，不存在的本地化信息、截图集会被创建
+        @param version_id: App提审版本id(例如：list_appstore_version接口中获取到的id)
+        @param root_dir: 本地截图根目录，结构见scan_screenshot_dir
+        @return: 各截图集的同步结果
+        """
+        local_dict = scan_screenshot_dir(root_dir)
+        if self.is_validate_size:
+            validate_screenshots(local_dict)
+        with ContextThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            all_files = [tmp_path for type_dict in local_dict.values()
+                         for file_list in type_dict.values() for tmp_path in file_list]
+            checksum_dict = dict(zip(all_files, executor.map(file_md5, all_files)))
+
+            localization_dict = {tmp_loc.locale: tmp_loc
+                                 for tmp_loc in self.agent.list_localization(version_id)}
+            for locale in local_dict:
+                if locale not in localization_dict:
+                    self._log('create localization: %s', locale)
+                    localization_dict[locale] = self.agent.create_localization(version_id, locale)
+
+            set_futures = {locale: executor.submit(self._prepare_sets, localization_dict[locale],
+                                                   type_dict)
+                           for locale, type_dict in local_dict.items()}
+            sync_futures = []
+            for locale, tmp_future in set_futures.items():
+                for tmp_set in tmp_future.result():
+                    display_type = ScreenshotDisplayType[tmp_set.screenshotTypeString]
+                    sync_futures.append(executor.submit(self.sync_screenshot_set, tmp_set,
+                                                        local_dict[locale][display_type],
+                                                        checksum_dict, locale))
+            return [tmp_future.result() for tmp_future in sync_futures]
@@ -0,0 +1,511 @@
+#!/usr/bin/env python
+# _*_ coding:UTF-8 _*_
+"""
+__author__ = 'shede333'
+"""
+
+import base64
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Dict, Iterator, List, Optional, Union
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+if TYPE_CHECKING:
+    import requests
+
+STREAM_CHUNK_SIZE = 64 * 1024  # stream时，每次返回的数据大小
+
+
+class TransportError(Exception):
+    """传输层的错误，例如连接失败、超时、HTTP错误状态码"""
+
+    def __init__(self, error_text, status_code=None):
+        self.status_code = status_code
+        super().__init__(error_text)
+
+
+class TransportTimeout(TransportError):
+    """请求超时"""
+
+
+class TransportResponse:
+    """传输层返回的响应"""
+
+    def __init__(self, status_code: int, headers: Dict = None, content: bytes = b'', url: str = '',
+                 elapsed: float = 0):
+        """
+        初始化方法
+        @param status_code: HTTP状态码
+        @param headers: 响应头
+        @param content: 响应体
+        @param url: 请求的url
+        @param elapsed: 请求耗时，单位：秒
+        """
+        self.status_code = status_code
+        self.headers = headers if headers else {}
+        self.content = content
+        self.url = url
+        self.elapsed = elapsed
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise TransportError(f'{self.status_code} error for url: {self.url}',
+                                 status_code=self.status_code)
+
+
+class Transport:
+    """
+    传输层接口，APIAgent的所有请求都通过此接口发出，可替换为其他实现：
+    send发送一个请求并读取完整的响应体；stream分块读取响应体；close释放连接等资源
+    """
+
+    def send(self, method: str, url: str, headers: Dict = None, data=None,
+             timeout=None) -> TransportResponse:
+        """
+        发送一个请求
+        @param method: HTTP方法，例如'GET'
+        @param url: 完整的url
+        @param headers: 请求头
+        @param data: 请求体，支持str、bytes、memoryview
+        @param timeout: 超时时间，单位：秒
+        @return: TransportResponse对象，HTTP错误状态码不会抛出异常；超时抛出TransportTimeout
+        """
+        raise NotImplementedError
+
+    def stream(self, method: str, url: str, headers: Dict = None, data=None, timeout=None,
+               chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+        """
+        发送一个请求，并分块返回响应体，用于下载等较大的响应
+        @return: 响应体分块的生成器，HTTP错误状态码时抛出TransportError
+        """
+        response = self.send(method, url, headers=headers, data=data, timeout=timeout)
+        response.raise_for_status()
+        with memoryview(response.content) as content_view:
+            for offset in range(0, len(content_view), chunk_size):
+                yield bytes(content_view[offset:offset + chunk_size])
+
+    def close(self):
+        """释放资源"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class RequestsTransport(Transport):
+    """基于requests.Session的传输层，复用连接"""
+
+    def __init__(self, session: 'requests.Session' = None, pool_size: int = 16):
+        """
+        初始化方法
+        @param session: （可选）requests.Session对象，默认新建一个
+        @param pool_size: 每个host的连接池大小，一般不小于并发请求数，默认16
+        """
+        # 创建传输层时才导入，避免import okappleapi时就加载requests、urllib3
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self._requests = requests
+        if not session:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+        self.session = session
+
+    def send(self, method: str, url: str, headers: Dict = None, data=None,
+             timeout=None) -> TransportResponse:
+        try:
+            result = self.session.request(method, url, headers=headers, data=data, timeout=timeout)
+        except self._requests.exceptions.Timeout as e:
+            raise TransportTimeout(f'Read timeout after {timeout} seconds: {url}') from e
+        except self._requests.exceptions.RequestException as e:
+            raise TransportError(f'{e}') from e
+        return TransportResponse(result.status_code, dict(result.headers), result.content,
+                                 url=url, elapsed=result.elapsed.total_seconds())
+
+    def stream(self, method: str, url: str, headers: Dict = None, data=None, timeout=None,
+               chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+        try:
+            with self.session.request(method, url, headers=headers, data=data, timeout=timeout,
+                                      stream=True) as result:
+                if result.status_code >= 400:
+                    raise TransportError(f'{result.status_code} error for url: {url}',
+                                         status_code=result.status_code)
+                yield from result.iter_content(chunk_size=chunk_size)
+        except self._requests.exceptions.Timeout as e:
+            raise TransportTimeout(f'Read timeout after {timeout} seconds: {url}') from e
+        except self._requests.exceptions.RequestException as e:
+            raise TransportError(f'{e}') from e
+
+    def close(self):
+        self.session.close()
+
+
+class HTTP2Transport(Transport):
+    """
+    基于httpx的HTTP/2传输层：同一个host的并发请求在一个连接上多路复用，不需要为并发数准备同样多的连接；
+    httpx为可选依赖，需要安装：pip install OKAppleAPI[http2]
+    """
+
+    def __init__(self, client=None, max_connections: int = 4, is_prior_knowledge=False):
+        """
+        初始化方法
+        @param client: （可选）httpx.Client对象，默认新建一个开启HTTP/2的Client
+        @param max_connections: 最大连接数，一个连接上的并发请求数达到服务端的上限时才会新建连接，默认4
+        @param is_prior_knowledge: 明文http://时是否直接使用HTTP/2（h2c），用于本地的测试服务器，默认False；
+                                   https://时通过ALPN协商，不需要此参数
+        """
+        try:
+            import httpx
+        except ImportError as e:
+            raise ImportError('HTTP2Transport需要安装httpx[http2]：pip install OKAppleAPI[http2]') from e
+        self._httpx = httpx
+        if not client:
+            limits = httpx.Limits(max_connections=max_connections,
+                                  max_keepalive_connections=max_connections)
+            client = httpx.Client(http1=not is_prior_knowledge, http2=True, limits=limits)
+        self.client = client
+
+    def send(self, method: str, url: str, headers: Dict = None, data=None,
+             timeout=None) -> TransportResponse:
+        if isinstance(data, memoryview):
+            data = data.tobytes()  # httpx不支持memoryview
+        try:
+            result = self.client.request(method, url, headers=headers, content=data, timeout=timeout)
+        except self._httpx.TimeoutException as e:
+            raise TransportTimeout(f'Read timeout after {timeout} seconds: {url}') from e
+        except self._httpx.HTTPError as e:
+            raise TransportError(f'{e}') from e
+        return TransportResponse(result.status_code, dict(result.headers), result.content,
+                                 url=url, elapsed=result.elapsed.total_seconds())
+
+    def stream(self, method: str, url: str, headers: Dict = None, data=None, timeout=None,
+               chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        try:
+            with self.client.stream(method, url, headers=headers, content=data,
+                                    timeout=timeout) as result:
+                if result.status_code >= 400:
+                    raise TransportError(f'{result.status_code} error for url: {url}',
+                                         status_code=result.status_code)
+                yield from result.iter_bytes(chunk_size=chunk_size)
+        except self._httpx.TimeoutException as e:
+            raise TransportTimeout(f'Read timeout after {timeout} seconds: {url}') from e
+        except self._httpx.HTTPError as e:
+            raise TransportError(f'{e}') from e
+
+    def close(self):
+        self.client.close()
+
+
+def _running_loop():
+    import asyncio  # 只在协程中调用，此时asyncio已经加载
+
+    return asyncio.get_running_loop()
+
+
+class AsyncTransport(Transport):
+    """
+    供asyncio使用的传输层：send_async、stream_async、aclose在线程池中执行内部传输层的请求，
+    不阻塞事件循环，同时最多有max_workers个请求；
+    同步的send、stream、close直接调用内部传输层，因此也可以作为APIAgent的传输层
+    """
+
+    def __init__(self, transport: Transport = None, max_workers: int = 16):
+        """
+        初始化方法
+        @param transport: （可选）内部的同步传输层，默认RequestsTransport(pool_size=max_workers)
+        @param max_workers: 最大并发请求数，默认16
+        """
+        self.transport = transport if transport else RequestsTransport(pool_size=max_workers)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def send(self, method: str, url: str, headers: Dict = None, data=None,
+             timeout=None) -> TransportResponse:
+        return self.transport.send(method, url, headers=headers, data=data, timeout=timeout)
+
+    def stream(self, method: str, url: str, headers: Dict = None, data=None, timeout=None,
+               chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+        return self.transport.stream(method, url, headers=headers, data=data, timeout=timeout,
+                                     chunk_size=chunk_size)
+
+    async def send_async(self, method: str, url: str, headers: Dict = None, data=None,
+                         timeout=None) -> TransportResponse:
+        """send的协程版本"""
+        loop = _running_loop()
+        return await loop.run_in_executor(
+            self._executor, lambda: self.transport.send(method, url, headers=headers, data=data,
+                                                        timeout=timeout))
+
+    async def stream_async(self, method: str, url: str, headers: Dict = None, data=None,
+                           timeout=None, chunk_size: int = STREAM_CHUNK_SIZE) -> AsyncIterator[bytes]:
+        """stream的异步生成器版本，每个分块在线程池中读取"""
+        loop = _running_loop()
+        chunk_iter = self.transport.stream(method, url, headers=headers, data=data,
+                                           timeout=timeout, chunk_size=chunk_size)
+        end_flag = object()
+        try:
+            while True:
+                chunk = await loop.run_in_executor(self._executor, next, chunk_iter, end_flag)
+                if chunk is end_flag:
+                    break
+                yield chunk
+        finally:
+            chunk_iter.close()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.transport.close()
+
+    async def aclose(self):
+        """close的协程版本"""
+        loop = _running_loop()
+        await loop.run_in_executor(None, self.close)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
+
+
+def _request_key(method: str, url: str) -> str:
+    """请求的key：HTTP方法 + path + 排序后的query，忽略scheme和host，同一份fixture可用于不同的base_api"""
+    split_result = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(split_result.query, keep_blank_values=True)))
+    path = f'{split_result.path}?{query}' if query else split_result.path
+    return f'{method.upper()} {path}'
+
+
+def fixture_content(fixture: Dict) -> bytes:
+    """
+    fixture中的响应体：body为json对象，content为base64编码的二进制内容，二者取其一
+    @param fixture: fixture字典
+    @return:
+    """
+    if fixture.get('content') is not None:
+        return base64.b64decode(fixture['content'])
+    if fixture.get('body') is not None:
+        return json.dumps(fixture['body']).encode()
+    return b''
+
+
+def load_fixtures(file_path: Union[str, Path]) -> List[Dict]:
+    """
+    读取fixture文件，支持json数组，或每行一个json对象的jsonl文件
+    每个fixture包含：method, url, status, headers, body(json对象)或content(base64)
+    @param file_path: 文件路径
+    @return: fixture列表
+    """
+    text = Path(file_path).read_text()
+    if text.lstrip().startswith('['):
+        return json.loads(text)
+    return [json.loads(tmp_line) for tmp_line in text.splitlines() if tmp_line.strip()]
+
+
+class MemoryTransport(Transport):
+    """
+    内存中的传输层，由预先录制的fixture驱动，不访问网络，用于压测、模拟，以及单独评估库本身的开销：
+    按 HTTP方法 + path + query 匹配fixture，同一请求有多个fixture时按顺序返回，最后一个会被重复使用；
+    没有匹配的fixture时，调用fallback，默认返回404
+    """
+
+    def __init__(self, fixtures: List[Dict] = None,
+                 fallback: Callable[[str, str, Dict, object], TransportResponse] = None):
+        """
+        初始化方法
+        @param fixtures: fixture列表，格式见load_fixtures
+        @param fallback: （可选）没有匹配的fixture时的处理方法，参数为method, url, headers, data
+        """
+        self.fallback = fallback
+        self.request_list = []  # 已发送的请求，(method, url, 请求体大小)
+        self._lock = threading.Lock()
+        self._fixture_dict = {}  # 请求的key -> [fixture]
+        for tmp_fixture in fixtures or []:
+            self.add(tmp_fixture)
+
+    @classmethod
+    def from_file(cls, file_path: Union[str, Path], **kwargs) -> 'MemoryTransport':
+        return cls(load_fixtures(file_path), **kwargs)
+
+    def add(self, fixture: Dict):
+        """
+        添加一个fixture
+        @param fixture: fixture字典，至少包含method、url
+        @return:
+        """
+        key = _request_key(fixture['method'], fixture['url'])
+        with self._lock:
+            self._fixture_dict.setdefault(key, []).append(fixture)
+
+    def _next_fixture(self, method: str, url: str) -> Optional[Dict]:
+        with self._lock:
+            fixture_list = self._fixture_dict.get(_request_key(method, url))
+            if not fixture_list:
+                return None
+            return fixture_list.pop(0) if len(fixture_list) > 1 else fixture_list[0]
+
+    def send(self, method: str, url: str, headers: Dict = None, data=None,
+             timeout=None) -> TransportResponse:
+        with self._lock:
+            self.request_list.append((method, url, len(data) if data is not None else 0))
+        fixture = self._next_fixture(method, url)
+        if fixture is None:
+            if self.fallback:
+                return self.fallback(method, url, headers, data)
+            body = {'errors': [{'status': '404', 'code': 'NOT_FOUND',
+                                'title': f'no fixture for {method} {url}'}]}
+            return TransportResponse(404, {'Content-Type': 'application/json'},
+                                     json.dumps(body).encode(), url=url)
+        return TransportResponse(int(fixture.get('status', 200)), dict(fixture.get('headers') or {}),
+                                 fixture_content(fixture), url=url)
+
+
+REDACTED = 'REDACTED'
+REDACTED_HEADERS = ('authorization',)  # 录制时需要隐藏的请求头，小写
+
+
+class RecordingTransport(Transport):
+    """
+    录制请求的传输层：请求由内部传输层发出，同时将 请求/响应/耗时 逐行追加写入jsonl文件，
+    Authorization等请求头会被隐藏；录制的文件可由ReplayTransport、MemoryTransport回放
+    """
+
+    def __init__(self, transport: Transport, file_path: Union[str, Path]):
+        """
+        初始化方法
+        @param transport: 实际发出请求的传输层
+        @param file_path: 录制文件路径（jsonl），已存在时会被覆盖
+        """
+        self.transport = transport
+        self.file_path = Path(file_path)
+        self.file_path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = self.file_path.open('w')
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._start_time = time.monotonic()
+
+    def _write(self, method: str, url: str, headers: Optional[Dict], data,
+               response: TransportResponse, elapsed: float, start_offset: float):
+        try:
+            body = response.json() if response.content else None
+            content = None
+        except ValueError:
+            body = None
+            content = base64.b64encode(response.content).decode()
+        request_headers = {tmp_key: (REDACTED if tmp_key.lower() in REDACTED_HEADERS else tmp_value)
+                           for tmp_key, tmp_value in (headers or {}).items()}
+        with self._lock:
+            record = {
+                'seq': self._seq,
+                'method': method,
+                'url': url,
+                'request_headers': request_headers,
+                'request_size': len(data) if data is not None else 0,
+                'status': response.status_code,
+                'headers': response.headers,
+                'body': body,
+                'content': content,
+                'elapsed': round(elapsed, 6),
+                'start_offset': round(start_offset, 6),
+            }
+            self._seq += 1
+            self._file.write(json.dumps(record) + '\n')
+            self._file.flush()
+
+    def send(self, method: str, url: str, headers: Dict = None, data=None,
+             timeout=None) -> TransportResponse:
+        start_time = time.monotonic()
+        response = self.transport.send(method, url, headers=headers, data=data, timeout=timeout)
+        end_time = time.monotonic()
+        self._write(method, url, headers, data, response, end_time - start_time,
+                    start_time - self._start_time)
+        return response
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+        self.transport.close()
+
+
+class ReplayMismatchError(TransportError):
+    """回放时，请求与录制的不一致，例如多出了录制中没有的请求"""
+
+
+class ReplayTransport(MemoryTransport):
+    """
+    回放RecordingTransport录制的请求：同一请求（HTTP方法 + path + query）按录制的顺序依次返回，
+    每条记录只使用一次，结果是确定的；is_realtime为True时，按录制的耗时等待后再返回，否则立即返回；
+    可通过extra_request_list、unused_fixtures，断言与录制时相比没有多出或缺少请求
+    """
+
+    def __init__(self, fixtures: List[Dict], is_realtime=False, speed: float = 1.0, is_strict=False):
+        """
+        初始化方法
+        @param fixtures: 录制的记录列表，见load_fixtures
+        @param is_realtime: 是否按录制的耗时等待后再返回，默认False，即尽快返回
+        @param speed: is_realtime时的回放速度，例如2.0代表等待录制耗时的一半
+        @param is_strict: 出现录制中没有的请求时，是否直接抛出ReplayMismatchError，默认False，即返回404并记录
+        """
+        super().__init__(fixtures)
+        self.is_realtime = is_realtime
+        self.speed = speed
+        self.is_strict = is_strict
+        self.extra_request_list = []  # 录制中没有的请求，(method, url)
+
+    def _next_fixture(self, method: str, url: str) -> Optional[Dict]:
+        with self._lock:
+            fixture_list = self._fixture_dict.get(_request_key(method, url))
+            return fixture_list.pop(0) if fixture_list else None
+
+    def send(self, method: str, url: str, headers: Dict = None, data=None,
+             timeout=None) -> TransportResponse:
+        fixture = self._next_fixture(method, url)
+        with self._lock:
+            self.request_list.append((method, url, len(data) if data is not None else 0))
+            if fixture is None:
+                self.extra_request_list.append((method, url))
+        if fixture is None:
+            if self.is_strict:
+                raise ReplayMismatchError(f'request not in recording: {method} {url}')
+            body = {'errors': [{'status': '404', 'code': 'NOT_FOUND',
+                                'title': f'request not in recording: {method} {url}'}]}
+            return TransportResponse(404, {'Content-Type': 'application/json'},
+                                     json.dumps(body).encode(), url=url)
+
+        elapsed = float(fixture.get('elapsed') or 0)
+        if self.is_realtime and elapsed > 0:
+            time.sleep(elapsed / self.speed)
+        return TransportResponse(int(fixture.get('status', 200)), dict(fixture.get('headers') or {}),
+                                 fixture_content(fixture), url=url, elapsed=elapsed)
+
+    def unused_fixtures(self) -> List[Dict]:
+        """录制了、但回放时没有被请求的记录"""
+        with self._lock:
+            fixture_list = [tmp_fixture for tmp_list in self._fixture_dict.values()
+                            for tmp_fixture in tmp_list]
+        return sorted(fixture_list, key=lambda x: x.get('seq', 0))
+
+    def assert_no_extra_requests(self):
+        """断言回放时没有多出录制中没有的请求，否则抛出ReplayMismatchError"""
+        if self.extra_request_list:
+            info = ', '.join(f'{tmp_method} {tmp_url}' for tmp_method, tmp_url in self.extra_request_list)
+            raise ReplayMismatchError(f'{len(self.extra_request_list)} extra requests: {info}')
+
+    def assert_all_used(self):
+        """断言录制的请求都被回放了，否则抛出ReplayMismatchError"""
+        fixture_list = self.unused_fixtures()
+        if fixture_list:
+            info = ', '.join(f'{tmp_item["method"]} {tmp_item["url"]}' for tmp_item in fixture_list)
+            raise ReplayMismatchError(f'{len(fixture_list)} recorded requests not replayed: {info}')
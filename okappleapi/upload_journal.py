@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# _*_ coding:UTF-8 _*_
+"""
+__author__ = 'shede333'
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+
+class UploadJournal:
+    """
+    截图等资源上传的磁盘日志，用于中断后断点续传：
+    记录已预留（create）的资源id、上传分片信息、已完成分片的offset、文件md5；
+    日志文件为JSON Lines格式，每次修改只追加一行，资源上传并verify完成后，对应的记录会被删除，
+    并压缩日志文件（仅保留未完成的记录）
+    """
+
+    def __init__(self, file_path: Union[str, Path]):
+        """
+        初始化方法，文件已存在时读取其中的记录
+        @param file_path: 日志文件路径
+        """
+        self.file_path = Path(file_path)
+        self._lock = threading.Lock()
+        self._entry_dict = {}  # 资源id -> 记录
+        if self.file_path.is_file():
+            self._load()
+
+    def _load(self):
+        """按顺序重放日志文件中的每一行，中断时写入一半的最后一行会被忽略，并压缩日志文件"""
+        text = self.file_path.read_text()
+        for line in text.splitlines():
+            try:
+                item = json.loads(line)
+            except ValueError:
+                continue
+            op = item.get('op')
+            if op == 'reserve':
+                self._entry_dict[item['id']] = item['entry']
+            elif op == 'chunk':
+                entry = self._entry_dict.get(item['id'])
+                if entry and item['offset'] not in entry['done_offsets']:
+                    entry['done_offsets'].append(item['offset'])
+            elif op == 'remove':
+                self._entry_dict.pop(item['id'], None)
+        if not text.endswith('\n'):
+            # 避免之后追加的行与写入一半的行连在一起
+            self._compact()
+
+    def _append(self, item: Dict):
+        """追加一行到日志文件，需在持有锁时调用"""
+        self.file_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.file_path, mode='a') as file:
+            file.write(json.dumps(item) + '\n')
+
+    def _compact(self):
+        """原子地重写日志文件，仅保留未完成的记录，没有记录时删除文件，需在持有锁时调用"""
+        if not self._entry_dict:
+            try:
+                self.file_path.unlink()
+            except FileNotFoundError:
+                pass
+            return
+        tmp_path = self.file_path.with_name(f'{self.file_path.name}.tmp')
+        tmp_path.write_text(''.join(json.dumps({'op': 'reserve', 'id': asset_id, 'entry': entry}) + '\n'
+                                    for asset_id, entry in self._entry_dict.items()))
+        os.replace(tmp_path, self.file_path)
+
+    def get(self, asset_id: str) -> Optional[Dict]:
+        """
+        获取资源的记录
+        @param asset_id: 资源id，例如截图id
+        @return: 记录字典，包含parent_id, file_name, checksum, upload_operations, done_offsets
+        """
+        with self._lock:
+            entry = self._entry_dict.get(asset_id)
+            return dict(entry) if entry else None
+
+    def checksum_dict(self, parent_id: str) -> Dict[str, str]:
+        """
+        某个父资源（例如截图集）下，所有记录的 资源id -> 文件md5
+        @param parent_id: 父资源id
+        @return:
+        """
+        with self._lock:
+            return {asset_id: entry['checksum'] for asset_id, entry in self._entry_dict.items()
+                    if entry['parent_id'] == parent_id}
+
+    def reserve(self, asset_id: str, parent_id: str, file_name: str, checksum: str,
+                upload_operations: List[Dict]):
+        """
+        记录一个已预留的资源
+        @param asset_id: 资源id
+        @param parent_id: 父资源id，例如截图集id
+        @param file_name: 本地文件名
+        @param checksum: 本地文件的md5
+        @param upload_operations: 上传分片信息
+        @return:
+        """
+        with self._lock:
+            self._entry_dict[asset_id] = {
+                'parent_id': parent_id,
+                'file_name': file_name,
+                'checksum': checksum,
+                'upload_operations': upload_operations,
+                'done_offsets': []
+            }
+            self._append({'op': 'reserve', 'id': asset_id, 'entry': self._entry_dict[asset_id]})
+
+    def mark_chunk_done(self, asset_id: str, offset: int):
+        """
+        记录一个已上传完成的分片
+        @param asset_id: 资源id
+        @param offset: 分片的offset
+        @return:
+        """
+        with self._lock:
+            entry = self._entry_dict.get(asset_id)
+            if entry and offset not in entry['done_offsets']:
+                entry['done_offsets'].append(offset)
+                self._append({'op': 'chunk', 'id': asset_id, 'offset': offset})
+
+    def remove(self, asset_id: str):
+        """
+        删除资源的记录，并压缩日志文件，一般在资源verify完成，或资源已失效时调用
+        @param asset_id: 资源id
+        @return:
+        """
+        with self._lock:
+            if self._entry_dict.pop(asset_id, None) is not None:
+                self._compact()
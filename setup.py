@@ -25,6 +25,12 @@ setup(
     url='https://github.com/shede333/OKAppleAPI',  # 包的主页
     packages=find_packages(),  # 包
     install_requires=['PyJWT~=2.0', 'PyMobileProvision~=1.4', 'requests~=2.20'],
+    extras_require={
+        'http2': ['httpx[http2]>=0.23'],  # HTTP2Transport
+    },
+    entry_points={
+        'console_scripts': ['okappleapi=okappleapi.cli:main'],  # 命令行入口
+    },
     python_requires="~=3.7",
     classifiers=[
         "Development Status :: 5 - Production/Stable",
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# _*_ coding:UTF-8 _*_
+"""
+__author__ = 'shede333'
+
+测试共用的fixture：基于benchmarks/fake_asc.py的本地模拟服务器，不需要真实的key，也不访问外网
+"""
+
+import pytest
+
+from bench import _new_token_manager
+from fake_asc import FakeASCData, FakeASCServer
+from okappleapi.apple_api_agent import APIAgent
+from okappleapi.ok_agent import OKProfileManager
+
+
+@pytest.fixture(scope='session')
+def token_manager():
+    return _new_token_manager()
+
+
+@pytest.fixture
+def fake_data():
+    return FakeASCData(device_num=20, certificate_num=4, bundle_id_num=5, profile_num=6)
+
+
+@pytest.fixture
+def fake_server(fake_data):
+    with FakeASCServer(fake_data) as server:
+        yield server
+
+
+@pytest.fixture
+def agent(token_manager, fake_server):
+    tmp_agent = APIAgent(token_manager, timeout=10, base_api=fake_server.base_api)
+    yield tmp_agent
+    tmp_agent.close()
+
+
+@pytest.fixture
+def manager(agent):
+    return OKProfileManager(agent)
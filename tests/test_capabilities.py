@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# _*_ coding:UTF-8 _*_
+"""
+__author__ = 'shede333'
+"""
+
+from okappleapi.models import BundleIdCapability, CapabilityAction, CapabilityType
+
+ICLOUD_SETTINGS = [{'key': 'ICLOUD_VERSION', 'options': [{'key': 'XCODE_6', 'enabled': True}]}]
+
+
+def _capability(capability_id: str, capability_type: str, settings=None) -> BundleIdCapability:
+    return BundleIdCapability({'id': capability_id, 'type': 'bundleIdCapabilities',
+                               'attributes': {'capabilityType': capability_type,
+                                              'settings': settings}})
+
+
+def test_diff_capabilities(manager):
+    current = [
+        _capability('C1', 'PUSH_NOTIFICATIONS'),
+        _capability('C2', 'ICLOUD', [{'key': 'ICLOUD_VERSION',
+                                      'options': [{'key': 'XCODE_5', 'enabled': True}]}]),
+        _capability('C3', 'GAME_CENTER'),
+    ]
+    desired = {
+        CapabilityType.PUSH_NOTIFICATIONS: None,  # 已开启，不关心settings
+        'ICLOUD': ICLOUD_SETTINGS,
+        CapabilityType.IN_APP_PURCHASE: None,
+    }
+    change_list = manager.diff_capabilities('com.example.app', desired, current)
+    assert [(tmp.action, tmp.capability_type, tmp.capability_id) for tmp in change_list] == [
+        (CapabilityAction.MODIFY, 'ICLOUD', 'C2'),
+        (CapabilityAction.ENABLE, 'IN_APP_PURCHASE', None),
+    ]
+
+    change_list = manager.diff_capabilities('com.example.app', desired, current, is_prune=True)
+    assert change_list[-1].action == CapabilityAction.DISABLE
+    assert change_list[-1].capability_id == 'C3'
+
+
+def test_diff_capabilities_same_settings(manager):
+    # option的顺序不同、disabled的option，视为相同的settings
+    settings = [{'key': 'DATA_PROTECTION_PERMISSION_LEVEL',
+                 'options': [{'key': 'COMPLETE_PROTECTION'}, {'key': 'OTHER', 'enabled': False}]}]
+    current = [_capability('C1', 'DATA_PROTECTION', settings)]
+    desired = {'DATA_PROTECTION': [{'key': 'DATA_PROTECTION_PERMISSION_LEVEL',
+                                    'options': [{'key': 'COMPLETE_PROTECTION', 'enabled': True}]}]}
+    assert manager.diff_capabilities('com.example.app', desired, current) == []
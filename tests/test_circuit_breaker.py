@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# _*_ coding:UTF-8 _*_
+"""
+__author__ = 'shede333'
+"""
+
+import time
+
+import pytest
+
+from okappleapi.apple_api_agent import APIAgent, APIError, CircuitOpenError, MAX_LIMIT
+from okappleapi.circuit_breaker import CircuitBreaker, CircuitState
+from okappleapi.metrics import MetricsCollector
+from okappleapi.transport import MemoryTransport
+
+BASE_API = 'https://api.example.com'
+DEVICES_URL = f'{BASE_API}/v1/devices?limit={MAX_LIMIT}'
+PROFILES_URL = f'{BASE_API}/v1/profiles/P1/devices'
+
+
+def test_state_transitions():
+    breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=0.05)
+    state_list = []
+    breaker.state_hooks.append(lambda host, group, state: state_list.append((group, state)))
+
+    breaker.record_failure(DEVICES_URL)
+    assert breaker.allow(DEVICES_URL)
+    breaker.record_failure(DEVICES_URL)
+    assert breaker.state(DEVICES_URL) == CircuitState.open
+    assert breaker.is_open(DEVICES_URL)
+    assert not breaker.allow(DEVICES_URL)
+    assert breaker.allow(PROFILES_URL)  # 其他分组不受影响
+
+    time.sleep(0.06)
+    assert not breaker.is_open(DEVICES_URL)
+    assert breaker.allow(DEVICES_URL)  # 探测请求
+    assert breaker.state(DEVICES_URL) == CircuitState.half_open
+    assert not breaker.allow(DEVICES_URL)  # 同时只放行一个探测请求
+    breaker.record_failure(DEVICES_URL)  # 探测失败，重新熔断
+    assert breaker.state(DEVICES_URL) == CircuitState.open
+
+    time.sleep(0.06)
+    assert breaker.allow(DEVICES_URL)
+    breaker.record_success(DEVICES_URL)
+    assert breaker.state(DEVICES_URL) == CircuitState.closed
+    assert state_list == [('devices', CircuitState.open), ('devices', CircuitState.half_open),
+                          ('devices', CircuitState.open), ('devices', CircuitState.half_open),
+                          ('devices', CircuitState.closed)]
+
+
+def test_disabled_breaker():
+    breaker = CircuitBreaker(failure_threshold=0)
+    for _ in range(10):
+        breaker.record_failure(DEVICES_URL)
+    assert breaker.allow(DEVICES_URL)
+    assert breaker.snapshot() == {}
+
+
+def _unavailable_transport() -> MemoryTransport:
+    return MemoryTransport([{'method': 'GET', 'url': DEVICES_URL, 'status': 503,
+                             'headers': {'Content-Type': 'text/html'}}])
+
+
+def test_agent_fail_fast(token_manager):
+    transport = _unavailable_transport()
+    breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=60)
+    agent = APIAgent(token_manager, base_api=BASE_API, transport=transport, circuit_breaker=breaker)
+    collector = MetricsCollector().attach(agent)
+    for _ in range(2):
+        with pytest.raises(APIError) as exc_info:
+            agent.list_devices()
+        assert exc_info.value.status_code == 503
+    with pytest.raises(CircuitOpenError):
+        agent.list_devices()
+    assert len(transport.request_list) == 2
+    assert collector.snapshot()['gauges'][('circuit_state', (('host', 'api.example.com'),
+                                                              ('group', 'devices')))] == 2
+    collector.detach(agent)
+    assert breaker.state_hooks == []
+
+
+def test_agent_without_breaker(token_manager):
+    transport = _unavailable_transport()
+    agent = APIAgent(token_manager, base_api=BASE_API, transport=transport)
+    assert agent.circuit_breaker is None
+    collector = MetricsCollector().attach(agent)
+    for _ in range(6):
+        with pytest.raises(APIError) as exc_info:
+            agent.list_devices()
+        assert not isinstance(exc_info.value, CircuitOpenError)
+    assert len(transport.request_list) == 6
+    collector.detach(agent)
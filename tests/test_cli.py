@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# _*_ coding:UTF-8 _*_
+"""
+__author__ = 'shede333'
+"""
+
+import argparse
+import io
+import json
+import threading
+from collections import Counter
+
+import pytest
+
+from okappleapi.cli import batch_params, run_batch
+from okappleapi.metrics import endpoint_template
+
+NEW_UDID = '00008030-001A2B3C4D5E6F70'
+
+
+def test_batch_params():
+    assert batch_params({'bundle-id': 'com.example.app', 'save': True, 'with-content': True,
+                         'reenable': True, 'wait-complete': True, 'journal-path': 'a.jsonl'}) == {
+        'bundle_id': 'com.example.app', 'is_save': True, 'is_with_content': True,
+        'is_reenable': True, 'is_wait_complete': True, 'journal_path': 'a.jsonl'}
+    # 方法的参数名原样保留
+    assert batch_params({'bundle_id': 'com.example.app', 'is_save': True}) == {
+        'bundle_id': 'com.example.app', 'is_save': True}
+    assert batch_params({'filter': ['status=ENABLED', 'platform=IOS']}) == {
+        'filters': {'status': 'ENABLED', 'platform': 'IOS'}}
+    assert batch_params({'filters': {'status': 'ENABLED'}}) == {'filters': {'status': 'ENABLED'}}
+    with pytest.raises(argparse.ArgumentTypeError):
+        batch_params({'filter': ['status']})
+
+
+def test_run_batch(manager, fake_data):
+    line_list = [
+        {'id': 'devices', 'command': 'list', 'resource': 'devices', 'filter': ['status=DISABLED']},
+        {'id': 'profiles', 'command': 'list', 'resource': 'profiles', 'with-content': True},
+        {'id': 'register', 'command': 'register-device', 'name': 'new-phone', 'udid': NEW_UDID},
+        {'id': 'unknown', 'command': 'hello'},
+        {'command': 'list', 'resource': 'devices', 'bad-option': 1},
+    ]
+    input_stream = io.StringIO('\n'.join(json.dumps(tmp) for tmp in line_list) + '\n\nnot json\n')
+    output_stream = io.StringIO()
+    assert run_batch(manager, input_stream, output_stream, max_workers=4) == 3
+
+    result_dict = {tmp['id']: tmp for tmp in map(json.loads, output_stream.getvalue().splitlines())}
+    assert len(result_dict) == 6
+    disabled_ids = [tmp['id'] for tmp in fake_data.devices if tmp['attributes']['status'] == 'DISABLED']
+    assert [tmp['id'] for tmp in result_dict['devices']['result']] == disabled_ids
+    assert all('profileContent' in tmp['attributes'] for tmp in result_dict['profiles']['result'])
+    assert result_dict['register']['ok']
+    assert result_dict['register']['result'][0]['udid'] == NEW_UDID
+    assert (result_dict['unknown']['ok'], result_dict['unknown']['error_type']) == (False, 'ValueError')
+    # 没有id时使用行号
+    assert (result_dict[5]['ok'], result_dict[5]['error_type']) == (False, 'TypeError')
+    assert (result_dict[7]['command'], result_dict[7]['ok']) == (None, False)
+
+
+def test_concurrent_cache_fill(manager, fake_server):
+    fake_server.latency = 0.05  # 请求进行中时，其他线程也在读取缓存
+    endpoint_counter = Counter()
+    manager.agent.before_hooks.append(lambda event: endpoint_counter.update([endpoint_template(event.url)]))
+
+    barrier = threading.Barrier(8)
+    result_list = []
+
+    def run():
+        barrier.wait()
+        result_list.append((len(manager.profile_list), len(manager.bundle_id_list),
+                            len(manager.ios_device_list)))
+
+    thread_list = [threading.Thread(target=run) for _ in range(8)]
+    for tmp_thread in thread_list:
+        tmp_thread.start()
+    for tmp_thread in thread_list:
+        tmp_thread.join(timeout=10)
+    assert len(set(result_list)) == 1 and len(result_list) == 8
+    assert endpoint_counter == {'/v1/profiles': 1, '/v1/bundleIds': 1, '/v1/devices': 1}
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# _*_ coding:UTF-8 _*_
+"""
+__author__ = 'shede333'
+"""
+
+import base64
+import os
+from datetime import datetime, timedelta
+
+from fake_asc import FakeASCData
+from okappleapi.content_cache import ContentCache
+from okappleapi.models import Profile
+
+
+def _profile(name: str, created_day: int = 0) -> Profile:
+    return Profile(FakeASCData.new_profile(name, 'com.example.app',
+                                           created_date=datetime(2026, 1, 1) + timedelta(days=created_day)))
+
+
+def test_put_and_reuse(tmp_path):
+    cache = ContentCache(tmp_path.joinpath('cache'))
+    attributes = _profile('p1').attributes
+    cache_path = cache.profile_path(attributes)
+    assert cache_path.read_bytes() == base64.b64decode(attributes.profile_content)
+
+    os.utime(cache_path, (0, 0))
+    assert cache.profile_path(attributes) == cache_path
+    assert cache_path.stat().st_mtime > 0  # 命中时更新使用时间
+    assert len(list(cache.root_dir.glob('profiles/*'))) == 1
+
+
+def test_save_content_copies_cache_file(tmp_path):
+    cache = ContentCache(tmp_path.joinpath('cache'))
+    attributes = _profile('p1').attributes
+    out_dir = tmp_path.joinpath('out')
+    out_dir.mkdir()
+
+    out_path = attributes.save_content(out_dir, cache=cache)
+    cache_path = cache.profile_path(attributes)
+    assert out_path.read_bytes() == cache_path.read_bytes()
+    assert not os.path.samefile(out_path, cache_path)
+
+    # 修改保存的文件，不影响缓存
+    out_path.write_bytes(b'modified')
+    assert cache_path.read_bytes() == base64.b64decode(attributes.profile_content)
+    # 再次保存时替换已存在的文件，且不残留临时文件
+    assert attributes.save_content(out_path, cache=cache) == out_path
+    assert out_path.read_bytes() == cache_path.read_bytes()
+    assert [tmp.name for tmp in out_dir.iterdir()] == [out_path.name]
+
+
+def test_evict_only_over_limit(tmp_path, monkeypatch):
+    attributes_list = [_profile(f'p{tmp_index}', tmp_index).attributes for tmp_index in range(3)]
+    file_size = len(base64.b64decode(attributes_list[0].profile_content))
+    cache = ContentCache(tmp_path, max_bytes=file_size * 2)
+
+    evict_list = []
+    origin_evict = cache.evict
+    monkeypatch.setattr(cache, 'evict', lambda keep_path=None: (evict_list.append(keep_path),
+                                                                 origin_evict(keep_path)))
+    path_list = []
+    for tmp_index, attributes in enumerate(attributes_list):
+        path_list.append(cache.profile_path(attributes))
+        os.utime(path_list[-1], (tmp_index, tmp_index))
+
+    # 首次写入时扫描一次，第三个文件超过上限时再扫描、淘汰最久未使用的文件
+    assert evict_list == [path_list[0], path_list[2]]
+    assert [tmp.is_file() for tmp in path_list] == [False, True, True]
+    assert cache._total_bytes == file_size * 2
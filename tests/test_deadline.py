@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# _*_ coding:UTF-8 _*_
+"""
+__author__ = 'shede333'
+"""
+
+import time
+
+import pytest
+
+from fake_asc import FakeASCServer
+from okappleapi.apple_api_agent import APIAgent, DeadlineExceededError, MAX_LIMIT
+from okappleapi.deadline import ContextThreadPoolExecutor, deadline, effective_timeout, remaining_time
+from okappleapi.transport import MemoryTransport
+
+DEVICES_URL = f'https://api.example.com/v1/devices?limit={MAX_LIMIT}'
+
+
+def test_nested_deadline():
+    assert remaining_time() is None
+    assert effective_timeout(10) == 10
+    with deadline(5):
+        with deadline(60):
+            # 内层的上限不超过外层剩余的预算
+            assert 4 < remaining_time() <= 5
+            assert effective_timeout(10) <= 5
+            assert effective_timeout(1) == 1
+        with deadline(None):
+            assert 4 < remaining_time() <= 5
+        with ContextThreadPoolExecutor(max_workers=1) as executor:
+            assert 4 < executor.submit(remaining_time).result() <= 5
+    assert remaining_time() is None
+
+
+def test_deadline_exceeded_before_request(token_manager):
+    transport = MemoryTransport()
+    agent = APIAgent(token_manager, base_api='https://api.example.com', transport=transport)
+    with deadline(0):
+        with pytest.raises(DeadlineExceededError):
+            agent.list_devices()
+    assert transport.request_list == []
+
+
+def test_deadline_exceeded_while_waiting_retry(token_manager):
+    fixture = {'method': 'GET', 'url': DEVICES_URL, 'status': 429,
+               'headers': {'Content-Type': 'application/json'},
+               'body': {'errors': [{'status': '429', 'code': 'RATE_LIMIT_EXCEEDED'}]}}
+    transport = MemoryTransport([fixture])
+    agent = APIAgent(token_manager, base_api='https://api.example.com', transport=transport)
+    start_time = time.monotonic()
+    with deadline(0.5):
+        with pytest.raises(DeadlineExceededError) as exc_info:
+            agent.list_devices()
+    # 剩余预算不够等待重试时，不等待、直接失败
+    assert time.monotonic() - start_time < 0.5
+    assert exc_info.value.status_code == 429
+    assert len(transport.request_list) == 1
+
+
+def test_deadline_shortens_request_timeout(token_manager):
+    with FakeASCServer(latency=1) as server:
+        agent = APIAgent(token_manager, timeout=10, base_api=server.base_api)
+        start_time = time.monotonic()
+        with deadline(0.2):
+            with pytest.raises(DeadlineExceededError):
+                agent.list_devices()
+        assert time.monotonic() - start_time < 1
+        agent.close()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# _*_ coding:UTF-8 _*_
+"""
+__author__ = 'shede333'
+"""
+
+import json
+
+from okappleapi.models import DeviceStatus
+
+
+def test_modify_devices_keeps_input_order(manager, fake_data):
+    device_ids = ['D000003', 'UNKNOWN', 'D000001', 'D000002']
+    result_list = manager.modify_devices(device_ids=device_ids, device_status=DeviceStatus.DISABLED,
+                                         device_name=lambda device: f'{device.name}-old',
+                                         max_workers=4)
+    assert [tmp.device_id for tmp in result_list] == device_ids
+    # 未知的设备：device_name方法抛出的异常只影响这一个设备
+    assert result_list[1].error is not None
+    for tmp_result in (result_list[0], result_list[2], result_list[3]):
+        assert tmp_result.error is None
+        assert tmp_result.device.status == DeviceStatus.DISABLED
+        assert tmp_result.device.name.endswith('-old')
+    assert fake_data.devices[3]['attributes']['status'] == DeviceStatus.DISABLED.value
+
+
+def test_modify_devices_resume_from_checkpoint(manager, fake_server, tmp_path):
+    checkpoint_path = tmp_path.joinpath('checkpoint.json')
+    checkpoint_path.write_text(json.dumps({'done': ['D000001', 'D000002']}))
+    device_ids = ['D000001', 'D000002', 'D000003']
+    manager.sync_devices()
+    fake_server.reset_counters()
+
+    progress_list = []
+    result_list = manager.modify_devices(device_ids=device_ids, device_name='renamed',
+                                         checkpoint_path=checkpoint_path,
+                                         progress_func=lambda done, total, _: progress_list.append(
+                                             (done, total)))
+    assert [tmp.is_skipped for tmp in result_list] == [True, True, False]
+    assert result_list[2].device.name == 'renamed'
+    assert fake_server.request_count == 2  # 增量同步、修改D000003
+    assert sorted(progress_list) == [(1, 3), (2, 3), (3, 3)]
+    assert json.loads(checkpoint_path.read_text())['done'] == device_ids
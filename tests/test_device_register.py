@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# _*_ coding:UTF-8 _*_
+"""
+__author__ = 'shede333'
+"""
+
+import copy
+import json
+
+import pytest
+
+from okappleapi.models import (DeviceCreateReqAttrs, DeviceRegisterStatus, DeviceStatus,
+                               load_device_infos, normalize_udid)
+
+NEW_UDID = '00008030-001A2B3C4D5E6F70'
+
+
+@pytest.mark.parametrize('udid, expected', [
+    ('00008030-001a2b3c4d5e6f70', '00008030-001A2B3C4D5E6F70'),
+    (' ' + 'A' * 40 + ' ', 'a' * 40),
+    ('12345678-abcd-abcd-abcd-1234567890ab', '12345678-ABCD-ABCD-ABCD-1234567890AB'),
+])
+def test_normalize_udid(udid, expected):
+    assert normalize_udid(udid) == expected
+
+
+@pytest.mark.parametrize('udid', ['', None, '1234', '00008030-001A2B3C4D5E6F7G', 'a' * 41])
+def test_normalize_udid_invalid(udid):
+    with pytest.raises(ValueError):
+        normalize_udid(udid)
+
+
+def test_load_device_infos_csv(tmp_path):
+    file_path = tmp_path.joinpath('devices.csv')
+    file_path.write_text('Device ID\tDevice Name\tDevice Platform\n'
+                         f'{NEW_UDID}\tiPhone 15\tios\n'
+                         'bad-udid\tbroken\t\n')
+    info_list = load_device_infos(file_path)
+    assert info_list == [DeviceCreateReqAttrs('iPhone 15', NEW_UDID, 'IOS'),
+                         DeviceCreateReqAttrs('broken', 'bad-udid', 'IOS')]
+
+
+def test_load_device_infos_json(tmp_path):
+    file_path = tmp_path.joinpath('devices.json')
+    file_path.write_text(json.dumps([{'name': 'Mac', 'udid': 'x', 'platform': 'mac_os'},
+                                     {'udid': NEW_UDID}]))
+    info_list = load_device_infos(file_path)
+    assert info_list == [DeviceCreateReqAttrs('Mac', 'x', 'MAC_OS'),
+                         DeviceCreateReqAttrs('', NEW_UDID, 'IOS')]
+
+
+def test_register_devices_status(manager, fake_data):
+    enabled_device = next(tmp for tmp in fake_data.devices
+                          if tmp['attributes']['status'] == DeviceStatus.ENABLED.value)
+    disabled_device = next(tmp for tmp in fake_data.devices
+                           if tmp['attributes']['status'] == DeviceStatus.DISABLED.value)
+    info_list = [
+        DeviceCreateReqAttrs('new', NEW_UDID.lower()),
+        DeviceCreateReqAttrs('same', NEW_UDID),
+        DeviceCreateReqAttrs('bad', '1234'),
+        DeviceCreateReqAttrs('exists', enabled_device['attributes']['udid']),
+        DeviceCreateReqAttrs('disabled', disabled_device['attributes']['udid']),
+    ]
+    result_list = manager.register_devices(info_list)
+    assert [tmp.status for tmp in result_list] == [
+        DeviceRegisterStatus.CREATED, DeviceRegisterStatus.DUPLICATE, DeviceRegisterStatus.INVALID,
+        DeviceRegisterStatus.EXISTS, DeviceRegisterStatus.EXISTS]
+    assert result_list[0].udid == NEW_UDID
+    assert result_list[3].device.id == enabled_device['id']
+    # 新注册的设备加入缓存，再次注册时直接返回EXISTS，不再请求
+    assert manager.register_devices(info_list[:1])[0].status == DeviceRegisterStatus.EXISTS
+
+
+def test_register_devices_conflict_is_exists(manager, fake_data, fake_server):
+    manager.sync_devices()
+    # 上次同步后在其他地方注册的设备：增量同步看不到（list_device_ids返回旧的id），注册时返回409
+    known_ids = [tmp['id'] for tmp in fake_data.devices]
+    other_device = copy.deepcopy(fake_data.devices[1])
+    other_device['id'] = 'DOTHER'
+    other_device['attributes']['udid'] = NEW_UDID
+    fake_data.devices.append(other_device)
+    manager.agent.list_device_ids = lambda **kwargs: known_ids
+
+    fake_server.reset_counters()
+    result = manager.register_devices([DeviceCreateReqAttrs('other', NEW_UDID)])[0]
+    assert result.status == DeviceRegisterStatus.EXISTS
+    assert result.device.id == 'DOTHER'
+    assert fake_server.request_count == 2  # 注册（409不重试）、按udid查询
+    assert manager.udid_index(is_sync=False)[NEW_UDID].id == 'DOTHER'
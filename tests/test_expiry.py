@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# _*_ coding:UTF-8 _*_
+"""
+__author__ = 'shede333'
+"""
+
+from datetime import datetime, timedelta
+
+from fake_asc import FakeASCData
+from okappleapi.expiry import ExpiryIndex, ExpiryScheduler
+from okappleapi.models import Profile
+
+START_DATE = datetime(2026, 1, 1)
+DAY_SECOND = timedelta(days=1).total_seconds()
+
+
+def _profile(name: str, created_day: int) -> Profile:
+    """过期时间为START_DATE + created_day + 365天"""
+    return Profile(FakeASCData.new_profile(name, 'com.example.app',
+                                           created_date=START_DATE + timedelta(days=created_day)))
+
+
+def _expire_timestamp(created_day: int) -> float:
+    return (START_DATE + timedelta(days=created_day + 365)).timestamp()
+
+
+def test_expiring_within():
+    index = ExpiryIndex([_profile(f'p{tmp_day}', tmp_day) for tmp_day in (30, 0, 20, 10)])
+    now = _expire_timestamp(0) - DAY_SECOND
+    assert [tmp.name for _, tmp in index.expiring_within(15, now=now)] == ['p0', 'p10']
+    assert [tmp.name for _, tmp in index.expiring_within(0, now=now)] == []
+    assert len(index) == 4  # 查询不修改索引
+
+
+def test_pop_before_with_lazy_delete():
+    p0, p10, p20 = _profile('p0', 0), _profile('p10', 10), _profile('p20', 20)
+    index = ExpiryIndex([p0, p10, p20])
+    index.remove(p0)
+    # 同一个profile再次add时，旧的entry被延迟删除，只保留新的过期时间
+    index.add(p10, timestamp=_expire_timestamp(40))
+    assert len(index) == 2
+    assert index.peek() == (_expire_timestamp(20), p20)
+
+    assert index.pop_before(_expire_timestamp(30)) == [(_expire_timestamp(20), p20)]
+    assert [tmp for _, tmp in index.expiring_within(365, now=_expire_timestamp(30))] == [p10]
+    assert index.pop_before(_expire_timestamp(40)) == [(_expire_timestamp(40), p10)]
+    assert len(index) == 0 and index.peek() is None
+
+
+def test_scheduler_retries_failed_profile(manager, fake_data):
+    retry_interval = timedelta(hours=1)
+    scheduler = ExpiryScheduler(manager, retry_interval=retry_interval)
+    profile_name_list = [tmp['attributes']['name'] for tmp in fake_data.profiles]
+    call_list = []
+
+    def _update_profile(name, **kwargs):
+        call_list.append(name)
+        if name == profile_name_list[0]:
+            raise RuntimeError('create profile failed')
+        return _profile(f'{name}-new', 3000)  # 更新后的profile在2034年过期
+
+    manager.update_profile = _update_profile
+    now = datetime(2030, 1, 1).timestamp()  # 所有profile都已到期
+    result_list = scheduler.run_pending(now=now)
+    # 一个失败不影响其他profile
+    assert sorted(call_list) == sorted(profile_name_list)
+    assert len(result_list) == len(profile_name_list) - 1
+
+    call_list.clear()
+    assert scheduler.run_pending(now=now) == []
+    assert call_list == []  # 重试时间未到
+    assert len(scheduler.run_pending(now=now + retry_interval.total_seconds())) == 0
+    assert call_list == [profile_name_list[0]]
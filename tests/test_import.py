@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+# _*_ coding:UTF-8 _*_
+"""
+__author__ = 'shede333'
+"""
+
+import subprocess
+import sys
+
+import pytest
+
+from bench_import import DEFAULT_FORBID, ROOT_PATH, new_modules, parse_importtime
+
+# 宽松的耗时上限，只用于发现数量级的回退，精确的对比见benchmarks/bench_import.py
+IMPORT_BUDGET_MS = 1000
+
+
+@pytest.mark.parametrize('module', ['okappleapi', 'okappleapi.ok_agent', 'okappleapi.cli',
+                                    'okappleapi.screenshot_sync', 'okappleapi.crawler'])
+def test_import_is_lazy(module):
+    module_list = new_modules(module)
+    assert module in module_list
+    assert [tmp for tmp in module_list if tmp.split('.')[0] in DEFAULT_FORBID] == []
+
+
+def test_import_time():
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import okappleapi.ok_agent'],
+                            cwd=ROOT_PATH, capture_output=True, text=True, check=True)
+    total_ms, module_list = parse_importtime(result.stderr, 'okappleapi')
+    assert 'okappleapi.ok_agent' in [tmp[0] for tmp in module_list]
+    assert 0 < total_ms < IMPORT_BUDGET_MS
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# _*_ coding:UTF-8 _*_
+"""
+__author__ = 'shede333'
+"""
+
+import base64
+import stat
+from datetime import datetime, timedelta
+
+from fake_asc import FakeASCData
+from okappleapi.content_cache import ContentCache
+from okappleapi.models import Profile
+from okappleapi.ok_agent import OKProfileManager
+
+
+def _profile(name: str, created_day: int = 0) -> Profile:
+    return Profile(FakeASCData.new_profile(name, 'com.example.app',
+                                           created_date=datetime(2026, 1, 1) + timedelta(days=created_day)))
+
+
+def _install_file(target_dir, profile: Profile):
+    file_path = target_dir.joinpath(f'{profile.attributes.uuid}.mobileprovision')
+    file_path.write_bytes(base64.b64decode(profile.attributes.profile_content))
+    return file_path
+
+
+def test_install_profiles(tmp_path):
+    old_a, new_a, new_b = _profile('a', 0), _profile('a', 10), _profile('b', 0)
+    newest_b = _profile('b', 20)
+    old_a_path = _install_file(tmp_path, old_a)
+    exist_b_path = _install_file(tmp_path, new_b)
+    tmp_path.joinpath('broken.mobileprovision').write_bytes(b'not a profile')
+
+    # 同名的profile仅安装最新的：b安装newest_b，a安装new_a
+    result_list = OKProfileManager.install_profiles([new_a, old_a, newest_b, new_b], tmp_path)
+    result_dict = {tmp.name: tmp for tmp in result_list}
+    assert len(result_list) == 2
+
+    a_result = result_dict['a']
+    assert (a_result.uuid, a_result.is_skipped) == (new_a.attributes.uuid, False)
+    assert a_result.path.read_bytes() == base64.b64decode(new_a.attributes.profile_content)
+    assert stat.S_IMODE(a_result.path.stat().st_mode) == 0o644
+    assert a_result.removed_paths == (old_a_path,)
+    assert not old_a_path.exists()
+    assert result_dict['b'].removed_paths == (exist_b_path,)
+    # 无法解析的文件不处理，且不残留临时文件
+    assert sorted(tmp.name for tmp in tmp_path.iterdir()) == sorted([
+        'broken.mobileprovision', a_result.path.name, result_dict['b'].path.name])
+
+
+def test_install_profiles_skip_exist_uuid(tmp_path):
+    profile_a, profile_b = _profile('a'), _profile('b')
+    target_dir = tmp_path.joinpath('profiles')
+    target_dir.mkdir()
+    exist_path = _install_file(target_dir, profile_a)
+    mtime = exist_path.stat().st_mtime_ns
+
+    cache = ContentCache(tmp_path.joinpath('cache'))
+    result_list = OKProfileManager.install_profiles([profile_a, profile_b], target_dir,
+                                                    is_remove_same_name=False, cache=cache)
+    assert [(tmp.name, tmp.is_skipped) for tmp in result_list] == [('a', True), ('b', False)]
+    assert result_list[0].path == exist_path
+    assert exist_path.stat().st_mtime_ns == mtime
+    assert result_list[1].path.read_bytes() == cache.profile_path(profile_b.attributes).read_bytes()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+# _*_ coding:UTF-8 _*_
+"""
+__author__ = 'shede333'
+"""
+
+import io
+import logging
+
+from okappleapi.log import LOGGER_NAME, setup_logging, verbose_level
+
+
+def test_verbose_level_does_not_configure_logging():
+    logger = logging.getLogger(LOGGER_NAME)
+    handler_list, level = list(logger.handlers), logger.level
+    assert verbose_level(True) == logging.INFO
+    assert verbose_level(False) == logging.DEBUG
+    assert (logger.handlers, logger.level) == (handler_list, level)
+
+
+def test_setup_logging():
+    logger = logging.getLogger(LOGGER_NAME)
+    stream = io.StringIO()
+    handler = setup_logging(logging.INFO, stream=stream)
+    try:
+        logging.getLogger(f'{LOGGER_NAME}.test').log(verbose_level(True), 'hello %s', 'world')
+        logging.getLogger(f'{LOGGER_NAME}.test').log(verbose_level(False), 'hidden')
+        logging.getLogger(f'{LOGGER_NAME}.test').info('request', extra={'endpoint': '/v1/devices'})
+    finally:
+        logger.removeHandler(handler)
+        logger.setLevel(logging.NOTSET)
+    line_list = stream.getvalue().splitlines()
+    assert len(line_list) == 2
+    assert 'hello world [account=- endpoint=- duration_ms=- retry=-]' in line_list[0]
+    assert 'endpoint=/v1/devices ' in line_list[1]
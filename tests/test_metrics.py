@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# _*_ coding:UTF-8 _*_
+"""
+__author__ = 'shede333'
+"""
+
+import pytest
+
+from okappleapi.metrics import LatencyKey, MetricsCollector, RequestEvent, endpoint_template, \
+    parse_rate_limit
+
+
+class _FakeResponse:
+    def __init__(self, status_code, content=b'', headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+
+def _event(url: str, elapsed: float, response=None, error=None, attempt=0) -> RequestEvent:
+    event = RequestEvent('GET', url, attempt=attempt)
+    event.finish(response=response, error=error)
+    event.elapsed = elapsed
+    return event
+
+
+@pytest.mark.parametrize('url, endpoint', [
+    ('https://api.appstoreconnect.apple.com/v1/apps/123/appInfos?limit=200', '/v1/apps/{id}/appInfos'),
+    ('https://api.appstoreconnect.apple.com/v1/devices', '/v1/devices'),
+    ('https://upload.example.com/abc/def?x=1', 'upload:upload.example.com'),
+])
+def test_endpoint_template(url, endpoint):
+    assert endpoint_template(url) == endpoint
+
+
+def test_parse_rate_limit():
+    assert parse_rate_limit({'X-Rate-Limit': 'user-hour-lim:3600;user-hour-rem:3599;'}) == (3600, 3599)
+    assert parse_rate_limit({'x-rate-limit': 'user-hour-lim:3600;'}) is None
+    assert parse_rate_limit({}) is None
+
+
+def test_to_prometheus():
+    collector = MetricsCollector()
+    url = 'https://api.example.com/v1/apps/1/appInfos'
+    collector.after_request(_event(url, 0.02, _FakeResponse(200, b'x' * 10, {
+        'X-Rate-Limit': 'user-hour-lim:3600;user-hour-rem:3500;'})))
+    collector.after_request(_event(url, 3, error=OSError('reset'), attempt=1))
+
+    snapshot = collector.snapshot()
+    latency = snapshot['latency'][LatencyKey('/v1/apps/{id}/appInfos', 'GET')]
+    assert (latency['count'], latency['sum']) == (2, 3.02)
+    assert latency['buckets'][0.025] == 1 and latency['buckets'][5] == 1
+
+    text = collector.to_prometheus()
+    labels = 'endpoint="/v1/apps/{id}/appInfos",method="GET"'
+    for line in (
+            '# TYPE okappleapi_request_duration_seconds histogram',
+            f'okappleapi_request_duration_seconds_bucket{{{labels},le="0.01"}} 0',
+            f'okappleapi_request_duration_seconds_bucket{{{labels},le="0.025"}} 1',
+            f'okappleapi_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2',
+            f'okappleapi_request_duration_seconds_count{{{labels}}} 2',
+            '# TYPE okappleapi_requests_total counter',
+            f'okappleapi_requests_total{{{labels},status="200"}} 1',
+            f'okappleapi_requests_total{{{labels},status="error"}} 1',
+            f'okappleapi_response_bytes_total{{{labels}}} 10',
+            f'okappleapi_retries_total{{{labels}}} 1',
+            '# TYPE okappleapi_rate_limit_remaining gauge',
+            'okappleapi_rate_limit_remaining 3500'):
+        assert line in text.splitlines()
+    assert text.count('# TYPE okappleapi_requests_total counter') == 1
+
+
+def test_label_escape():
+    collector = MetricsCollector(namespace='test')
+    collector.inc('custom_total', 2, label='a"b\\c')
+    assert 'test_custom_total{label="a\\"b\\\\c"} 2' in collector.to_prometheus().splitlines()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# _*_ coding:UTF-8 _*_
+"""
+__author__ = 'shede333'
+"""
+
+import json
+import threading
+import time
+
+import pytest
+
+from okappleapi.apple_api_agent import APIAgent, DeadlineExceededError, RateLimiter
+from okappleapi.deadline import ContextThreadPoolExecutor, deadline
+from okappleapi.priority import Priority, PriorityDispatcher, current_priority, low_priority, priority
+from okappleapi.transport import MemoryTransport, TransportResponse
+
+BASE_API = 'https://api.example.com'
+
+
+def test_low_priority_reserve():
+    dispatcher = PriorityDispatcher(max_concurrency=3, reserved_concurrency=1)
+    assert dispatcher.acquire(Priority.low, timeout=0)
+    assert dispatcher.acquire(Priority.low, timeout=0)
+    # 预留的1个并发数只供高优先级使用
+    assert not dispatcher.acquire(Priority.low, timeout=0.01)
+    assert dispatcher.acquire(Priority.high, timeout=0)
+    assert not dispatcher.acquire(Priority.high, timeout=0.01)
+    assert dispatcher.snapshot() == {'active': {'high': 1, 'low': 2}, 'waiting': {'high': 0, 'low': 0}}
+
+    dispatcher.release(Priority.high)
+    assert not dispatcher.acquire(Priority.low, timeout=0.01)
+    dispatcher.release(Priority.low)
+    assert dispatcher.acquire(Priority.low, timeout=0)
+
+
+def test_high_priority_wakes_first():
+    dispatcher = PriorityDispatcher(max_concurrency=2, reserved_concurrency=0)
+    assert dispatcher.acquire(Priority.low) and dispatcher.acquire(Priority.low)
+    order_list = []
+
+    def run(priority_value):
+        dispatcher.acquire(priority_value)
+        order_list.append(priority_value)
+
+    low_thread = threading.Thread(target=run, args=(Priority.low,))
+    low_thread.start()
+    high_thread = threading.Thread(target=run, args=(Priority.high,))
+    high_thread.start()
+    while dispatcher.snapshot()['waiting'] != {'high': 1, 'low': 1}:
+        time.sleep(0.001)
+    dispatcher.release(Priority.low)
+    high_thread.join(timeout=5)
+    # 有高优先级的请求在等待时，低优先级的请求不会获得空出的并发数
+    assert order_list == [Priority.high]
+    dispatcher.release(Priority.high)
+    low_thread.join(timeout=5)
+    assert order_list == [Priority.high, Priority.low]
+
+
+def test_rate_reserve():
+    dispatcher = PriorityDispatcher(reserved_rate_share=0.25)
+    assert dispatcher.rate_reserve(Priority.high, 100) == 0
+    assert dispatcher.rate_reserve(Priority.low, 100) == 25
+    assert dispatcher.rate_reserve(Priority.low, 1) == 0
+    with pytest.raises(ValueError):
+        PriorityDispatcher(max_concurrency=2, reserved_concurrency=2)
+
+
+def test_priority_context():
+    assert current_priority() == Priority.high
+
+    @low_priority
+    def batch_task():
+        with ContextThreadPoolExecutor(max_workers=1) as executor:
+            return current_priority(), executor.submit(current_priority).result()
+
+    assert batch_task() == (Priority.low, Priority.low)
+    with priority(Priority.low):
+        with priority(Priority.high):
+            assert current_priority() == Priority.high
+        assert current_priority() == Priority.low
+    assert current_priority() == Priority.high
+
+
+def _snapshot_transport(dispatcher: PriorityDispatcher) -> MemoryTransport:
+    """响应体为请求时dispatcher中进行中的请求数"""
+
+    def fallback(method, url, headers, data):
+        body = {'data': [], 'links': {}, 'meta': dispatcher.snapshot()['active']}
+        return TransportResponse(200, {'Content-Type': 'application/json'}, json.dumps(body).encode(),
+                                 url=url)
+
+    return MemoryTransport(fallback=fallback)
+
+
+def test_agent_with_dispatcher(token_manager):
+    dispatcher = PriorityDispatcher(max_concurrency=4, reserved_concurrency=1,
+                                    reserved_rate_share=0.5)
+    agent = APIAgent(token_manager, base_api=BASE_API, transport=_snapshot_transport(dispatcher),
+                     rate_limiter=RateLimiter(rate_per_hour=1, burst=4), dispatcher=dispatcher)
+    with priority(Priority.low):
+        assert agent._api_call(f'{BASE_API}/v1/devices')['meta'] == {'high': 0, 'low': 1}
+        # 低优先级需要为高优先级保留2个令牌：第2次请求后剩余2个，第3次请求等待到超过deadline
+        agent._api_call(f'{BASE_API}/v1/devices')
+        with deadline(0.05):
+            with pytest.raises(DeadlineExceededError):
+                agent._api_call(f'{BASE_API}/v1/devices')
+    assert agent._api_call(f'{BASE_API}/v1/devices')['meta'] == {'high': 1, 'low': 0}
+    assert dispatcher.snapshot()['active'] == {'high': 0, 'low': 0}
+
+
+def test_agent_without_dispatcher(token_manager):
+    agent = APIAgent(token_manager, base_api=BASE_API,
+                     transport=_snapshot_transport(PriorityDispatcher()),
+                     rate_limiter=RateLimiter(rate_per_hour=1, burst=2))
+    assert agent.dispatcher is None
+    with priority(Priority.low):
+        # 不为高优先级预留限流令牌
+        agent._api_call(f'{BASE_API}/v1/devices')
+        agent._api_call(f'{BASE_API}/v1/devices')
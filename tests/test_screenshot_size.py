@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# _*_ coding:UTF-8 _*_
+"""
+__author__ = 'shede333'
+"""
+
+import struct
+import zlib
+
+import pytest
+
+from okappleapi.models import ScreenshotDisplayType
+from okappleapi.screenshot_size import ScreenshotSizeError, read_image_size, validate_screenshots
+
+
+def _png_bytes(width: int, height: int) -> bytes:
+    ihdr = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    chunk = struct.pack('>I', len(ihdr)) + b'IHDR' + ihdr + struct.pack('>I', zlib.crc32(b'IHDR' + ihdr))
+    return b'\x89PNG\r\n\x1a\n' + chunk
+
+
+def _jpeg_bytes(width: int, height: int, sof_marker: int = 0xC0) -> bytes:
+    app0 = b'JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00'
+    dht = bytes(20)  # DHT(C4)不包含尺寸，需要跳过
+    sof = struct.pack('>BHHB', 8, height, width, 3) + bytes(9)
+    return (b'\xff\xd8'
+            + b'\xff\xe0' + struct.pack('>H', len(app0) + 2) + app0
+            + b'\xff\xff'  # 填充字节
+            + b'\xff\xc4' + struct.pack('>H', len(dht) + 2) + dht
+            + bytes([0xFF, sof_marker]) + struct.pack('>H', len(sof) + 2) + sof
+            + b'\xff\xd9')
+
+
+@pytest.mark.parametrize('file_name, content, size', [
+    ('a.png', _png_bytes(1290, 2796), (1290, 2796)),
+    ('b.jpg', _jpeg_bytes(2796, 1290), (2796, 1290)),
+    ('c.jpeg', _jpeg_bytes(640, 960, sof_marker=0xC2), (640, 960)),
+])
+def test_read_image_size(tmp_path, file_name, content, size):
+    file_path = tmp_path.joinpath(file_name)
+    file_path.write_bytes(content)
+    assert read_image_size(file_path) == size
+
+
+@pytest.mark.parametrize('content', [
+    b'GIF89a' + bytes(32),
+    b'\xff\xd8\x00\x00',
+    b'\x89PNG\r\n\x1a\n' + bytes(16),
+])
+def test_read_image_size_invalid(tmp_path, content):
+    file_path = tmp_path.joinpath('bad.png')
+    file_path.write_bytes(content)
+    with pytest.raises(ValueError):
+        read_image_size(file_path)
+
+
+def test_validate_screenshots(tmp_path):
+    good_path, bad_path = tmp_path.joinpath('01.png'), tmp_path.joinpath('02.jpg')
+    good_path.write_bytes(_png_bytes(2796, 1290))  # 横屏
+    bad_path.write_bytes(_jpeg_bytes(1242, 2208))
+    local_dict = {'en-US': {ScreenshotDisplayType.APP_IPHONE_67: [good_path, bad_path]}}
+
+    error_list = validate_screenshots(local_dict, is_raise=False)
+    assert error_list == [f'{bad_path}: 1242x2208 is not valid for APP_IPHONE_67']
+    with pytest.raises(ScreenshotSizeError) as exc_info:
+        validate_screenshots(local_dict)
+    assert exc_info.value.error_list == error_list
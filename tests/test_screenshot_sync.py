@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# _*_ coding:UTF-8 _*_
+"""
+__author__ = 'shede333'
+"""
+
+import pytest
+
+from okappleapi.models import AppScreenshot, AppScreenshotState, ScreenshotDisplayType
+from okappleapi.screenshot_sync import AssetDeliveryWaiter, scan_screenshot_dir
+
+
+def test_scan_screenshot_dir(tmp_path):
+    for tmp_name in ('en-US/APP_IPHONE_67/02.png', 'en-US/APP_IPHONE_67/01.JPG',
+                     'en-US/APP_IPHONE_67/notes.txt', 'en-US/.hidden/01.png',
+                     'zh-Hans/APP_IPAD_PRO_129/01.jpeg', '.DS_Store/APP_IPHONE_67/01.png'):
+        file_path = tmp_path.joinpath(tmp_name)
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_bytes(b'')
+    tmp_path.joinpath('readme.txt').write_text('')
+
+    result = scan_screenshot_dir(tmp_path)
+    assert {locale: {display_type: [tmp.name for tmp in file_list]
+                     for display_type, file_list in type_dict.items()}
+            for locale, type_dict in result.items()} == {
+        'en-US': {ScreenshotDisplayType.APP_IPHONE_67: ['01.JPG', '02.png']},
+        'zh-Hans': {ScreenshotDisplayType.APP_IPAD_PRO_129: ['01.jpeg']},
+    }
+
+
+def test_scan_screenshot_dir_unknown_type(tmp_path):
+    type_dir = tmp_path.joinpath('en-US', 'IPHONE_67')
+    type_dir.mkdir(parents=True)
+    with pytest.raises(ValueError) as exc_info:
+        scan_screenshot_dir(tmp_path)
+    assert 'IPHONE_67' in str(exc_info.value)
+    assert str(type_dir) in str(exc_info.value)
+
+
+class _FakeScreenshotAgent:
+    """按轮次返回截图状态：state_rounds为每轮的 {截图id: state}"""
+
+    def __init__(self, state_rounds):
+        self.state_rounds = state_rounds
+        self.call_list = []
+
+    def list_app_screenshot(self, set_id):
+        self.call_list.append(set_id)
+        round_index = min(len([tmp for tmp in self.call_list if tmp == set_id]),
+                          len(self.state_rounds)) - 1
+        return [AppScreenshot({'id': screenshot_id, 'type': 'appScreenshots',
+                               'attributes': {'assetDeliveryState': {'state': state}}})
+                for screenshot_id, state in self.state_rounds[round_index].items()]
+
+
+def test_asset_delivery_waiter():
+    agent = _FakeScreenshotAgent([
+        {'s1': 'UPLOAD_COMPLETE', 's2': 'FAILED'},
+        {'s1': 'UPLOAD_COMPLETE'},
+        {'s1': 'COMPLETE'},
+    ])
+    waiter = AssetDeliveryWaiter(agent, min_interval=0.01, max_interval=0.02)
+    result = waiter.wait([('set1', 's1'), ('set1', 's2')])
+    assert {tmp_id: tmp.updateState for tmp_id, tmp in result.items()} == {
+        's1': AppScreenshotState.COMPLETE, 's2': AppScreenshotState.FAILED}
+    # 每轮对每个截图集只请求一次
+    assert agent.call_list == ['set1'] * 3
+
+    missing_future = waiter.add('set1', 'missing')
+    with pytest.raises(KeyError):
+        missing_future.result(timeout=5)
+
+
+def test_asset_delivery_waiter_timeout():
+    agent = _FakeScreenshotAgent([{'s1': 'UPLOAD_COMPLETE'}])
+    waiter = AssetDeliveryWaiter(agent, min_interval=0.01, max_interval=0.02, timeout=0.05)
+    with pytest.raises(TimeoutError, match='wait screenshot timeout'):
+        waiter.add('set1', 's1').result(timeout=5)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# _*_ coding:UTF-8 _*_
+"""
+__author__ = 'shede333'
+"""
+
+import json
+
+import pytest
+
+from fake_asc import FakeASCData
+from okappleapi.apple_api_agent import APIAgent, APIError, MAX_LIMIT
+from okappleapi.transport import (MemoryTransport, ReplayMismatchError, ReplayTransport,
+                                  TransportError, load_fixtures)
+
+DEVICES_URL = f'https://api.example.com/v1/devices?limit={MAX_LIMIT}'
+
+
+def _devices_fixture(device_list, status=200):
+    return {'method': 'GET', 'url': DEVICES_URL, 'status': status,
+            'headers': {'Content-Type': 'application/json'},
+            'body': {'data': device_list, 'links': {}}}
+
+
+def test_memory_transport_fixture_order(tmp_path):
+    fixture_list = [
+        {'method': 'GET', 'url': 'https://a.example.com/v1/items?b=2&a=1', 'body': {'index': 1}},
+        {'method': 'GET', 'url': 'https://a.example.com/v1/items?b=2&a=1', 'body': {'index': 2}},
+    ]
+    file_path = tmp_path.joinpath('fixtures.jsonl')
+    file_path.write_text('\n'.join(json.dumps(tmp) for tmp in fixture_list) + '\n\n')
+    assert load_fixtures(file_path) == fixture_list
+
+    transport = MemoryTransport.from_file(file_path)
+    # 忽略host与query的顺序；按顺序返回，最后一个被重复使用
+    url = 'https://b.example.com/v1/items?a=1&b=2'
+    assert [transport.send('GET', url).json()['index'] for _ in range(3)] == [1, 2, 2]
+    assert transport.send('POST', url).status_code == 404
+    assert transport.request_list[-1] == ('POST', url, 0)
+
+
+def test_agent_with_memory_transport(token_manager):
+    device_list = FakeASCData(device_num=3).devices
+    transport = MemoryTransport([_devices_fixture(device_list)])
+    agent = APIAgent(token_manager, base_api='https://api.example.com', transport=transport)
+    assert [tmp.id for tmp in agent.list_devices()] == [tmp['id'] for tmp in device_list]
+    assert [tmp[:2] for tmp in transport.request_list] == [('GET', DEVICES_URL)]
+
+
+def test_agent_error_without_json(token_manager):
+    fixture = dict(_devices_fixture([], status=502), headers={'Content-Type': 'text/html'})
+    fixture.pop('body')
+    agent = APIAgent(token_manager, base_api='https://api.example.com',
+                     transport=MemoryTransport([fixture]))
+    with pytest.raises(APIError) as exc_info:
+        agent.list_devices()
+    assert exc_info.value.status_code == 502
+
+
+def test_agent_wraps_transport_error(token_manager):
+    def fallback(method, url, headers, data):
+        raise TransportError('connection refused')
+
+    agent = APIAgent(token_manager, base_api='https://api.example.com',
+                     transport=MemoryTransport(fallback=fallback))
+    with pytest.raises(APIError) as exc_info:
+        agent.list_devices()
+    assert exc_info.value.status_code is None
+    assert isinstance(exc_info.value.__cause__, TransportError)
+
+
+def test_record_and_replay(token_manager, fake_server, tmp_path):
+    record_path = tmp_path.joinpath('session.jsonl')
+    agent = APIAgent(token_manager, base_api=fake_server.base_api, record_path=record_path)
+    device_ids = [tmp.id for tmp in agent.list_devices()]
+    agent.list_certificates()
+    agent.close()
+    fixture_list = load_fixtures(record_path)
+    assert {tmp['request_headers']['Authorization'] for tmp in fixture_list} == {'REDACTED'}
+
+    replay = ReplayTransport(fixture_list)
+    replay_agent = APIAgent(token_manager, base_api='https://api.example.com', transport=replay)
+    assert [tmp.id for tmp in replay_agent.list_devices()] == device_ids
+    replay.assert_no_extra_requests()
+    with pytest.raises(ReplayMismatchError):
+        replay.assert_all_used()  # list_certificates没有回放
+    replay_agent.list_certificates()
+    replay.assert_all_used()
+
+    # 每条记录只使用一次，再次请求时为多出的请求
+    assert replay.send('GET', DEVICES_URL).status_code == 404
+    assert replay.extra_request_list == [('GET', DEVICES_URL)]
+    with pytest.raises(ReplayMismatchError, match='1 extra requests'):
+        replay.assert_no_extra_requests()
+
+
+def test_replay_strict():
+    replay = ReplayTransport([_devices_fixture([])], is_strict=True)
+    assert replay.send('GET', DEVICES_URL).status_code == 200
+    with pytest.raises(ReplayMismatchError):
+        replay.send('GET', DEVICES_URL)
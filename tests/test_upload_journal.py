@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# _*_ coding:UTF-8 _*_
+"""
+__author__ = 'shede333'
+"""
+
+import json
+
+from okappleapi.upload_journal import UploadJournal
+
+OPERATIONS = [{'offset': 0, 'length': 10}, {'offset': 10, 'length': 10}]
+
+
+def _line_count(journal: UploadJournal) -> int:
+    return len(journal.file_path.read_text().splitlines())
+
+
+def test_append_and_reload(tmp_path):
+    journal = UploadJournal(tmp_path.joinpath('journal.jsonl'))
+    journal.reserve('a1', 'set1', '01.png', 'md5-a1', OPERATIONS)
+    journal.reserve('a2', 'set2', '02.png', 'md5-a2', OPERATIONS)
+    journal.mark_chunk_done('a1', 10)
+    journal.mark_chunk_done('a1', 10)  # 重复的分片不再追加
+    assert _line_count(journal) == 3
+
+    # 模拟中断时写入一半的最后一行
+    with open(journal.file_path, mode='a') as file:
+        file.write('{"op": "chunk", "id": "a1", "off')
+    reload_journal = UploadJournal(journal.file_path)
+    assert reload_journal.get('a1') == {'parent_id': 'set1', 'file_name': '01.png',
+                                        'checksum': 'md5-a1', 'upload_operations': OPERATIONS,
+                                        'done_offsets': [10]}
+    assert reload_journal.checksum_dict('set2') == {'a2': 'md5-a2'}
+    reload_journal.mark_chunk_done('a1', 0)
+    assert UploadJournal(journal.file_path).get('a1')['done_offsets'] == [10, 0]
+
+
+def test_compact_on_remove(tmp_path):
+    journal = UploadJournal(tmp_path.joinpath('journal.jsonl'))
+    journal.reserve('a1', 'set1', '01.png', 'md5-a1', OPERATIONS)
+    journal.reserve('a2', 'set1', '02.png', 'md5-a2', OPERATIONS)
+    journal.mark_chunk_done('a2', 0)
+    journal.mark_chunk_done('a1', 0)
+
+    journal.remove('a1')
+    line_list = [json.loads(tmp) for tmp in journal.file_path.read_text().splitlines()]
+    assert [(tmp['op'], tmp['id']) for tmp in line_list] == [('reserve', 'a2')]
+    assert UploadJournal(journal.file_path).get('a2')['done_offsets'] == [0]
+
+    journal.remove('a2')
+    assert not journal.file_path.exists()
+    assert UploadJournal(journal.file_path).get('a2') is None